@@ -1,18 +1,111 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory
 import json
+import logging
 import os
+import threading
+import time
+
+from query_cache import QueryCache
+from search_index import FILTER_KEYS, SearchIndex
 
 app = Flask(__name__)
 DB_FILE = "library.json"
+INDEX_FILE = "library.idx"
+DEFAULT_LIMIT = 60
+MAX_LIMIT = 1000
+DEFAULT_SUGGESTIONS = 8
+STREAM_CHUNK = 100  # Items per chunk; larger responses are streamed instead of built in memory
+NDJSON_MIMETYPE = "application/x-ndjson"
+RELOAD_INTERVAL = 5  # Seconds between checks of DB_FILE/INDEX_FILE for changes
 library_data = []
+search_index = SearchIndex.build([])
+query_cache = QueryCache()
+
+# Signature of the files the current search_index was loaded from
+loaded_signature = None
+_load_lock = threading.Lock()
+_watcher_pid = None
+
+def file_signature(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    except OSError:
+        return None
+
+def db_signature():
+    signature = (file_signature(DB_FILE), file_signature(INDEX_FILE))
+    return signature if any(signature) else None
 
 def load_db():
-    global library_data
-    if os.path.exists(DB_FILE):
-        with open(DB_FILE, 'r') as f:
-            library_data = json.load(f)
-    else:
-        print(f"Warning: {DB_FILE} not found. Run library_indexer.py first.")
+    """Loads the search index and swaps it in.
+
+    The binary INDEX_FILE is memory-mapped when it is at least as new as DB_FILE;
+    otherwise (e.g. after an auxiliary script edited the JSON) the index is built
+    from DB_FILE. The index is replaced with a single assignment, so requests that
+    already took a reference to the previous index finish against that snapshot.
+    """
+    global library_data, search_index, loaded_signature
+    with _load_lock:
+        signature = db_signature()
+        if signature is None:
+            print(f"Warning: {DB_FILE} not found. Run library_indexer.py first.")
+            return False
+        db_stat, index_stat = signature
+        new_index = None
+        if index_stat and (db_stat is None or index_stat[0] >= db_stat[0]):
+            try:
+                new_index = SearchIndex.load(INDEX_FILE)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Cannot use {INDEX_FILE} ({e}), building from {DB_FILE}")
+        if new_index is None:
+            with open(DB_FILE, 'r') as f:
+                new_index = SearchIndex.build(json.load(f))
+        new_index.version = signature  # a new version also invalidates query_cache
+        library_data, search_index = new_index.documents, new_index
+        loaded_signature = signature
+        return True
+
+def watch_db():
+    """Polls the database files and reloads the index in the background when they change."""
+    pending = None
+    while True:
+        time.sleep(RELOAD_INTERVAL)
+        signature = db_signature()
+        if signature is None or signature == loaded_signature:
+            pending = None
+            continue
+        # Wait for one quiet interval, so the JSON and the binary index written
+        # right after it by the indexer are picked up together
+        if signature != pending:
+            pending = signature
+            continue
+        logging.info(f"{DB_FILE} changed, reloading search index")
+        try:
+            started = time.time()
+            load_db()
+            logging.info(f"Search index reloaded ({len(search_index)} items, {time.time() - started:.1f}s)")
+        except Exception as e:
+            # Possibly a half-written file; keep serving the old index and retry
+            logging.error(f"Failed to reload {DB_FILE}: {e}")
+
+@app.before_request
+def ensure_watcher():
+    # One watcher per process: WSGI servers fork workers after import, and threads
+    # do not survive a fork, so each worker starts (and if needed loads) its own.
+    global _watcher_pid
+    if _watcher_pid == os.getpid():
+        return
+    with _load_lock:
+        if _watcher_pid == os.getpid():
+            return
+        _watcher_pid = os.getpid()
+    if loaded_signature is None:
+        try:
+            load_db()
+        except Exception as e:
+            logging.error(f"Failed to load {DB_FILE}: {e}")
+    threading.Thread(target=watch_db, daemon=True).start()
 
 @app.route('/')
 def index():
@@ -23,79 +116,89 @@ def favicon():
     return send_from_directory(os.path.join(app.root_path),
                                'favicon.ico', mimetype='image/vnd.microsoft.icon')
 
-import logging
-
 logging.basicConfig(filename='server.log', level=logging.DEBUG)
 
+def encode_json(value):
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def item_encoder(index, fields_arg):
+    """Returns a function doc_id -> JSON bytes for the fields= parameter.
+
+    Without fields=, items carry SUMMARY_FIELDS (everything the UI shows, no
+    search_tokens); "fields=*" returns whole items; otherwise a comma-separated
+    list of field names.
+    """
+    if not fields_arg:
+        return index.summary
+    if fields_arg == '*':
+        return lambda doc_id: encode_json(index.documents[doc_id])
+    fields = {field.strip() for field in fields_arg.split(',') if field.strip()}
+    return lambda doc_id: encode_json(index.project(doc_id, fields))
+
+def stream_chunks(doc_ids, encode, start, separator, end):
+    """Yields the response in chunks of STREAM_CHUNK items, encoding each chunk only when it is sent."""
+    yield start
+    for chunk_start in range(0, len(doc_ids), STREAM_CHUNK):
+        chunk = separator.join(encode(i) for i in doc_ids[chunk_start:chunk_start + STREAM_CHUNK])
+        yield (separator if chunk_start else b"") + chunk
+    yield end
+
 @app.route('/api/search')
 def search():
     query_str = request.args.get('q', '').lower()
+    limit = min(max(request.args.get('limit', DEFAULT_LIMIT, type=int), 0), MAX_LIMIT)
+    offset = max(request.args.get('offset', 0, type=int), 0)
     logging.debug(f"Query: {query_str}")
     
     if not query_str:
         return jsonify([])
     
-    # Parse filters (e.g., type:book)
+    # Parse filters (e.g., type:book); other words with a colon (a picked title such as
+    # "Mechanics: Concepts") are search terms and match the colon in the text
     filters = {}
     search_terms = []
     
     parts = query_str.split()
     for part in parts:
-        if ':' in part:
-            key, val = part.split(':', 1)
+        key, sep, val = part.partition(':')
+        if sep and key in FILTER_KEYS:
             filters[key] = val
         else:
             search_terms.append(part)
             
     logging.debug(f"Filters: {filters}, Terms: {search_terms}")
     
-    results = []
-    
-    for item in library_data:
-        match = True
-        
-        # 1. Check Filters
-        for key, val in filters.items():
-            if key == 'type':
-                item_type = item.get('type', '').lower()
-                logging.debug(f"Checking Type: Item={item_type} vs Filter={val}")
-                if item_type != val:
-                    match = False
-            elif key == 'publisher':
-                item_pub = item.get('publisher', '').lower()
-                logging.debug(f"Checking Pub: Item={item_pub} vs Filter={val}")
-                if val not in item_pub:
-                    match = False
-            elif key == 'year':
-                item_year = item.get('year_edition', '').lower()
-                logging.debug(f"Checking Year: Item={item_year} vs Filter={val}")
-                if val not in item_year:
-                    match = False
-                    
-        if not match:
-            continue
-            
-        # 2. Check Search Terms
-        if search_terms:
-            # Construct a comprehensive text blob for the item
-            # including search_tokens which are technical terms found in content
-            
-            tokens_str = " ".join(item.get('search_tokens', []))
-            keywords_str = " ".join(item.get('keywords', []))
-            
-            item_text = (
-                f"{item['title']} {item['author']} {item.get('publisher', '')} "
-                f"{item.get('year_edition', '')} {keywords_str} {tokens_str}"
-            ).lower()
-            
-            if not all(term in item_text for term in search_terms):
-                match = False
-        
-        if match:
-            results.append(item)
-    
-    logging.debug(f"Found {len(results)} results")
-    return jsonify(results)
+    index = search_index  # Snapshot; a reload may swap the global mid-request
+    # Repeated queries, "load more" pages and queries typed a few keystrokes further are served from the cache
+    result = query_cache.search(index, search_terms, filters)
+    total, doc_ids = len(result), query_cache.page(result, offset, limit)
+    logging.debug(f"Found {total} results, returning {len(doc_ids)}")
+
+    # Items are sent as JSON fragments: the precomputed summary by default, encoded on demand otherwise
+    encode = item_encoder(index, request.args.get('fields'))
+    if request.args.get('format') == 'ndjson' or NDJSON_MIMETYPE in request.headers.get('Accept', ''):
+        body = stream_chunks(doc_ids, lambda doc_id: encode(doc_id) + b"\n", b"", b"", b"")
+        mimetype = NDJSON_MIMETYPE
+    elif len(doc_ids) > STREAM_CHUNK:
+        body = stream_chunks(doc_ids, encode, b"[", b",", b"]")
+        mimetype = "application/json"
+    else:
+        body = b"[" + b",".join(encode(i) for i in doc_ids) + b"]"
+        mimetype = "application/json"
+    response = Response(body, mimetype=mimetype)
+    response.headers['X-Total-Count'] = str(total)
+    return response
+
+@app.route('/api/suggest')
+def suggest():
+    """Completions of q among titles, authors, publishers and search terms, most frequent first."""
+    limit = request.args.get('limit', DEFAULT_SUGGESTIONS, type=int)
+    suggestions = search_index.suggestions.suggest(request.args.get('q', ''), limit)
+    return jsonify([{"text": text, "kind": kind, "count": count} for text, kind, count in suggestions])
+
+@app.route('/api/facets')
+def facets():
+    return jsonify(search_index.facet_counts())
 
 # Allow serving the files themselves if needed (optional, but useful for "Path" link)
 @app.route('/files/<path:filename>')
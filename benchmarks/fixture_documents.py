@@ -0,0 +1,163 @@
+import os
+import sys
+import zlib
+import random
+import argparse
+
+# Fixture PDFs for the indexing benchmark, written by hand so no PDF toolkit is needed
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from library_generator import SURNAMES, load_terms
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+
+# Kinds of fixture documents, one per classify_document() route
+KIND_OUTLINE = "outline"  # text layer and a digital outline
+KIND_TEXT = "text"        # text layer, no outline
+KIND_SCAN = "scan"        # image-only pages
+
+TEXT_PAGES = 60        # more than MAX_PAGES_TEXT, so the page limit is exercised
+SCAN_PAGES = 12
+CHAPTERS = 14          # outline titles; comfortably above OUTLINE_MIN_CHARS
+LINES_PER_PAGE = 40
+SCAN_SIZE = (1275, 1650)  # 150 dpi US letter, grayscale
+
+def pdf_string(text):
+    text = text.encode('latin-1', errors='replace')
+    return b"(" + text.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+class PDFWriter:
+    """Minimal PDF 1.4 writer: numbered objects, one xref table, no object streams."""
+
+    def __init__(self):
+        self.objects = []
+
+    def reserve(self):
+        self.objects.append(None)
+        return len(self.objects)
+
+    def set(self, number, body):
+        self.objects[number - 1] = body
+
+    def add(self, body):
+        number = self.reserve()
+        self.set(number, body)
+        return number
+
+    def stream(self, data, extra=b"", compress=True):
+        if compress:
+            data = zlib.compress(data)
+            extra += b" /Filter /FlateDecode"
+        return self.add(b"<< /Length %d%s >>\nstream\n" % (len(data), extra) + data + b"\nendstream")
+
+    def save(self, path, root):
+        out = bytearray(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(self.objects, 1):
+            offsets.append(len(out))
+            out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+        xref = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(self.objects) + 1)
+        out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+        out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(self.objects) + 1, root, xref)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(out)
+        os.replace(tmp_path, path)
+
+def book_pages(rng, terms, count):
+    """Returns (chapter titles, [lines per page]): a contents page, an introduction, then body text."""
+    chapters = [f"{i}. {rng.choice(terms).title()} and {rng.choice(terms)}" for i in range(1, CHAPTERS + 1)]
+    pages = [["Contents"] + [f"{title} .......... {5 + 10 * i}" for i, title in enumerate(chapters)]]
+    pages.append(["Introduction"] + [f"This book treats {rng.choice(terms)} through {rng.choice(terms)}."
+                                     for _ in range(LINES_PER_PAGE // 2)])
+    while len(pages) < count:
+        pages.append([f"The {rng.choice(terms)} of a {rng.choice(terms)} follows from {rng.choice(terms)}."
+                      for _ in range(LINES_PER_PAGE)])
+    return chapters, pages
+
+def render_scan(lines):
+    """Grayscale page image with the lines drawn on it; a plain pattern without Pillow."""
+    width, height = SCAN_SIZE
+    if Image is None:
+        row = bytes(255 if (x // 8) % 4 else 0 for x in range(width))
+        return width, height, row * height
+    image = Image.new("L", SCAN_SIZE, 255)
+    draw = ImageDraw.Draw(image)
+    try:
+        font = ImageFont.load_default(size=24)
+    except TypeError:
+        font = ImageFont.load_default()
+    for i, line in enumerate(lines[:LINES_PER_PAGE]):
+        draw.text((100, 100 + i * 36), line, fill=0, font=font)
+    return width, height, image.tobytes()
+
+def write_document(path, kind, pages, chapters):
+    writer = PDFWriter()
+    pages_id = writer.reserve()
+    font = writer.add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    page_ids = []
+    for lines in pages:
+        if kind == KIND_SCAN:
+            width, height, pixels = render_scan(lines)
+            image = writer.stream(pixels, b" /Type /XObject /Subtype /Image /Width %d /Height %d"
+                                          b" /ColorSpace /DeviceGray /BitsPerComponent 8" % (width, height))
+            contents = writer.stream(b"q 612 0 0 792 0 0 cm /Im1 Do Q", compress=False)
+            resources = b"<< /XObject << /Im1 %d 0 R >> >>" % image
+        else:
+            ops = b"BT /F1 11 Tf 72 740 Td 16 TL " + b"".join(pdf_string(line) + b" ' " for line in lines) + b"ET"
+            contents = writer.stream(ops)
+            resources = b"<< /Font << /F1 %d 0 R >> >>" % font
+        page_ids.append(writer.add(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Contents %d 0 R"
+                                   b" /Resources %s >>" % (pages_id, contents, resources)))
+    writer.set(pages_id, b"<< /Type /Pages /Kids [%s] /Count %d >>"
+               % (b" ".join(b"%d 0 R" % page for page in page_ids), len(page_ids)))
+
+    catalog = b"<< /Type /Catalog /Pages %d 0 R" % pages_id
+    if kind == KIND_OUTLINE:
+        # Each chapter points at its page; pdfminer only reports items with a destination
+        outlines = writer.reserve()
+        items = [writer.reserve() for _ in chapters]
+        for i, (item, title) in enumerate(zip(items, chapters)):
+            links = b""
+            if i > 0:
+                links += b" /Prev %d 0 R" % items[i - 1]
+            if i + 1 < len(items):
+                links += b" /Next %d 0 R" % items[i + 1]
+            page = page_ids[min(2 + i, len(page_ids) - 1)]
+            writer.set(item, b"<< /Title %s /Parent %d 0 R%s /Dest [%d 0 R /Fit] >>"
+                       % (pdf_string(title), outlines, links, page))
+        writer.set(outlines, b"<< /Type /Outlines /First %d 0 R /Last %d 0 R /Count %d >>"
+                   % (items[0], items[-1], len(items)))
+        catalog += b" /Outlines %d 0 R /PageMode /UseOutlines" % outlines
+    writer.save(path, writer.add(catalog + b" >>"))
+
+def generate_fixtures(output_dir, per_kind, seed=0):
+    """Writes per_kind documents of each kind into output_dir; returns {kind: [paths]}."""
+    rng = random.Random(seed)
+    terms = load_terms()
+    os.makedirs(output_dir, exist_ok=True)
+    fixtures = {}
+    for kind, page_count in ((KIND_OUTLINE, TEXT_PAGES), (KIND_TEXT, TEXT_PAGES), (KIND_SCAN, SCAN_PAGES)):
+        for i in range(per_kind):
+            chapters, pages = book_pages(rng, terms, page_count)
+            title = f"{rng.choice(terms).title()} {kind} {i:03d}"
+            path = os.path.join(output_dir, f"{title} - {rng.choice(SURNAMES)} ({rng.randint(1950, 2025)}).pdf")
+            write_document(path, kind, pages, chapters)
+            fixtures.setdefault(kind, []).append(path)
+    return fixtures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate fixture PDFs (outline, text layer, image-only)")
+    parser.add_argument("output_dir")
+    parser.add_argument("--per-kind", type=int, default=4, help="Documents of each kind")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fixtures = generate_fixtures(args.output_dir, args.per_kind, seed=args.seed)
+    sys.stderr.write(f"Wrote {sum(len(paths) for paths in fixtures.values())} documents to {args.output_dir}\n")
@@ -0,0 +1,174 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import resource
+import subprocess
+
+# Indexing benchmark: fixture PDFs through run_indexer() for each mode and core count
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fixture_documents import generate_fixtures
+from indexing_metrics import METRICS_FILE, last_runs, load_metrics
+
+DEFAULT_PER_KIND = 4
+MODES = ["pool", "subprocess"]
+WORK_DIR = os.path.join(BENCH_DIR, ".work")
+# Files the indexer expects in its working directory (the library root, as in the Docker image)
+RUNTIME_FILES = ["library_indexer.py", "glossary.json", "expansions.json"]
+
+# Passes over the same library, each in a fresh process
+PASS_COLD = "cold"            # empty caches: every file is extracted
+PASS_TOUCHED = "touched"      # mtimes changed: every file is re-indexed from the content cache
+PASS_UNCHANGED = "unchanged"  # nothing changed: every file is skipped by the scan manifest
+PASSES = [PASS_COLD, PASS_TOUCHED, PASS_UNCHANGED]
+
+def default_cores():
+    cores = os.cpu_count() or 1
+    return sorted({1, max(1, cores // 2), cores})
+
+def prepare_fixtures(per_kind, seed, work_dir):
+    """Generates the fixture documents once per (count, seed); returns their directory."""
+    fixture_dir = os.path.join(work_dir, f"fixtures-{per_kind}-{seed}")
+    if not os.path.exists(os.path.join(fixture_dir, ".complete")):
+        sys.stderr.write(f"Generating {per_kind * 3} fixture documents...\n")
+        shutil.rmtree(fixture_dir, ignore_errors=True)
+        generate_fixtures(fixture_dir, per_kind, seed=seed)
+        open(os.path.join(fixture_dir, ".complete"), 'w').close()
+    return fixture_dir
+
+def prepare_library(fixture_dir, run_dir):
+    """Creates a fresh library root: the fixtures under library/, the indexer's runtime files linked in."""
+    shutil.rmtree(run_dir, ignore_errors=True)
+    shutil.copytree(fixture_dir, os.path.join(run_dir, "library"), ignore=shutil.ignore_patterns(".complete"))
+    for name in RUNTIME_FILES:
+        source = os.path.join(REPO_DIR, name)
+        if os.path.exists(source):
+            os.symlink(source, os.path.join(run_dir, name))
+
+def touch_library(run_dir):
+    """Moves every fixture's mtime forward, so the stat check fails but the content is unchanged."""
+    library_dir = os.path.join(run_dir, "library")
+    for name in os.listdir(library_dir):
+        path = os.path.join(library_dir, name)
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+def cpu_seconds(who):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+def summarize(records, wall, cpu, worker_rss_mb):
+    """Condenses one pass's metrics records into the benchmark figures."""
+    run = next((r for r in records if r["type"] == "run"), {})
+    files = [r for r in records if r["type"] == "file"]
+    indexed = sum(1 for r in files if r["status"] == "ok")
+    pages = sum(r.get("counts", {}).get("pages_text", 0) + r.get("counts", {}).get("pages_ocr", 0) for r in files)
+    hits = sum(r.get("counts", {}).get("content_cache_hits", 0) for r in files)
+    skipped = run.get("skipped", 0)
+    scanned = skipped + run.get("to_index", 0)
+
+    by_route = {}
+    for r in files:
+        by_route.setdefault(r.get("route") or "-", []).append(r["seconds"])
+    return {
+        "files": len(files),
+        "indexed": indexed,
+        "failed": len(files) - indexed,
+        "pages": pages,
+        "wall_s": wall,
+        "files_per_s": indexed / wall if wall > 0 else 0.0,
+        "cpu_s": cpu,
+        "cpu_s_per_page": cpu / pages if pages else None,
+        "worker_rss_mb": worker_rss_mb if files else None,
+        "content_cache_hit_rate": hits / len(files) if files else None,
+        "skip_rate": skipped / scanned if scanned else None,
+        "stages": {r["stage"]: r["seconds"] for r in records if r["type"] == "stage"},
+        "seconds_per_file": {route: sum(values) / len(values) for route, values in by_route.items()},
+    }
+
+def run_one(run_dir, mode, cores):
+    """Runs one indexing pass in this process; returns its summary."""
+    os.chdir(run_dir)
+    from incremental_indexer import run_indexer
+
+    cpu_before = cpu_seconds(resource.RUSAGE_SELF) + cpu_seconds(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    run_indexer(cores=cores, mode=mode)
+    wall = time.perf_counter() - start
+    # Workers (and their pdftoppm/tesseract children) have all been waited for by now
+    cpu = cpu_seconds(resource.RUSAGE_SELF) + cpu_seconds(resource.RUSAGE_CHILDREN) - cpu_before
+    worker_rss_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    records = last_runs(load_metrics(METRICS_FILE), include_empty=True)[0]
+    return summarize(records, wall, cpu, worker_rss_mb)
+
+def format_results(results):
+    def fmt(value, spec, unit=""):
+        return "-" if value is None else format(value, spec) + unit
+
+    lines = [f"{'mode':<11}{'cores':>6}  {'pass':<10}{'files':>6}{'wall':>9}{'files/s':>9}{'cpu/page':>10}"
+             f"{'rss/wkr':>9}{'content':>9}{'skipped':>9}"]
+    for r in results:
+        lines.append(f"{r['mode']:<11}{r['cores']:>6}  {r['pass']:<10}{r['indexed']:>6}{r['wall_s']:>8.2f}s"
+                     f"{r['files_per_s']:>9.2f}{fmt(r['cpu_s_per_page'], '.3f', 's'):>10}{fmt(r['worker_rss_mb'], '.0f', 'MB'):>9}"
+                     f"{fmt(r['content_cache_hit_rate'], '.0%'):>9}{fmt(r['skip_rate'], '.0%'):>9}")
+        if r["pass"] == PASS_COLD and r["seconds_per_file"]:
+            lines.append("          per file: " + "  ".join(f"{route} {seconds:.2f}s"
+                                                          for route, seconds in sorted(r["seconds_per_file"].items())))
+        if r["failed"]:
+            lines.append(f"          {r['failed']} file(s) failed (see {os.path.join(r['run_dir'], 'indexing_failures.json')})")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark run_indexer() on generated fixture PDFs")
+    parser.add_argument("--cores", type=int, nargs="+", default=default_cores(), help="Core counts to benchmark")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--per-kind", type=int, default=DEFAULT_PER_KIND,
+                        help="Fixture documents of each kind (outline, text layer, image-only)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=WORK_DIR, help="Where fixtures and library copies are kept")
+    parser.add_argument("--output", default=None, help="Also write the results (and machine info) to this JSON file")
+    parser.add_argument("--run-one", nargs=3, metavar=("RUN_DIR", "MODE", "CORES"), default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one is not None:
+        run_dir, mode, cores = args.run_one
+        print(json.dumps(run_one(run_dir, mode, int(cores))))
+        sys.exit(0)
+
+    work_dir = os.path.abspath(args.work_dir)
+    fixture_dir = prepare_fixtures(args.per_kind, args.seed, work_dir)
+
+    # Each pass runs in a fresh process, so CPU time and peak worker RSS cover that pass only
+    results = []
+    for mode in args.modes:
+        for cores in args.cores:
+            run_dir = os.path.join(work_dir, f"indexing-{mode}-{cores}")
+            prepare_library(fixture_dir, run_dir)
+            for pass_name in PASSES:
+                if pass_name == PASS_TOUCHED:
+                    touch_library(run_dir)
+                sys.stderr.write(f"{mode}, {cores} core(s): {pass_name} pass...\n")
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--run-one", run_dir, mode, str(cores)],
+                    capture_output=True, text=True, check=True
+                )
+                result = json.loads(output.stdout.strip().splitlines()[-1])
+                result.update({"mode": mode, "cores": cores, "pass": pass_name, "run_dir": run_dir})
+                results.append(result)
+
+    print(format_results(results))
+
+    if args.output:
+        machine = {"cpu_count": os.cpu_count(), "machine": platform.machine(), "platform": platform.platform(),
+                   "python": platform.python_version()}
+        with open(args.output, 'w') as f:
+            json.dump({"machine": machine, "per_kind": args.per_kind, "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
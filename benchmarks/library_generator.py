@@ -0,0 +1,79 @@
+import os
+import sys
+import json
+import random
+import argparse
+
+# Synthetic library.json corpora for the benchmarks, with search_tokens drawn from the glossary
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GLOSSARY_FILE = os.path.join(REPO_DIR, "glossary.json")
+
+PUBLISHERS = ["Springer", "Wiley", "Dover", "MIT Press", "Cambridge University Press",
+              "Oxford University Press", "Pearson", "McGraw-Hill", "Elsevier", "Mir Publishers",
+              "Addison-Wesley", "Princeton University Press", "Unknown"]
+TYPES = ["Book"] * 18 + ["Unknown", "Paper"]
+SURNAMES = ["Landau", "Lifshitz", "Feynman", "Dirac", "Arnold", "Spivak", "Jackson", "Goldstein",
+            "Sakurai", "Weinberg", "Kittel", "Ashcroft", "Mermin", "Griffiths", "Rudin", "Halmos",
+            "Hardy", "Courant", "Hilbert", "Zee", "Peskin", "Schroeder", "Wald", "Misner", "Thorne"]
+TITLE_WORDS = ["introduction", "to", "principles", "of", "advanced", "lectures", "on", "course",
+               "in", "elements", "foundations", "modern", "classical", "handbook", "problems"]
+EDITIONS = ["", "", "", "2nd Ed", "3rd Edition", "4th ed"]
+TOKENS_PER_BOOK = (10, 120)  # search_tokens per record, uniform in this range
+ZIPF_EXPONENT = 1.1          # popularity of glossary terms across books
+
+def load_terms(path=GLOSSARY_FILE):
+    with open(path, 'r') as f:
+        return sorted(json.load(f))
+
+def zipf_weights(n, exponent=ZIPF_EXPONENT):
+    return [1.0 / (rank ** exponent) for rank in range(1, n + 1)]
+
+def generate_library(size, seed=0, terms=None):
+    """Returns size synthetic records shaped like the indexer's output.
+
+    Glossary terms follow a Zipf distribution (a few terms such as "energy" occur
+    in most books, most terms in very few), shuffled so that popularity does not
+    follow alphabetical order.
+    """
+    rng = random.Random(seed)
+    terms = list(terms if terms is not None else load_terms())
+    rng.shuffle(terms)
+    cum_weights = []
+    total = 0.0
+    for weight in zipf_weights(len(terms)):
+        total += weight
+        cum_weights.append(total)
+
+    records = []
+    for i in range(size):
+        tokens = set(rng.choices(terms, cum_weights=cum_weights, k=rng.randint(*TOKENS_PER_BOOK)))
+        topic = rng.choice(sorted(tokens))
+        title = " ".join(rng.sample(TITLE_WORDS, rng.randint(0, 3)) + [topic]).capitalize()
+        author = " & ".join(rng.sample(SURNAMES, rng.randint(1, 2)))
+        year = str(rng.randint(1900, 2025))
+        edition = rng.choice(EDITIONS)
+        filename = f"{title} - {author} ({year}).pdf"
+        records.append({
+            "author": author,
+            "title": title,
+            "publisher": rng.choice(PUBLISHERS),
+            "year_edition": f"{year}, {edition}" if edition else year,
+            "type": rng.choice(TYPES),
+            "search_tokens": sorted(tokens),
+            "path": f"library/{i % 100:02d}/{filename}",
+            "filename": filename,
+        })
+    return records
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic library.json")
+    parser.add_argument("size", type=int, help="Number of records")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="library.json")
+    args = parser.parse_args()
+
+    records = generate_library(args.size, seed=args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(records, f, separators=(',', ':'))
+    sys.stderr.write(f"Wrote {len(records)} records to {args.output}\n")
@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import subprocess
+
+# Search latency benchmark: synthetic libraries, a fixed query mix, the Flask test client
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from index_format import FORMAT_VERSION
+from indexing_metrics import percentile
+from library_generator import PUBLISHERS, generate_library, load_terms
+
+DEFAULT_SIZES = [1000, 10000, 100000]  # add 1000000 explicitly; generating it takes a while
+DEFAULT_QUERIES = 500
+WARMUP_QUERIES = 20
+BASELINE_FILE = os.path.join(BENCH_DIR, "search_baseline.json")
+WORK_DIR = os.path.join(BENCH_DIR, ".work")
+QUERY_MIX = [("single", 40), ("multi", 25), ("filter", 15), ("year", 10), ("publisher", 10)]
+
+def make_queries(count, seed=0):
+    """Returns [(kind, query string)] drawn from the glossary, in the QUERY_MIX proportions."""
+    rng = random.Random(seed)
+    words = sorted({word for term in load_terms() for word in term.split() if len(word) > 3})
+    kinds = [kind for kind, _ in QUERY_MIX]
+    weights = [weight for _, weight in QUERY_MIX]
+    queries = []
+    for _ in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "single":
+            q = rng.choice(words)
+        elif kind == "multi":
+            q = " ".join(rng.sample(words, rng.randint(2, 3)))
+        elif kind == "filter":
+            q = f"type:book {rng.choice(words)}"
+        elif kind == "year":
+            start = rng.randint(1900, 2010)
+            year = f"{start}..{start + rng.randint(5, 30)}" if rng.random() < 0.5 else str(start)
+            q = f"year:{year} {rng.choice(words)}"
+        else:
+            publisher = rng.choice(PUBLISHERS).split()[0].lower()
+            q = f"publisher:{publisher} {rng.choice(words)}"
+        queries.append((kind, q))
+    return queries
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/status", 'r') as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def prepare_corpus(size, seed, work_dir):
+    """Writes library.json and library.idx for size records (reused across runs); returns the directory."""
+    from search_index import SearchIndex
+
+    corpus_dir = os.path.join(work_dir, f"{size}-{seed}-v{FORMAT_VERSION}")
+    if not os.path.exists(os.path.join(corpus_dir, "library.idx")):
+        os.makedirs(corpus_dir, exist_ok=True)
+        sys.stderr.write(f"Generating {size} records...\n")
+        records = generate_library(size, seed=seed)
+        with open(os.path.join(corpus_dir, "library.json"), 'w') as f:
+            json.dump(records, f, separators=(',', ':'))
+        SearchIndex.build(records).save(os.path.join(corpus_dir, "library.idx"))
+    return corpus_dir
+
+def run_one(size, queries, seed, work_dir):
+    """Benchmarks one corpus size in this process; returns the measurements."""
+    corpus_dir = prepare_corpus(size, seed, work_dir)
+    os.chdir(corpus_dir)
+    rss_before = current_rss_mb()
+    import app as server
+
+    start = time.perf_counter()
+    server.load_db()
+    load_seconds = time.perf_counter() - start
+    client = server.app.test_client()
+
+    mix = make_queries(queries, seed)
+    for _, q in mix[:WARMUP_QUERIES]:
+        client.get("/api/search", query_string={"q": q})
+
+    latencies = {}
+    sizes = []
+    start = time.perf_counter()
+    for kind, q in mix:
+        t = time.perf_counter()
+        response = client.get("/api/search", query_string={"q": q})
+        latencies.setdefault(kind, []).append(time.perf_counter() - t)
+        sizes.append(len(response.data))
+    elapsed = time.perf_counter() - start
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "size": size,
+        "queries": len(mix),
+        "load_s": load_seconds,
+        "p50_ms": percentile(all_latencies, 50) * 1000,
+        "p99_ms": percentile(all_latencies, 99) * 1000,
+        "qps": len(mix) / elapsed,
+        "mean_bytes": sum(sizes) / len(sizes),
+        "rss_mb": current_rss_mb(),
+        "index_rss_mb": current_rss_mb() - rss_before,
+        "by_kind": {kind: {"p50_ms": percentile(values, 50) * 1000, "p99_ms": percentile(values, 99) * 1000}
+                    for kind, values in latencies.items()},
+    }
+
+def format_results(results, baseline):
+    lines = [f"{'size':>9}{'load':>9}{'p50':>10}{'p99':>10}{'qps':>9}{'bytes':>10}{'rss':>9}  vs baseline (p50/p99)"]
+    for r in results:
+        line = (f"{r['size']:>9}{r['load_s']:>8.2f}s{r['p50_ms']:>8.2f}ms{r['p99_ms']:>8.2f}ms"
+                f"{r['qps']:>9.0f}{r['mean_bytes']:>10.0f}{r['rss_mb']:>7.0f}MB")
+        base = baseline.get(str(r["size"]))
+        if base:
+            line += f"  {r['p50_ms'] / base['p50_ms']:.2f}x / {r['p99_ms'] / base['p99_ms']:.2f}x"
+        lines.append(line)
+        lines.append("          " + "  ".join(f"{kind} {v['p50_ms']:.2f}/{v['p99_ms']:.2f}ms"
+                                           for kind, v in sorted(r["by_kind"].items())))
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark /api/search on synthetic libraries")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Library sizes to benchmark")
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help="Queries replayed per size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=WORK_DIR, help="Where generated corpora are kept")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="Exit with status 1 if p50 is more than this fraction slower than the baseline (e.g. 0.2)")
+    parser.add_argument("--run-one", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one is not None:
+        print(json.dumps(run_one(args.run_one, args.queries, args.seed, os.path.abspath(args.work_dir))))
+        sys.exit(0)
+
+    # Each size runs in a fresh process, so RSS and load time are not skewed by generation or the previous size
+    results = []
+    for size in args.sizes:
+        prepare_corpus(size, args.seed, os.path.abspath(args.work_dir))
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run-one", str(size), "--queries", str(args.queries),
+             "--seed", str(args.seed), "--work-dir", os.path.abspath(args.work_dir)],
+            capture_output=True, text=True, check=True
+        )
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+    print(format_results(results, baseline))
+
+    if args.save_baseline:
+        baseline.update({str(r["size"]): r for r in results})
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif args.max_regression is not None:
+        regressed = [r["size"] for r in results if str(r["size"]) in baseline
+                     and r["p50_ms"] > baseline[str(r["size"])]["p50_ms"] * (1 + args.max_regression)]
+        if regressed:
+            print(f"p50 regressed by more than {args.max_regression:.0%} for sizes: {regressed}")
+            sys.exit(1)
@@ -0,0 +1,80 @@
+import os
+import sys
+import json
+
+from token_utils import GLOSSARY_TERMS, EXPANSIONS_FILE, fallback_seed, get_tokens_from_text, title_seeds
+from wiki_client import fetch_extracts
+
+DB_FILE = "library.json"  # titles without a glossary term contribute their fallback seed
+BATCH_SIZE = 32  # seeds per fetch_extracts() call; fetched concurrently and cached on disk
+FETCH_ATTEMPTS = 3  # passes over the terms whose fetch failed
+
+def library_fallback_seeds(db_file):
+    """Returns the fallback seeds of the titles in db_file that have no glossary seed (see library_indexer)."""
+    try:
+        with open(db_file, 'r') as f:
+            items = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    seeds = set()
+    for item in items:
+        title = item.get("title") if isinstance(item, dict) else None
+        if not isinstance(title, str):
+            continue
+        candidates = title_seeds(title)
+        if candidates and not any(seed in GLOSSARY_TERMS for seed in candidates):
+            seeds.add(fallback_seed(candidates))
+    return seeds
+
+def build_expansions(terms):
+    """Resolves each term (glossary terms and fallback seeds) to the glossary tokens of its Wikipedia intro.
+
+    Returns (expansions, failed). Every resolved term is in expansions, with []
+    when its intro has no glossary tokens, so indexing never looks it up again;
+    failed lists the terms that could not be fetched.
+    """
+    expansions = {}
+    pending = sorted(terms)
+    for attempt in range(1, FETCH_ATTEMPTS + 1):
+        failed = []
+        for start in range(0, len(pending), BATCH_SIZE):
+            batch = pending[start:start + BATCH_SIZE]
+            extracts = fetch_extracts(batch)
+            for term in batch:
+                extract = extracts.get(term)
+                if extract is None:
+                    failed.append(term)
+                else:
+                    expansions[term] = sorted(set(get_tokens_from_text(extract)))
+            print(f"Pass {attempt}: fetched {min(start + BATCH_SIZE, len(pending))}/{len(pending)} terms.")
+        if not failed:
+            break
+        print(f"{len(failed)} terms failed to fetch" + (", retrying." if attempt < FETCH_ATTEMPTS else "."))
+        pending = failed
+    return expansions, failed
+
+def save_expansions(expansions, output_file):
+    """Writes the table compactly: one shared token list, and token ids per term."""
+    tokens = sorted({token for term_tokens in expansions.values() for token in term_tokens})
+    token_ids = {token: i for i, token in enumerate(tokens)}
+    table = {
+        "tokens": tokens,
+        "terms": {term: [token_ids[t] for t in term_tokens] for term, term_tokens in sorted(expansions.items())},
+    }
+    tmp_file = f"{output_file}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(table, f, separators=(',', ':'))
+    os.replace(tmp_file, output_file)
+    print(f"Saved expansions for {len(expansions)} terms ({len(tokens)} distinct tokens) to {output_file}.")
+
+if __name__ == "__main__":
+    fallback_seeds = library_fallback_seeds(DB_FILE) - GLOSSARY_TERMS
+    if fallback_seeds:
+        print(f"Including the fallback seeds of {len(fallback_seeds)} titles without glossary terms.")
+    expansions, failed = build_expansions(GLOSSARY_TERMS | fallback_seeds)
+    save_expansions(expansions, EXPANSIONS_FILE)
+    if failed:
+        print(f"Could not fetch {len(failed)} terms; they get no expansion. Re-run to retry them:")
+        for term in failed:
+            print(f"  {term}")
+        sys.exit(1)
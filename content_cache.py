@@ -0,0 +1,54 @@
+import os
+import json
+import hashlib
+
+# Extraction results keyed by file content, shared by every path with the same bytes
+CONTENT_CACHE_DIR = os.path.join(".metadata_cache", "content")
+CONTENT_CACHE_VERSION = 1
+DIGEST_CHUNK_SIZE = 1 << 20
+
+def stat_signature(st):
+    """Returns [size, mtime_ns, inode] from an os.stat_result."""
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+def file_stat_signature(filepath):
+    """Returns [size, mtime_ns, inode] of a file, or None if it cannot be stat'ed."""
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+    return stat_signature(st)
+
+def get_file_digest(filepath):
+    """Returns the SHA-256 of the whole file, read in chunks."""
+    hasher = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        while True:
+            chunk = f.read(DIGEST_CHUNK_SIZE)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def _content_path(digest):
+    return os.path.join(CONTENT_CACHE_DIR, digest[:2], f"{digest}.json")
+
+def load_content(digest):
+    """Returns the cached extraction results for a content digest, or None."""
+    try:
+        with open(_content_path(digest), 'r') as f:
+            content = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if content.get("_version") != CONTENT_CACHE_VERSION:
+        return None
+    return content
+
+def save_content(digest, content):
+    """Stores extraction results (text, tokens, ...) under a content digest."""
+    path = _content_path(digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({**content, "_version": CONTENT_CACHE_VERSION}, f)
+    os.replace(tmp_path, path)
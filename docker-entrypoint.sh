@@ -26,7 +26,7 @@ elif [ "$1" = 'dryrun' ]; then
 
 elif [ "$1" = 'clean' ]; then
     echo "Cleaning metadata cache and library database..."
-    rm -rf .metadata_cache library.json
+    rm -rf .metadata_cache library.json library.idx .glossary_automaton.pickle indexing_metrics.jsonl
     echo "Clean complete."
 
 else
@@ -3,8 +3,7 @@ import sys
 import nltk
 from nltk.tokenize import word_tokenize
 from nltk.corpus import stopwords
-from nltk.util import ngrams
-from nltk.tag import pos_tag
+from nltk.tag.perceptron import PerceptronTagger
 import string
 import re
 import os
@@ -13,8 +12,13 @@ import pytesseract
 from pdf2image import convert_from_path
 from PIL import Image
 import io
+import queue
+import threading
+from collections import OrderedDict
 
 # Import project utilities
+from indexing_metrics import add_count, timed
+from text_layer import ROUTE_OCR, ROUTE_OUTLINE, classify_document, outline_text, page_has_text_layer
 try:
     from token_utils import get_tokens_from_text, GLOSSARY_TERMS
 except ImportError:
@@ -41,8 +45,19 @@ except LookupError:
 
 # Configuration
 MAX_PAGES_TEXT = 50
+RELEVANT_PAGE_KEYWORDS = ("contents", "abstract", "introduction")
+RELEVANT_PAGES = 5    # Pages kept from the first relevant page (or from the start as fallback)
+DJVU_TIMEOUT = 60     # Seconds for the single djvutxt call over the page range
 MAX_PAGES_OCR = 25
+MIN_TEXT_CHARS = 100  # Less text than this from one route falls back to the other
+OCR_DPI = 200
+OCR_WORKERS = 2       # Concurrent tesseract processes per document
+OCR_BATCH_PAGES = 4   # Pages rasterized per pdftoppm call
+OCR_QUEUE_SIZE = 4    # Rasterized pages waiting for a tesseract worker
 ABSTRACT_KEYWORDS = [r'\babstract\b', r'\bintroduction\b', r'\bsummary\b']
+TAG_CACHE_SIZE = 50000  # Tagged lines kept across documents
+
+STOP_WORDS = set(stopwords.words('english'))
 
 def clean_text(text):
     if not text: return ""
@@ -60,54 +75,235 @@ def clean_text(text):
     text = re.sub(r'\s+', ' ', text).strip()
     return text
 
-def extract_tokens_from_djvu(filepath):
-    """Extracts text from DJVU using djvutxt for the first MAX_PAGES_TEXT pages."""
+_tagger = None
+_tag_cache = OrderedDict()
+
+def tag_sentences(sentences):
+    """POS-tags tuples of words, one tagger pass over all sentences not seen before.
+
+    Results are kept in an LRU cache shared across documents; TOC lines such as
+    "introduction" or "references" repeat from book to book.
+    """
+    global _tagger
+    missing = [s for s in dict.fromkeys(sentences) if s not in _tag_cache]
+    if missing:
+        with timed("nltk_tagging"):
+            if _tagger is None:
+                # nltk.pos_tag() loads the perceptron model again on every call
+                _tagger = PerceptronTagger()
+            for sentence, tagged in zip(missing, _tagger.tag_sents(missing)):
+                _tag_cache[sentence] = tuple(tag for _, tag in tagged)
+    result = []
+    for sentence in sentences:
+        _tag_cache.move_to_end(sentence)
+        result.append(_tag_cache[sentence])
+    while len(_tag_cache) > TAG_CACHE_SIZE:
+        _tag_cache.popitem(last=False)
+    return result
+
+def extract_noun_phrases(text):
+    """Finds 2-3 word noun-phrase candidates, tagging each line of text once in context."""
+    sentences = []
+    for line in text.splitlines():
+        words = tuple(word_tokenize(clean_text(line).lower()))
+        if len(words) >= 2:
+            sentences.append(words)
+
+    phrases = set()
+    for words, tags in zip(sentences, tag_sentences(sentences)):
+        # A word qualifies if it is long enough, not a stopword and tagged noun/adjective
+        ok = [len(w) > 2 and w not in STOP_WORDS and (t.startswith('NN') or t.startswith('JJ'))
+              for w, t in zip(words, tags)]
+        for i in range(len(words) - 1):
+            if ok[i] and ok[i + 1]:
+                phrases.add(f"{words[i]} {words[i + 1]}")
+                if i + 2 < len(words) and ok[i + 2]:
+                    phrases.add(f"{words[i]} {words[i + 1]} {words[i + 2]}")
+    return phrases
+
+def select_relevant_pages(page_texts, limit=MAX_PAGES_TEXT):
+    """Returns the text of the TOC/abstract pages among the first limit pages.
+
+    page_texts is consumed lazily and only until the first page mentioning
+    contents, abstract or introduction plus the RELEVANT_PAGES - 1 pages after
+    it have been seen. If no page qualifies, the first RELEVANT_PAGES are used.
+    """
+    seen = []
+    found = None
+    for i, text in enumerate(page_texts):
+        if i >= limit:
+            break
+        seen.append(text or "")
+        if found is None and text:
+            lower_text = text.lower()
+            if any(keyword in lower_text for keyword in RELEVANT_PAGE_KEYWORDS):
+                found = i
+        if found is not None and i >= found + RELEVANT_PAGES - 1:
+            break
+
+    start = found if found is not None else 0
+    return "".join(text + "\n" for text in seen[start:start + RELEVANT_PAGES] if text)
+
+def iter_pdf_pages(pdf, max_pages=MAX_PAGES_TEXT):
+    """Streams the text of the first max_pages pages of an open pdfplumber PDF.
+
+    Each page is parsed at most once and its layout objects are released right
+    after its text is extracted, so memory stays flat whatever the page count.
+    """
+    for i, page in enumerate(pdf.pages):
+        if i >= max_pages:
+            break
+        if not page_has_text_layer(page.page_obj):
+            yield ""
+            continue
+        try:
+            with timed("page_text"):
+                text = page.extract_text(x_tolerance=1)
+        finally:
+            page.close()
+        add_count("pages_text")
+        yield text
+
+def iter_djvu_pages(filepath, max_pages=MAX_PAGES_TEXT):
+    """Streams the text of the first max_pages pages of a DJVU from a single djvutxt call.
+
+    djvutxt ends every page with a form feed; the process is killed as soon as the
+    consumer stops asking for pages.
+    """
+    proc = subprocess.Popen(
+        ["djvutxt", f"--page=1-{max_pages}", filepath],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    timer = threading.Timer(DJVU_TIMEOUT, proc.kill)
+    timer.start()
+    pages_read = 0
     try:
-        # djvutxt doesn't easily support page ranges without extracting page by page
-        # But we can try to extract the whole thing and take the first chunk of text
-        # Or better, loop through pages
-        combined_text = ""
-        for p in range(1, MAX_PAGES_TEXT + 1):
-            cmd = ["djvutxt", f"--page={p}", filepath]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-            if result.returncode != 0:
-                if p == 1:
-                    sys.stderr.write(f"  djvutxt failed on page 1: {result.stderr}\n")
+        buffer = b""
+        while True:
+            # read1() returns whatever is available, so pages arrive as djvutxt emits them
+            chunk = proc.stdout.read1(8192)
+            if not chunk:
                 break
-            combined_text += result.stdout + "\n"
-        return combined_text
+            buffer += chunk
+            *pages, buffer = buffer.split(b"\f")
+            for page in pages:
+                pages_read += 1
+                add_count("pages_text")
+                yield page.decode('utf-8', errors='replace')
+        if buffer.strip():
+            pages_read += 1
+            add_count("pages_text")
+            yield buffer.decode('utf-8', errors='replace')
+        if proc.wait() != 0 and pages_read == 0:
+            sys.stderr.write(f"  djvutxt failed on {filepath} (exit code {proc.returncode})\n")
+    finally:
+        timer.cancel()
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+        proc.stdout.close()
+
+def extract_tokens_from_djvu(filepath):
+    """Extracts the TOC/abstract text of a DJVU from its first MAX_PAGES_TEXT pages."""
+    try:
+        pages = iter_djvu_pages(filepath)
+        try:
+            with timed("page_text"):
+                return select_relevant_pages(pages)
+        finally:
+            pages.close()
     except Exception as e:
         sys.stderr.write(f"  DJVU extraction error: {e}\n")
         return ""
 
-def get_ocr_text(pdf_path, max_pages=MAX_PAGES_OCR):
-    """Performs OCR on the first max_pages of a PDF."""
+def get_ocr_text(pdf_path, max_pages=MAX_PAGES_OCR, dpi=OCR_DPI, workers=OCR_WORKERS):
+    """Performs OCR on the first max_pages of a PDF, stopping 3 pages after a TOC page.
+
+    One thread rasterizes the pages in batches into a bounded queue and a pool of
+    threads runs tesseract on them concurrently, so at most OCR_BATCH_PAGES +
+    OCR_QUEUE_SIZE + workers page bitmaps are in memory at once.
+    """
     sys.stderr.write(f"  Performing OCR on first {max_pages} pages...\n")
+    page_texts = {}
+    state = {"last_page": max_pages}  # Lowered once a TOC page is recognized
+    lock = threading.Lock()
+    page_queue = queue.Queue(maxsize=OCR_QUEUE_SIZE)
+    workers = max(1, workers)
+    if workers > 1:
+        # Parallelism comes from running several tesseract processes, not their OpenMP threads
+        os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+    def rasterize():
+        try:
+            first = 1
+            while first <= state["last_page"]:
+                last = min(first + OCR_BATCH_PAGES - 1, state["last_page"])
+                with timed("rasterize"):
+                    images = convert_from_path(pdf_path, first_page=first, last_page=last, dpi=dpi, grayscale=True)
+                for offset, image in enumerate(images):
+                    page_queue.put((first + offset, image))
+                if len(images) < last - first + 1:
+                    break  # End of document
+                first = last + 1
+        except Exception as e:
+            sys.stderr.write(f"  OCR Error: {e}\n")
+        finally:
+            for _ in range(workers):
+                page_queue.put(None)
+
+    def recognize():
+        while True:
+            item = page_queue.get()
+            if item is None:
+                return
+            page_no, image = item
+            try:
+                if page_no > state["last_page"]:
+                    continue  # Past the TOC; no longer needed
+                with timed("ocr_page"):
+                    page_text = pytesseract.image_to_string(image)
+                add_count("pages_ocr")
+            except Exception as e:
+                sys.stderr.write(f"  OCR Error on page {page_no}: {e}\n")
+                continue
+            finally:
+                image.close()
+            with lock:
+                page_texts[page_no] = page_text
+                # Early exit if we find TOC-like structure: keep at most 3 more pages
+                if "contents" in page_text.lower() and page_no + 3 < state["last_page"]:
+                    sys.stderr.write(f"  TOC found via OCR on page {page_no}. Continuing briefly...\n")
+                    state["last_page"] = page_no + 3
+
+    threads = [threading.Thread(target=rasterize)]
+    threads += [threading.Thread(target=recognize) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
     ocr_text = ""
-    try:
-        # Convert PDF to images page-by-page to save memory
-        for i in range(1, max_pages + 1):
-            images = convert_from_path(pdf_path, first_page=i, last_page=i, dpi=200)
-            if not images:
-                break
-            page_text = pytesseract.image_to_string(images[0])
-            ocr_text += page_text + "\n"
-            
-            # Early exit if we find TOC-like structure
-            if "contents" in page_text.lower() or "table of contents" in page_text.lower():
-                # If we found the start of TOC, maybe grab 2 more pages and stop
-                sys.stderr.write(f"  TOC found via OCR on page {i}. Continuing briefly...\n")
-                # Continue for at most 3 more pages
-                for j in range(i+1, min(i+4, max_pages + 1)):
-                    imgs = convert_from_path(pdf_path, first_page=j, last_page=j, dpi=200)
-                    if imgs:
-                        ocr_text += pytesseract.image_to_string(imgs[0]) + "\n"
-                break
-    except Exception as e:
-        sys.stderr.write(f"  OCR Error: {e}\n")
+    for page_no in sorted(page_texts):
+        if page_no <= state["last_page"]:
+            ocr_text += page_texts[page_no] + "\n"
     return ocr_text
 
-def extract_tokens_from_toc(filepath):
+def read_text_layer(filepath):
+    """Returns the relevant pages of a PDF's text layer (first MAX_PAGES_TEXT pages)."""
+    sys.stderr.write(f"  Scanning first {MAX_PAGES_TEXT} pages for TOC/Abstract...\n")
+    # Only the pages that can be scanned get a pdfplumber Page object
+    with pdfplumber.open(filepath, pages=range(1, MAX_PAGES_TEXT + 1)) as pdf:
+        pages = iter_pdf_pages(pdf)
+        try:
+            return select_relevant_pages(pages)
+        finally:
+            pages.close()
+
+def extract_document_text(filepath, route=None):
+    """Returns the TOC/abstract text of a PDF or DJVU (outline, text layer or OCR).
+
+    route is the classify_document() decision for the file; it is probed here if not given.
+    """
     # Support .pdf.1, .djvu.1 etc.
     filename_lower = filepath.lower()
     full_text = ""
@@ -117,47 +313,37 @@ def extract_tokens_from_toc(filepath):
         full_text = extract_tokens_from_djvu(filepath)
     elif ".pdf" in filename_lower:
         sys.stderr.write(f"Processing PDF: {filepath}\n")
+        if route is None:
+            route, _ = classify_document(filepath)
         try:
-            with pdfplumber.open(filepath) as pdf:
+            if route == ROUTE_OCR:
+                # Scanned book: no text layer to look for
+                sys.stderr.write("  No text layer found. Performing OCR...\n")
+                full_text = get_ocr_text(filepath, max_pages=MAX_PAGES_OCR)
+
+                # The sampled pages may have been image-only while later ones have a text layer
+                if len(full_text.strip()) < MIN_TEXT_CHARS:
+                    layer_text = read_text_layer(filepath)
+                    if len(layer_text.strip()) > len(full_text.strip()):
+                        sys.stderr.write("  OCR yielded very little. Using the text layer instead.\n")
+                        add_count("route_fallback_text")
+                        full_text = layer_text
+            else:
                 # 1. Digital Outline
-                if hasattr(pdf, 'outline') and pdf.outline:
+                if route == ROUTE_OUTLINE:
                     sys.stderr.write("  Found digital outline.\n")
-                    for item in pdf.outline:
-                        if isinstance(item, dict):
-                            full_text += item.get('title', '') + " "
-                
-                # 2. Visual Scan (First 50 pages)
+                    with timed("outline"):
+                        with pdfplumber.open(filepath) as pdf:
+                            full_text = outline_text(pdf.doc)
+
+                # 2. Visual Scan (First 50 pages, each parsed once)
                 if not full_text.strip():
-                    sys.stderr.write(f"  Scanning first {MAX_PAGES_TEXT} pages for TOC/Abstract...\n")
-                    found_relevant = False
-                    pages_to_extract = []
-                    
-                    limit = min(len(pdf.pages), MAX_PAGES_TEXT)
-                    for i in range(limit):
-                        p_text = pdf.pages[i].extract_text(x_tolerance=1)
-                        if not p_text: continue
-                        
-                        lower_text = p_text.lower()
-                        # Check for TOC or Abstract
-                        if "contents" in lower_text or "abstract" in lower_text or "introduction" in lower_text:
-                            found_relevant = True
-                            # Extract this page and the next few
-                            for j in range(i, min(i + 5, limit)):
-                                pages_to_extract.append(j)
-                            break
-                    
-                    # If nothing found, just take the first 5 pages anyway as fallback
-                    if not found_relevant:
-                        pages_to_extract = list(range(min(5, len(pdf.pages))))
-                    
-                    for p_idx in sorted(list(set(pages_to_extract))):
-                        txt = pdf.pages[p_idx].extract_text(x_tolerance=1)
-                        if txt:
-                            full_text += txt + "\n"
+                    full_text = read_text_layer(filepath)
 
                 # 3. OCR Fallback if still no text (First 25 pages)
-                if not full_text.strip() or len(full_text.strip()) < 100:
+                if len(full_text.strip()) < MIN_TEXT_CHARS:
                     sys.stderr.write("  Text extraction yielded very little. Falling back to OCR...\n")
+                    add_count("route_fallback_ocr")
                     full_text = get_ocr_text(filepath, max_pages=MAX_PAGES_OCR)
                 else:
                     sys.stderr.write(f"  Extracted {len(full_text)} chars using pdfplumber.\n")
@@ -165,6 +351,10 @@ def extract_tokens_from_toc(filepath):
         except Exception as e:
             sys.stderr.write(f"  Error reading PDF {filepath}: {e}\n")
 
+    return full_text
+
+def extract_tokens_from_text(full_text):
+    """Returns the glossary terms and noun-phrase candidates found in document text."""
     if not full_text.strip():
         sys.stderr.write("  No text extracted from document.\n")
         return []
@@ -174,30 +364,13 @@ def extract_tokens_from_toc(filepath):
     tokens = set(get_tokens_from_text(full_text))
     
     # Supplemental: Use NLTK to find potential technical terms not in glossary
-    clean_txt = clean_text(full_text)
-    words = word_tokenize(clean_txt.lower())
-    
-    # We'll use a simplified version of the previous is_technical_token logic 
-    # to add high-quality candidates even if not in glossary
-    stop_words = set(stopwords.words('english'))
-    
-    # Bigrams/Trigrams that look technical
-    bi = list(ngrams(words, 2))
-    tri = list(ngrams(words, 3))
-    
-    candidates = [" ".join(g) for g in bi] + [" ".join(g) for g in tri]
-    
-    for cand in candidates:
-        # Heuristic: if it's 2-3 words, not stopwords, and looks like a noun phrase
-        cand_words = cand.split()
-        if all(len(w) > 2 for w in cand_words) and not any(w in stop_words for w in cand_words):
-            # Check POS tags
-            tags = pos_tag(cand_words)
-            if all(t.startswith('NN') or t.startswith('JJ') for w, t in tags):
-                tokens.add(cand)
+    tokens.update(extract_noun_phrases(full_text))
 
     return sorted(list(tokens))
 
+def extract_tokens_from_toc(filepath):
+    return extract_tokens_from_text(extract_document_text(filepath))
+
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Usage: python3 extract_toc_tokens.py <file_path>")
@@ -3,15 +3,35 @@ import json
 import hashlib
 import subprocess
 import sys
+import time
 import concurrent.futures
 import argparse
 
+from content_cache import file_stat_signature
+from index_format import is_current_format
+from indexing_metrics import METRICS_FILE, MetricsWriter
+from indexing_pool import IndexingPool
+from library_scan import SCAN_WORKERS, ScanManifest, is_library_file, scan_library
+from library_watch import ChangeCollector, start_watching
+from merge_metadata import merge_json_files
+from search_index import SearchIndex
+from text_layer import ROUTE_OCR, ROUTE_OUTLINE, ROUTE_TEXT, classify_document
+
 CACHE_DIR = ".metadata_cache"
 DB_FILE = "library.json"
+INDEX_FILE = "library.idx"
 EXTS = {".pdf", ".djvu", ".epub", ".mobi"}
 INDEXING_TIMEOUT = 900  # 15 minutes in seconds
 
-def get_file_hash(filepath):
+# Rough per-file cost model for scheduling; only the resulting order matters
+READ_BYTES_PER_SECOND = 100 * 1024 * 1024  # the SHA-256 digest reads the whole file
+BYTES_PER_PAGE = 100 * 1024                # page count estimate when it is unknown (e.g. DJVU)
+TEXT_SECONDS_PER_PAGE = 0.1                # pdfplumber / djvutxt, first 50 pages at most
+OCR_SECONDS_PER_PAGE = 4.0                 # rasterize + tesseract, first 25 pages at most
+OUTLINE_SECONDS = 0.5
+
+def get_header_hash(filepath):
+    """md5 of the first 8 KB; the change check used by cache entries written before _stat."""
     try:
         hasher = hashlib.md5()
         with open(filepath, 'rb') as f:
@@ -21,85 +41,250 @@ def get_file_hash(filepath):
     except:
         return None
 
+def get_cache_key(filepath):
+    return hashlib.md5(filepath.encode()).hexdigest()
+
+def get_cache_path(filepath):
+    return os.path.join(CACHE_DIR, f"{get_cache_key(filepath)}.json")
+
+def cache_entry_is_current(filepath, file_stat, dry_run):
+    """Checks a file that has no manifest row against its cache entry (first run after an upgrade)."""
+    cache_path = get_cache_path(filepath)
+    if not os.path.exists(cache_path):
+        return False
+    with open(cache_path, 'r') as f:
+        try:
+            cached_data = json.load(f)
+        except ValueError:
+            return False
+    if cached_data.get("_stat") == file_stat:
+        return True
+    if "_stat" not in cached_data and cached_data.get("_hash") == get_header_hash(filepath):
+        # Entry from before stat signatures: adopt it rather than re-extracting
+        if not dry_run:
+            save_metadata(filepath, file_stat, cached_data)
+        return True
+    return False
+
+def save_metadata(filepath, file_stat, meta):
+    """Writes the metadata of one indexed file to its path-keyed cache entry.
+
+    _stat is the (size, mtime, inode) seen before indexing; _hash, the content
+    digest, is filled in by extract_metadata().
+    """
+    cache_path = get_cache_path(filepath)
+    meta["_stat"] = file_stat
+    meta["_path"] = filepath
+
+    with open(cache_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+
 def index_single_file(task_tuple):
+    """Indexes one file in its own python3 process; returns (result, metrics or None)."""
     filepath, full_mode = task_tuple
     filepath = os.path.relpath(filepath)
     print(f"Indexing {filepath} ...")
     
-    file_hash = get_file_hash(filepath)
-    if not file_hash: return False
+    file_stat = file_stat_signature(filepath)
+    if not file_stat: return False, None
 
-    cache_key = hashlib.md5(filepath.encode()).hexdigest()
-    cache_path = os.path.join(CACHE_DIR, f"{cache_key}.json")
-    
+    start = time.perf_counter()
     try:
         env = os.environ.copy()
         if not full_mode:
             env["SKIP_WIKI"] = "1"
             
         result = subprocess.run(
-            ["python3", "library_indexer.py", filepath],
+            ["python3", "library_indexer.py", "--metrics", filepath],
             capture_output=True, text=True, check=True, env=env,
             timeout=INDEXING_TIMEOUT
         )
-        meta = json.loads(result.stdout)
-        meta["_hash"] = file_hash
-        meta["_path"] = filepath 
-        
-        with open(cache_path, 'w') as f:
-            json.dump(meta, f, indent=2)
-        return True
+        output = json.loads(result.stdout)
+        save_metadata(filepath, file_stat, output["metadata"])
+        # Wall time includes the interpreter start-up that this mode pays per file
+        metrics = output["metrics"]
+        metrics["seconds"] = time.perf_counter() - start
+        return True, metrics
     except subprocess.TimeoutExpired:
         print(f"  WARNING: Indexing timed out for {filepath} after {INDEXING_TIMEOUT/60} minutes. Skipping.")
-        return {"path": filepath, "error": "TimeoutExpired"}
+        return {"path": filepath, "error": "TimeoutExpired"}, None
     except Exception as e:
         print(f"  Failed to index {filepath}: {e}")
-        return {"path": filepath, "error": str(e)}
+        return {"path": filepath, "error": str(e)}, None
+
+def record_metrics(metrics_writer, filepath, file_stat, result, classification, metrics):
+    if metrics_writer is None:
+        return
+    metrics = dict(metrics or {})
+    seconds = metrics.pop("seconds", None)
+    if seconds is None and isinstance(result, dict) and result.get("error") == "TimeoutExpired":
+        seconds = INDEXING_TIMEOUT
+    route, pages = classification
+    status = "ok" if result is True else "error"
+    metrics_writer.file(filepath, status, seconds or 0.0, metrics, route=route, pages=pages, size=file_stat[0])
+
+def effective_classification(classification, metrics):
+    """Returns the route extraction actually took; a fallback from the classified one shows in its counts."""
+    route, pages = classification
+    counts = (metrics or {}).get("counts", {})
+    if counts.get("route_fallback_text"):
+        return ROUTE_TEXT, pages
+    if counts.get("route_fallback_ocr"):
+        return ROUTE_OCR, pages
+    return classification
+
+def record_result(manifest, filepath, file_stat, result, classification=(None, None), metrics=None):
+    # A misrouted file is recorded with the route that worked, so its next indexing goes straight there
+    status = "indexed" if result is True else "failed"
+    manifest.record(filepath, file_stat, get_cache_key(filepath), status,
+                    *effective_classification(classification, metrics), header=get_header_hash(filepath))
+
+def classify_files(to_index, file_stats, known, manifest, workers=SCAN_WORKERS):
+    """Returns {path: (route, pages)} for the files to index.
+
+    The decision recorded in the manifest is reused while the file's stat signature
+    matches (e.g. a retry after a failure), then for any file recorded with the same
+    size and header hash: the same content touched, moved or copied, which the
+    content cache will serve anyway. Other files are probed concurrently.
+    """
+    classifications = {}
+    unmatched = []
+    for filepath in to_index:
+        row = known.get(filepath)
+        if row is not None and row[0] == file_stats[filepath] and row[3] is not None:
+            classifications[filepath] = (row[3], row[4])
+        else:
+            unmatched.append(filepath)
+    if unmatched:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            to_probe = []
+            # The manifest connection stays on this thread; only the header reads are concurrent
+            for filepath, header in zip(unmatched, executor.map(get_header_hash, unmatched)):
+                recorded = manifest.route_for_content(file_stats[filepath][0], header) if header else None
+                if recorded is not None:
+                    classifications[filepath] = recorded
+                else:
+                    to_probe.append(filepath)
+            classifications.update(zip(to_probe, executor.map(classify_document, to_probe)))
+    return classifications
+
+def estimate_cost(file_stat, classification):
+    """Estimated seconds to index a file, from its size, page count and route."""
+    route, pages = classification
+    size = file_stat[0]
+    pages = pages or max(1, size // BYTES_PER_PAGE)
+    cost = size / READ_BYTES_PER_SECOND
+    if route == ROUTE_OCR:
+        cost += min(pages, 25) * OCR_SECONDS_PER_PAGE
+    elif route == ROUTE_OUTLINE:
+        cost += OUTLINE_SECONDS
+    else:
+        cost += min(pages, 50) * TEXT_SECONDS_PER_PAGE
+    return cost
+
+def schedule(to_index, file_stats, classifications):
+    """Longest jobs first, so slow OCR jobs overlap the quick ones instead of trailing at the end of the run."""
+    return sorted(to_index, key=lambda filepath: -estimate_cost(file_stats[filepath], classifications[filepath]))
+
+def default_ocr_jobs(cores):
+    # Each OCR job already runs two tesseract processes (OCR_WORKERS in extract_toc_tokens)
+    return max(1, cores // 2)
+
+def index_batch(pool, to_index, file_stats, classifications, manifest, ocr_jobs, metrics_writer=None):
+    """Indexes files on an open IndexingPool in the given order, saving each result as it arrives.
+
+    At most ocr_jobs OCR files are processed at once; text files fill the other workers.
+    """
+    results = []
+    tasks = [(filepath, classifications[filepath][0]) for filepath in to_index]
+    for (filepath, _route), status, value, metrics in pool.imap_unordered(
+            tasks, kind=lambda task: task[1], limits={ROUTE_OCR: ocr_jobs}):
+        if status == "ok":
+            save_metadata(filepath, file_stats[filepath], value)
+            print(f"Indexed {filepath}")
+            result = True
+        elif status == "timeout":
+            print(f"  WARNING: Indexing timed out for {filepath} after {INDEXING_TIMEOUT/60} minutes. Skipping.")
+            result = {"path": filepath, "error": "TimeoutExpired"}
+        else:
+            print(f"  Failed to index {filepath}: {value}")
+            result = {"path": filepath, "error": value}
+        record_result(manifest, filepath, file_stats[filepath], result, classifications[filepath], metrics)
+        record_metrics(metrics_writer, filepath, file_stats[filepath], result, classifications[filepath], metrics)
+        results.append(result)
+    return results
+
+def index_with_pool(to_index, file_stats, classifications, full_mode, cores, manifest, ocr_jobs, metrics_writer=None):
+    """Indexes files in pre-warmed worker processes, saving each result as it arrives."""
+    with IndexingPool(cores, full_mode=full_mode, timeout=INDEXING_TIMEOUT) as pool:
+        return index_batch(pool, to_index, file_stats, classifications, manifest, ocr_jobs, metrics_writer)
+
+def index_is_stale():
+    """True if INDEX_FILE is missing, in another format version or older than DB_FILE (e.g. edited by auxiliary/)."""
+    if not is_current_format(INDEX_FILE):
+        return True
+    try:
+        return os.stat(INDEX_FILE).st_mtime_ns < os.stat(DB_FILE).st_mtime_ns
+    except OSError:
+        return True
+
+def publish_index(library_paths, metrics_writer=None):
+    """Merges the cache into library.json and rebuilds library.idx if anything changed."""
+    # Merge only the cache entries that changed, pruning files that left the library
+    print("Merging metadata...")
+    start = time.perf_counter()
+    db_changed = merge_json_files(CACHE_DIR, DB_FILE, existing_paths=library_paths)
+    if metrics_writer is not None:
+        metrics_writer.stage("merge", time.perf_counter() - start)
 
-def run_indexer(dry_run=False, full_mode=False, cores=1):
-    if not os.path.exists(CACHE_DIR):
+    # Binary search index for the server (written after the JSON so it is never older)
+    if db_changed or index_is_stale():
+        start = time.perf_counter()
+        with open(DB_FILE, 'r') as f:
+            all_meta = json.load(f)
+        SearchIndex.build(all_meta).save(INDEX_FILE)
+        print(f"Search index updated: {INDEX_FILE}")
+        if metrics_writer is not None:
+            metrics_writer.stage("build_index", time.perf_counter() - start)
+
+def run_indexer(dry_run=False, full_mode=False, cores=1, mode="pool", scan_workers=SCAN_WORKERS, ocr_jobs=None):
+    # --dry-run writes nothing, not even an empty cache directory or manifest
+    if not dry_run and not os.path.exists(CACHE_DIR):
         os.makedirs(CACHE_DIR)
 
     skipped_count = 0
     to_index = []
+    file_stats = {}
 
     print("Scanning directory for files...")
-    for root, dirs, files in os.walk("."):
-        if "/." in root or CACHE_DIR in root:
-            continue
-            
-        for file in files:
-            file_lower = file.lower()
-            is_valid_ext = False
-            for ext in EXTS:
-                if ext in file_lower:
-                    is_valid_ext = True
-                    break
-            
-            if is_valid_ext:
-                filepath = os.path.relpath(os.path.join(root, file))
-                # Use path + hash for cache key
-                file_hash = get_file_hash(filepath)
-                if not file_hash: continue
-                
-                cache_key = hashlib.md5(filepath.encode()).hexdigest()
-                cache_path = os.path.join(CACHE_DIR, f"{cache_key}.json")
-                
-                # Check if we need to re-index
-                needs_indexing = True
-                if os.path.exists(cache_path):
-                    with open(cache_path, 'r') as f:
-                        try:
-                            cached_data = json.load(f)
-                            if cached_data.get("_hash") == file_hash:
-                                needs_indexing = False
-                        except:
-                            pass
-                
-                if needs_indexing:
-                    to_index.append(filepath)
-                else:
-                    skipped_count += 1
+    scan_start = time.perf_counter()
+    library_files = scan_library(EXTS, workers=scan_workers)
+    library_paths = set(library_files)
+
+    manifest = ScanManifest(readonly=dry_run)
+    known = manifest.load()
+    # One listing of the cache instead of a stat per file; a row is only trusted while its entry exists
+    cached_entries = set()
+    if os.path.isdir(CACHE_DIR):
+        cached_entries = {entry.name for entry in os.scandir(CACHE_DIR) if entry.name.endswith(".json")}
+    for filepath, file_stat in library_files.items():
+        if not file_stat: continue
+
+        # Unchanged since it was last indexed: no need to open the file or its cache entry
+        row = known.get(filepath)
+        if row is not None and f"{row[1]}.json" in cached_entries:
+            needs_indexing = not (row[0] == file_stat and row[2] == "indexed")
+        else:
+            needs_indexing = not cache_entry_is_current(filepath, file_stat, dry_run)
+            if not needs_indexing and not dry_run:
+                manifest.record(filepath, file_stat, get_cache_key(filepath), "indexed")
+
+        if needs_indexing:
+            to_index.append(filepath)
+            file_stats[filepath] = file_stat
+        else:
+            skipped_count += 1
+    scan_seconds = time.perf_counter() - scan_start
 
     if dry_run:
         if to_index:
@@ -109,21 +294,54 @@ def run_indexer(dry_run=False, full_mode=False, cores=1):
             print(f"\nTotal to index: {len(to_index)}")
         else:
             print("All files are up to date.")
+        manifest.close()
         return
 
-    print(f"Found {len(to_index)} files to index. Using {cores} core(s).")
+    print(f"Found {len(to_index)} files to index. Using {cores} core(s) ({mode} mode).")
+    if ocr_jobs is None:
+        ocr_jobs = default_ocr_jobs(cores)
+    metrics_writer = MetricsWriter(METRICS_FILE, mode=mode, cores=cores, ocr_jobs=ocr_jobs,
+                                   to_index=len(to_index), skipped=skipped_count)
+    metrics_writer.stage("scan", scan_seconds)
+
+    # Route each file to text extraction, OCR or its outline, and start the longest jobs first
+    classify_start = time.perf_counter()
+    classifications = classify_files(to_index, file_stats, known, manifest, workers=scan_workers)
+    to_index = schedule(to_index, file_stats, classifications)
+    metrics_writer.stage("classify", time.perf_counter() - classify_start)
+
+    # Files that left the library (after classifying, so a moved file finds its old row's route);
+    # their cache entries are pruned by the merge below
+    gone = [path for path in known if path not in library_paths]
+    if gone:
+        manifest.remove(gone)
+
+    ocr_count = sum(1 for route, _pages in classifications.values() if route == ROUTE_OCR)
+    if ocr_count:
+        limit_note = f" (at most {ocr_jobs} at a time)" if mode == "pool" else ""
+        print(f"{ocr_count} of them need OCR{limit_note}.")
     
     indexed_count = 0
     failures = []
 
-    # Prepare tasks (filepath, full_mode)
-    tasks = [(fp, full_mode) for fp in to_index]
-
-    if cores > 1:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=cores) as executor:
-            results = list(executor.map(index_single_file, tasks))
+    if mode == "pool":
+        results = index_with_pool(to_index, file_stats, classifications, full_mode, cores, manifest, ocr_jobs,
+                                  metrics_writer) if to_index else []
     else:
-        results = [index_single_file(t) for t in tasks]
+        # Prepare tasks (filepath, full_mode)
+        tasks = [(fp, full_mode) for fp in to_index]
+
+        # Each result is recorded as it completes, so an interrupted run resumes where it stopped
+        results = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, cores)) as executor:
+            futures = {executor.submit(index_single_file, t): t[0] for t in tasks}
+            for future in concurrent.futures.as_completed(futures):
+                filepath = futures[future]
+                res, metrics = future.result()
+                record_result(manifest, filepath, file_stats[filepath], res, classifications[filepath], metrics)
+                record_metrics(metrics_writer, filepath, file_stats[filepath], res, classifications[filepath], metrics)
+                results.append(res)
+    manifest.close()
 
     for res in results:
         if res is True:
@@ -141,27 +359,101 @@ def run_indexer(dry_run=False, full_mode=False, cores=1):
 
     print(f"Finished indexing. {indexed_count} new/updated, {skipped_count} skipped.")
     
-    # Merge
-    print("Merging metadata...")
-    all_meta = []
-    for cache_file in os.listdir(CACHE_DIR):
-        if cache_file.endswith(".json"):
-            with open(os.path.join(CACHE_DIR, cache_file), 'r') as f:
-                try:
-                    all_meta.append(json.load(f))
-                except:
-                    pass
-    
-    with open(DB_FILE, 'w') as f:
-        json.dump(all_meta, f, indent=2)
-    print(f"Database updated: {DB_FILE}")
+    publish_index(library_paths, metrics_writer)
+    metrics_writer.close()
+    if to_index:
+        print(f"Timings written to {METRICS_FILE} (summary: python3 indexing_metrics.py)")
+    return library_paths
+
+def watch_library(full_mode=False, cores=1, scan_workers=SCAN_WORKERS, ocr_jobs=None):
+    """Daemon mode: indexes files as they are added, changed, moved or deleted, and republishes the index."""
+    # 1. Start watching before the catch-up scan, so nothing copied in meanwhile is missed
+    collector = ChangeCollector()
+    mechanism = start_watching(collector, EXTS, workers=scan_workers)
+
+    # 2. Catch up with everything that changed while no daemon was running
+    if ocr_jobs is None:
+        ocr_jobs = default_ocr_jobs(cores)
+    library_paths = run_indexer(full_mode=full_mode, cores=cores, scan_workers=scan_workers, ocr_jobs=ocr_jobs)
+    print(f"Watching the library for changes ({mechanism}). Press Ctrl+C to stop.")
+
+    with IndexingPool(cores, full_mode=full_mode, timeout=INDEXING_TIMEOUT) as pool, ScanManifest() as manifest:
+        while True:
+            changed = collector.wait_batch()
+
+            # 3. Expand directory events: new directories are scanned, removed ones drop every file under them
+            candidates = set()
+            for path in changed:
+                if os.path.isdir(path):
+                    candidates.update(scan_library(EXTS, workers=scan_workers, top=path))
+                elif is_library_file(os.path.basename(path), EXTS):
+                    candidates.add(path)
+                prefix = path + os.sep
+                candidates.update(p for p in library_paths if p.startswith(prefix))
+
+            # 4. Deleted files leave the library; changed ones are re-indexed. A moved file is a
+            # delete plus an add, and its content is served from the content cache
+            to_index = []
+            file_stats = {}
+            removed = []
+            for filepath in sorted(candidates):
+                file_stat = file_stat_signature(filepath)
+                if file_stat is None or os.path.isdir(filepath):
+                    if filepath in library_paths:
+                        library_paths.discard(filepath)
+                        removed.append(filepath)
+                    continue
+                library_paths.add(filepath)
+                row = manifest.get(filepath)
+                if (row is None or row[0] != file_stat or row[2] != "indexed"
+                        or not os.path.exists(get_cache_path(filepath))):
+                    to_index.append(filepath)
+                    file_stats[filepath] = file_stat
+
+            if not to_index and not removed:
+                continue
+            # Each batch is a run of its own in the metrics file
+            metrics_writer = MetricsWriter(METRICS_FILE, mode="pool", cores=cores, ocr_jobs=ocr_jobs, watch=True,
+                                           to_index=len(to_index), removed=len(removed))
+            if to_index:
+                classify_start = time.perf_counter()
+                known = {filepath: manifest.get(filepath) for filepath in to_index}
+                classifications = classify_files(to_index, file_stats, known, manifest, workers=scan_workers)
+                to_index = schedule(to_index, file_stats, classifications)
+                metrics_writer.stage("classify", time.perf_counter() - classify_start)
+                index_batch(pool, to_index, file_stats, classifications, manifest, ocr_jobs, metrics_writer)
+            # Removed after classifying, so a moved file finds its old row's route
+            if removed:
+                manifest.remove(removed)
+                for filepath in removed:
+                    print(f"Removed {filepath}")
+
+            # 5. Publish; a running app.py picks the new library.idx up on its next check
+            publish_index(library_paths, metrics_writer)
+            metrics_writer.close()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Incremental Library Indexer")
     parser.add_argument("--dry-run", action="store_true", help="Show what would be indexed without doing it")
     parser.add_argument("--full", action="store_true", help="Enable full mode (e.g. Wikipedia expansion)")
     parser.add_argument("--cores", type=int, default=1, help="Number of parallel cores/threads to use")
+    parser.add_argument("--mode", choices=["pool", "subprocess"], default="pool",
+                        help="pool: pre-warmed worker processes (default); subprocess: one python3 process per file")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and index files as they are added, changed, moved or deleted")
+    parser.add_argument("--ocr-jobs", type=int, default=None,
+                        help="Files OCR'd at once in pool mode (default: half of --cores)")
+    parser.add_argument("--scan-workers", type=int, default=SCAN_WORKERS,
+                        help="Concurrent stat calls while scanning (raise for network filesystems)")
     
     args = parser.parse_args()
     
-    run_indexer(dry_run=args.dry_run, full_mode=args.full, cores=args.cores)
\ No newline at end of file
+    if args.watch:
+        try:
+            watch_library(full_mode=args.full, cores=args.cores, scan_workers=args.scan_workers,
+                          ocr_jobs=args.ocr_jobs)
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+    else:
+        run_indexer(dry_run=args.dry_run, full_mode=args.full, cores=args.cores, mode=args.mode,
+                    scan_workers=args.scan_workers, ocr_jobs=args.ocr_jobs)
\ No newline at end of file
@@ -0,0 +1,223 @@
+import array
+import json
+import mmap
+import os
+import struct
+import sys
+
+# On-disk layout of the binary search index:
+#   header  = magic, format version, length of the table of contents
+#   toc     = JSON {"byteorder", "meta", "sections": {name: [offset, length, typecode]}}
+#   body    = the sections, each aligned to ALIGNMENT bytes
+# Sections are raw array.array buffers (or UTF-8 bytes), so a reader can mmap
+# the file and use them in place without parsing anything per item.
+MAGIC = b"LIBIDX\x00\x00"
+FORMAT_VERSION = 4
+HEADER = struct.Struct("<8sII")
+ALIGNMENT = 8
+
+# Library item fields stored as columns; anything else goes to a per-item JSON "extra" column
+COLUMN_FIELDS = ["title", "author", "publisher", "year_edition", "type", "path", "filename"]
+LIST_COLUMN_FIELDS = ["keywords", "search_tokens"]
+# Fields of the compact item returned by /api/search by default, stored pre-serialized per item
+SUMMARY_FIELDS = COLUMN_FIELDS
+MISSING = 0xFFFFFFFF  # String id of an absent scalar field
+
+class StringTable:
+    """Read-only sequence of strings stored as UTF-8 bytes plus an offsets array."""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self.raw(i), 'utf-8')
+
+    def raw(self, i):
+        """Returns string i as UTF-8 bytes, without decoding it."""
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("string table index out of range")
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+def pack_strings(strings):
+    """Packs strings into (UTF-8 bytes, offsets array) for a StringTable."""
+    data = bytearray()
+    offsets = array.array('I', [0])
+    for s in strings:
+        data += s.encode('utf-8')
+        offsets.append(len(data))
+    return bytes(data), offsets
+
+def write_sections(path, sections, meta=None):
+    """Writes named sections (array.array or bytes) to path, replacing it atomically."""
+    toc = {"byteorder": sys.byteorder, "meta": meta or {}, "sections": {}}
+    layout = []
+    offset = 0
+    for name, section in sections.items():
+        if isinstance(section, array.array):
+            typecode, payload = section.typecode, section.tobytes()
+        else:
+            typecode, payload = 'B', bytes(section)
+        offset += -offset % ALIGNMENT
+        toc["sections"][name] = [offset, len(payload), typecode]
+        layout.append((offset, payload))
+        offset += len(payload)
+
+    toc_bytes = json.dumps(toc, separators=(',', ':')).encode('utf-8')
+    body_start = HEADER.size + len(toc_bytes)
+    body_start += -body_start % ALIGNMENT
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(toc_bytes)))
+        f.write(toc_bytes)
+        for section_offset, payload in layout:
+            f.seek(body_start + section_offset)
+            f.write(payload)
+    os.replace(tmp_path, path)
+
+def is_current_format(path):
+    """True if path starts with the header of this FORMAT_VERSION; reads the header only."""
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+    except OSError:
+        return False
+    if len(header) < HEADER.size:
+        return False
+    magic, version, _toc_length = HEADER.unpack(header)
+    return magic == MAGIC and version == FORMAT_VERSION
+
+def open_sections(path):
+    """Maps an index file and returns (meta, {name: memoryview}) without copying sections."""
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, toc_length = HEADER.unpack_from(mm, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a library index file")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"{path} has index format version {version}, expected {FORMAT_VERSION}")
+    toc = json.loads(mm[HEADER.size:HEADER.size + toc_length])
+    if toc["byteorder"] != sys.byteorder:
+        raise ValueError(f"{path} was written on a {toc['byteorder']}-endian machine")
+
+    body_start = HEADER.size + toc_length
+    body_start += -body_start % ALIGNMENT
+    view = memoryview(mm)
+    sections = {}
+    for name, (offset, length, typecode) in toc["sections"].items():
+        section = view[body_start + offset:body_start + offset + length]
+        sections[name] = section if typecode == 'B' else section.cast(typecode)
+    return toc["meta"], sections
+
+def summary_json(item):
+    """Compact JSON of an item's SUMMARY_FIELDS, as served by /api/search."""
+    return json.dumps({field: item[field] for field in SUMMARY_FIELDS if field in item},
+                      separators=(',', ':'), ensure_ascii=False)
+
+def pack_summaries(documents):
+    """Packs the summary_json() of each item for a StringTable."""
+    return pack_strings(summary_json(item) for item in documents)
+
+def pack_documents(documents):
+    """Packs library items into column sections: interned strings plus per-field id arrays."""
+    interned = {}
+    def intern(s):
+        string_id = interned.get(s)
+        if string_id is None:
+            string_id = interned[s] = len(interned)
+        return string_id
+
+    columns = {field: array.array('I') for field in COLUMN_FIELDS}
+    list_offsets = {field: array.array('I', [0]) for field in LIST_COLUMN_FIELDS}
+    list_ids = {field: array.array('I') for field in LIST_COLUMN_FIELDS}
+    list_present = {field: bytearray() for field in LIST_COLUMN_FIELDS}
+    extras = []
+
+    for item in documents:
+        extra = {}
+        for field in COLUMN_FIELDS:
+            value = item.get(field)
+            if isinstance(value, str):
+                columns[field].append(intern(value))
+            else:
+                columns[field].append(MISSING)
+                if field in item:
+                    extra[field] = value
+        for field in LIST_COLUMN_FIELDS:
+            values = item.get(field)
+            if isinstance(values, list) and all(isinstance(v, str) for v in values):
+                list_ids[field].extend(intern(v) for v in values)
+                list_present[field].append(1)
+            else:
+                list_present[field].append(0)
+                if field in item:
+                    extra[field] = values
+            list_offsets[field].append(len(list_ids[field]))
+        for key, value in item.items():
+            if key not in COLUMN_FIELDS and key not in LIST_COLUMN_FIELDS:
+                extra[key] = value
+        extras.append(json.dumps(extra, separators=(',', ':')) if extra else "")
+
+    sections = {}
+    sections["doc.strings.data"], sections["doc.strings.offsets"] = pack_strings(interned)
+    sections["doc.extra.data"], sections["doc.extra.offsets"] = pack_strings(extras)
+    sections["doc.summary.data"], sections["doc.summary.offsets"] = pack_summaries(documents)
+    for field in COLUMN_FIELDS:
+        sections[f"doc.{field}"] = columns[field]
+    for field in LIST_COLUMN_FIELDS:
+        sections[f"doc.{field}.offsets"] = list_offsets[field]
+        sections[f"doc.{field}.ids"] = list_ids[field]
+        sections[f"doc.{field}.present"] = bytes(list_present[field])
+    return sections
+
+class DocumentStore:
+    """Sequence of library items decoded on access from the column sections of an index file."""
+
+    def __init__(self, sections):
+        self.strings = StringTable(sections["doc.strings.data"], sections["doc.strings.offsets"])
+        self.extras = StringTable(sections["doc.extra.data"], sections["doc.extra.offsets"])
+        self.summaries = StringTable(sections["doc.summary.data"], sections["doc.summary.offsets"])
+        self.columns = {field: sections[f"doc.{field}"] for field in COLUMN_FIELDS}
+        self.lists = {
+            field: (sections[f"doc.{field}.offsets"], sections[f"doc.{field}.ids"], sections[f"doc.{field}.present"])
+            for field in LIST_COLUMN_FIELDS
+        }
+
+    def __len__(self):
+        return len(self.extras)
+
+    def __getitem__(self, i):
+        return self.project(i)
+
+    def project(self, i, fields=None):
+        """Returns item i, or only its given fields; unrequested columns are not decoded."""
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("document index out of range")
+        item = {}
+        for field, column in self.columns.items():
+            if column[i] != MISSING and (fields is None or field in fields):
+                item[field] = self.strings[column[i]]
+        for field, (offsets, ids, present) in self.lists.items():
+            if present[i] and (fields is None or field in fields):
+                item[field] = [self.strings[s] for s in ids[offsets[i]:offsets[i + 1]]]
+        extra = self.extras[i]
+        if extra:
+            extra = json.loads(extra)
+            item.update(extra if fields is None else {k: v for k, v in extra.items() if k in fields})
+        return item
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import threading
+from contextlib import contextmanager
+
+METRICS_FILE = "indexing_metrics.jsonl"
+SLOWEST_FILES = 10
+RUNS_KEPT = 50  # Older runs are dropped from the metrics file when a new one starts
+
+# Timings of the file being indexed in this process: stage -> [seconds per call]
+_lock = threading.Lock()
+_current = {"stages": {}, "counts": {}}
+
+def begin_file():
+    """Starts collecting the timings of a new file in this process."""
+    global _current
+    with _lock:
+        _current = {"stages": {}, "counts": {}}
+
+def end_file():
+    """Returns the timings collected since begin_file()."""
+    with _lock:
+        return _current
+
+@contextmanager
+def timed(stage):
+    """Adds the duration of the block to stage; safe to use from several threads (e.g. OCR pages)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            _current["stages"].setdefault(stage, []).append(elapsed)
+
+def add_count(name, n=1):
+    """Adds n to a per-file counter (pages scanned, cache hits, ...)."""
+    with _lock:
+        _current["counts"][name] = _current["counts"].get(name, 0) + n
+
+class MetricsWriter:
+    """Appends one JSON line per event to the metrics file as the run progresses.
+
+    Each run (or watch-mode batch) starts with a "run" line, then one "file" line
+    follows per indexed file and a "stage" line for each main-process stage (scan,
+    classify, merge). Only the last RUNS_KEPT runs are kept.
+    """
+
+    def __init__(self, path=METRICS_FILE, keep=RUNS_KEPT, **run_info):
+        if os.path.exists(path):
+            runs = split_runs(load_metrics(path))
+            if len(runs) >= keep:
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'w') as f:
+                    for record in (r for run in runs[len(runs) - keep + 1:] for r in run):
+                        f.write(json.dumps(record, separators=(',', ':')) + "\n")
+                os.replace(tmp_path, path)
+        self.f = open(path, 'a')
+        self.write({"type": "run", "started": time.time(), **run_info})
+
+    def write(self, record):
+        self.f.write(json.dumps(record, separators=(',', ':')) + "\n")
+        self.f.flush()
+
+    def stage(self, name, seconds):
+        self.write({"type": "stage", "stage": name, "seconds": seconds})
+
+    def file(self, path, status, seconds, metrics=None, **info):
+        record = {"type": "file", "path": path, "status": status, "seconds": seconds, **info}
+        if metrics:
+            record.update(metrics)
+        self.write(record)
+
+    def close(self):
+        self.write({"type": "end", "finished": time.time()})
+        self.f.close()
+
+def percentile(values, p):
+    """Nearest-rank percentile of a non-empty list."""
+    values = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(values)))
+    return values[rank - 1]
+
+def load_metrics(path):
+    records = []
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue  # blank, or cut short by an interrupted run
+    return records
+
+def split_runs(records):
+    """Splits the records of a metrics file into runs, each starting with its "run" record."""
+    runs = []
+    for r in records:
+        if r.get("type") == "run" or not runs:
+            runs.append([])
+        runs[-1].append(r)
+    return runs
+
+def last_runs(records, count=1, include_empty=False):
+    """Returns the last count runs that indexed files (any runs with include_empty).
+
+    A run with nothing to index only records its scan; it is shown when no run did more.
+    """
+    runs = split_runs(records)
+    if not include_empty:
+        busy = [run for run in runs if any(r["type"] == "file" for r in run)]
+        runs = busy or runs[-1:]
+    return runs[-count:]
+
+def format_report(records):
+    """Returns the summary of a metrics file: throughput, per-stage p50/p95 and the slowest files."""
+    run = next((r for r in records if r["type"] == "run"), {})
+    end = next((r for r in records if r["type"] == "end"), None)
+    files = [r for r in records if r["type"] == "file"]
+    lines = []
+
+    # 1. Throughput
+    elapsed = end["finished"] - run["started"] if end and run else 0
+    pages = sum(r.get("counts", {}).get("pages_text", 0) + r.get("counts", {}).get("pages_ocr", 0) for r in files)
+    ok = sum(1 for r in files if r["status"] == "ok")
+    started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(run["started"])) if "started" in run else "?"
+    kind = "Watch batch" if run.get("watch") else "Run"
+    lines.append(f"{kind} {started}: {run.get('mode', '?')} mode, {run.get('cores', '?')} core(s), "
+                 f"{len(files)} files ({ok} ok), {run.get('skipped', 0)} skipped, {elapsed:.1f} s")
+    if elapsed > 0:
+        lines.append(f"Throughput: {len(files) / elapsed * 60:.1f} files/min, {pages / elapsed:.2f} pages/s")
+    misrouted = [r for r in files if r.get("counts", {}).get("route_fallback_text") or r.get("counts", {}).get("route_fallback_ocr")]
+    if misrouted:
+        lines.append(f"Misrouted: {len(misrouted)} file(s) fell back from their classified route (text layer <-> OCR)")
+    for r in records:
+        if r["type"] == "stage":
+            lines.append(f"  {r['stage']}: {r['seconds']:.2f} s")
+
+    # 2. Per-stage distributions, per file and per call (e.g. per OCR page)
+    per_file = {}
+    per_call = {}
+    for r in files:
+        for stage, samples in r.get("stages", {}).items():
+            per_file.setdefault(stage, []).append(sum(samples))
+            per_call.setdefault(stage, []).extend(samples)
+    if files:
+        per_file["total"] = [r["seconds"] for r in files]
+    if per_file:
+        lines.append("")
+        lines.append(f"{'stage':<16}{'files':>7}{'p50/file':>11}{'p95/file':>11}{'calls':>8}{'p50/call':>11}{'p95/call':>11}{'total':>10}")
+        for stage in sorted(per_file, key=lambda s: -sum(per_file[s])):
+            values = per_file[stage]
+            calls = per_call.get(stage, values)
+            lines.append(f"{stage:<16}{len(values):>7}{percentile(values, 50):>10.3f}s{percentile(values, 95):>10.3f}s"
+                         f"{len(calls):>8}{percentile(calls, 50):>10.3f}s{percentile(calls, 95):>10.3f}s{sum(values):>9.1f}s")
+
+    # 3. Slowest files
+    if files:
+        lines.append("")
+        lines.append(f"Slowest {min(SLOWEST_FILES, len(files))} files:")
+        for r in sorted(files, key=lambda r: -r["seconds"])[:SLOWEST_FILES]:
+            lines.append(f"  {r['seconds']:8.2f} s  {r.get('route') or '-':<8} {r['status']:<8} {r['path']}")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize the indexing metrics file")
+    parser.add_argument("path", nargs="?", default=METRICS_FILE)
+    parser.add_argument("--runs", type=int, default=1, help="Number of recent runs to summarize")
+    parser.add_argument("--all", action="store_true", help="Include runs that had nothing to index")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        print(f"Metrics file not found: {args.path} (run the indexer first)")
+        sys.exit(1)
+    runs = last_runs(load_metrics(args.path), args.runs, include_empty=args.all)
+    print("\n\n".join(format_report(run) for run in runs))
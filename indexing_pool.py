@@ -0,0 +1,202 @@
+import os
+import sys
+import time
+import multiprocessing
+from multiprocessing.connection import wait
+
+WORKER_LOG_DIR = os.path.join(".metadata_cache", "worker_logs")
+
+def _worker_main(conn, full_mode, log_path):
+    """Long-lived worker: loads the extraction stack once, then indexes one file per request.
+
+    A task is the tuple of arguments for extract_metadata(), e.g. (filepath, route).
+    """
+    if not full_mode:
+        os.environ["SKIP_WIKI"] = "1"
+
+    # Pre-warm: NLTK, pdfplumber, pytesseract and the glossary are imported once per worker
+    from library_indexer import extract_metadata
+    from indexing_metrics import begin_file, end_file
+
+    # OCR jobs run their own tesseract threads; keep each tesseract single-threaded
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+    # Progress messages went to a captured pipe in the subprocess mode; keep the console readable but
+    # keep them, with anything native code or pdftoppm/tesseract write to fd 2, in this worker's log
+    log = open(log_path, 'a', buffering=1)
+    os.dup2(log.fileno(), 2)
+    sys.stderr = log
+
+    conn.send(("ready", None, None))
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        begin_file()
+        sys.stderr.write(f"--- {time.strftime('%Y-%m-%d %H:%M:%S')} {task[0]}\n")
+        start = time.perf_counter()
+        try:
+            status, value = "ok", extract_metadata(*task)
+        except Exception as e:
+            status, value = "error", f"{type(e).__name__}: {e}"
+        metrics = end_file()
+        metrics["seconds"] = time.perf_counter() - start
+        conn.send((status, value, metrics))
+
+class _Worker:
+    def __init__(self, ctx, full_mode, log_path):
+        self.log_path = log_path
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, full_mode, log_path), daemon=True)
+        try:
+            self.process.start()
+        except Exception:
+            self.conn.close()
+            raise
+        finally:
+            child_conn.close()
+        self.ready = False
+        self.task = None
+        self.started = None
+
+    def assign(self, task):
+        self.task = task
+        self.started = time.monotonic()
+        self.conn.send(task)
+
+    def stop(self, force=False):
+        if force:
+            self.process.terminate()
+        else:
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+class IndexingPool:
+    """Pool of pre-warmed worker processes that call extract_metadata() directly.
+
+    Unlike concurrent.futures.ProcessPoolExecutor, each task is pinned to a known
+    worker, so a worker stuck on one file past the timeout can be killed and
+    replaced without disturbing the others.
+    """
+
+    def __init__(self, size, full_mode=False, timeout=None):
+        self.size = max(1, size)
+        self.full_mode = full_mode
+        self.timeout = timeout
+        self.ctx = multiprocessing.get_context()
+        self.workers = []
+        self.warmed = False  # a worker has started successfully, so the extraction stack itself works
+
+    def __enter__(self):
+        # One log per worker slot, started afresh with the pool; a replacement worker appends to its slot's log
+        os.makedirs(WORKER_LOG_DIR, exist_ok=True)
+        log_paths = [os.path.join(WORKER_LOG_DIR, f"worker-{i}.log") for i in range(self.size)]
+        for log_path in log_paths:
+            open(log_path, 'w').close()
+        self.workers = [_Worker(self.ctx, self.full_mode, log_path) for log_path in log_paths]
+        return self
+
+    def __exit__(self, *exc):
+        for worker in self.workers:
+            worker.stop(force=exc[0] is not None)
+        self.workers = []
+
+    def _next_task(self, pending, kind, limits):
+        """Removes and returns the first pending task whose class is below its limit, or None."""
+        if kind is None or not limits:
+            return pending.pop(0)
+        running = {}
+        for worker in self.workers:
+            if worker.task is not None:
+                running[kind(worker.task)] = running.get(kind(worker.task), 0) + 1
+        for i, task in enumerate(pending):
+            limit = limits.get(kind(task))
+            if limit is None or running.get(kind(task), 0) < limit:
+                return pending.pop(i)
+        return None
+
+    def _replace(self, worker):
+        """Replaces a stuck or dead worker; if no new one can be started, the pool shrinks."""
+        worker.stop(force=True)
+        i = self.workers.index(worker)
+        try:
+            self.workers[i] = _Worker(self.ctx, self.full_mode, worker.log_path)
+        except Exception as e:
+            del self.workers[i]
+            sys.stderr.write(f"Could not restart an indexing worker ({e}); {len(self.workers)} worker(s) left.\n")
+
+    def imap_unordered(self, tasks, kind=None, limits=None):
+        """Yields (task, status, value, metrics) as files finish.
+
+        Tasks are started in the given order. If kind is given, kind(task) names the
+        task's class and limits caps how many tasks of a class run at once (e.g. OCR
+        jobs); a task that would exceed its limit waits while later ones start.
+
+        status is "ok" (value is the metadata), "error" (value is the message)
+        or "timeout" (the worker was recycled). metrics holds the worker's timings
+        (see indexing_metrics), or None if the worker did not finish the task.
+        """
+        pending = list(tasks)
+        while pending or any(w.task is not None for w in self.workers):
+            if not self.workers:
+                # Every worker died and none could be restarted
+                for task in pending:
+                    yield task, "error", "No indexing worker left to run it", None
+                return
+
+            # Hand out work to idle, warmed-up workers
+            for worker in self.workers:
+                if worker.ready and worker.task is None and pending:
+                    task = self._next_task(pending, kind, limits)
+                    if task is None:
+                        break
+                    worker.assign(task)
+
+            # Wait for a result, but wake up in time to enforce the deadline
+            wait_for = 1.0
+            if self.timeout:
+                now = time.monotonic()
+                for worker in self.workers:
+                    if worker.task is not None:
+                        wait_for = min(wait_for, max(0.0, worker.started + self.timeout - now))
+            ready_conns = wait([w.conn for w in self.workers], timeout=wait_for)
+
+            for worker in list(self.workers):
+                if worker.conn in ready_conns:
+                    try:
+                        status, value, metrics = worker.conn.recv()
+                    except (EOFError, OSError):
+                        if not worker.ready:
+                            if not self.warmed:
+                                raise RuntimeError("Indexing worker failed to start (see errors above)")
+                            # Others have started, so this is not the extraction stack failing everywhere; do without it
+                            worker.stop(force=True)
+                            self.workers.remove(worker)
+                            sys.stderr.write(f"An indexing worker exited while starting; {len(self.workers)} worker(s) left.\n")
+                            continue
+                        # The worker died (e.g. a crash in a native library)
+                        task = worker.task
+                        self._replace(worker)
+                        if task is not None:
+                            yield task, "error", f"Worker process exited unexpectedly (see {worker.log_path})", None
+                        continue
+                    if status == "ready":
+                        worker.ready = self.warmed = True
+                        continue
+                    task, worker.task = worker.task, None
+                    yield task, status, value, metrics
+                elif (self.timeout and worker.task is not None
+                      and time.monotonic() - worker.started > self.timeout):
+                    task = worker.task
+                    self._replace(worker)
+                    yield task, "timeout", None, None
@@ -2,29 +2,22 @@ import os
 import re
 import json
 import sys
-import requests
 from bs4 import BeautifulSoup
-import nltk
-from nltk.corpus import stopwords
 
 # Import TOC extractor
 try:
-    from extract_toc_tokens import extract_tokens_from_toc
+    from extract_toc_tokens import extract_document_text, extract_tokens_from_text
 except ImportError:
     sys.stderr.write("Warning: extract_toc_tokens.py not found. TOC extraction disabled.\n")
-    def extract_tokens_from_toc(path): return []
+    def extract_document_text(path, route=None): return ""
+    def extract_tokens_from_text(text): return []
 
-# Ensure nltk resources are available (quietly)
-try:
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('stopwords', quiet=True)
+from content_cache import get_file_digest, load_content, save_content
+from wiki_client import fetch_extracts
+from indexing_metrics import add_count, end_file, timed
 
-# Configuration
-GLOSSARY_FILE = "glossary.json"
-STOPWORDS = set(stopwords.words('english'))
-# Add custom project-specific stopwords
-STOPWORDS.update({"vol", "volume", "edition", "ed", "theory", "applications", "methods", "unknown", "bookfi", "org"})
+# Glossary, stopwords, the shared glossary matcher and the precomputed expansions
+from token_utils import GLOSSARY_TERMS, EXPANSIONS, fallback_seed, get_tokens_from_text, title_seeds
 
 COMMON_PUBLISHERS = [
     "Wiley", "Springer", "Dover", "MIT Press", "Cambridge University Press", 
@@ -34,85 +27,8 @@ COMMON_PUBLISHERS = [
     "HarperCollins", "Simon & Schuster", "Macmillan", "Pergamon", "Butterworth"
 ]
 
-def load_glossary():
-    if os.path.exists(GLOSSARY_FILE):
-        with open(GLOSSARY_FILE, 'r') as f:
-            return set(json.load(f))
-    return set()
-
-GLOSSARY_TERMS = load_glossary()
-
-def get_tokens_from_text(text):
-    """Extracts technical terms from text using the glossary."""
-    if not text: return []
-    tokens = set()
-    # Normalize text
-    clean_text = re.sub(r'[^a-z0-9\s\-]', ' ', text.lower())
-    words = clean_text.split()
-    
-    for i in range(len(words)):
-        # Monograms
-        w = words[i].strip()
-        if len(w) > 2 and w in GLOSSARY_TERMS:
-            tokens.add(w)
-        
-        # Bigrams
-        if i < len(words) - 1:
-            bigram = f"{words[i]} {words[i+1]}"
-            if bigram in GLOSSARY_TERMS:
-                tokens.add(bigram)
-        
-        # Polygrams (Trigrams)
-        if i < len(words) - 2:
-            trigram = f"{words[i]} {words[i+1]} {words[i+2]}"
-            if trigram in GLOSSARY_TERMS:
-                tokens.add(trigram)
-                
-    return list(tokens)
-
-def fetch_wikipedia_content(query):
-    """Searches Wikipedia and returns text content of the primary page."""
-    search_url = f"https://en.wikipedia.org/w/api.php"
-    params = {
-        "action": "query",
-        "list": "search",
-        "srsearch": query,
-        "format": "json"
-    }
-    headers = {
-        "User-Agent": "ScientificLibraryIndexer/1.0 (contact: admin@example.com)"
-    }
-    try:
-        response = requests.get(search_url, params=params, headers=headers, timeout=10)
-        data = response.json()
-        search_results = data.get("query", {}).get("search", [])
-        
-        if not search_results:
-            return ""
-        
-        page_title = search_results[0]["title"]
-        
-        # Fetch actual page content
-        content_params = {
-            "action": "query",
-            "prop": "extracts",
-            "exintro": True,
-            "explaintext": True,
-            "titles": page_title,
-            "format": "json"
-        }
-        content_response = requests.get(search_url, params=content_params, headers=headers, timeout=10)
-        content_data = content_response.json()
-        pages = content_data.get("query", {}).get("pages", {})
-        
-        for page_id in pages:
-            return pages[page_id].get("extract", "")
-            
-    except Exception as e:
-        sys.stderr.write(f"Wikipedia fetch error for '{query}': {e}\n")
-    return ""
-
-def extract_metadata(filepath):
+def extract_metadata(filepath, route=None):
+    """Extracts the metadata of one library file; route is its classify_document() decision, if known."""
     filename = os.path.basename(filepath)
     name_no_ext = os.path.splitext(filename)[0]
     
@@ -191,45 +107,66 @@ def extract_metadata(filepath):
         # Heuristic: assume books unless keywords suggest otherwise
         metadata["type"] = "Book"
 
-    # 2. Token Extraction from Title
-    title_text = metadata["title"].lower()
-    # Initial seeds for Wikipedia search
-    seeds = get_tokens_from_text(title_text)
-    
-    # Add words from title that are not stopwords
-    title_words = re.sub(r'[^a-z0-9\s]', ' ', title_text).split()
-    for word in title_words:
-        if len(word) > 3 and word not in STOPWORDS:
-            seeds.append(word)
-    
-    seeds = sorted(list(set(seeds)))
+    # 2. Token Extraction from Title (also the initial seeds for Wikipedia search)
+    seeds = title_seeds(metadata["title"])
     metadata["search_tokens"].extend(seeds)
 
     # 3. Extract tokens from TOC (for PDFs and DJVUs)
+    # Text and tokens depend only on the file's bytes, so they are cached by content
+    # digest and reused for moved, renamed or duplicate files
+    with timed("hash"):
+        digest = get_file_digest(filepath)
+    metadata["_hash"] = digest
     filename_lower = filepath.lower()
     if ".pdf" in filename_lower or ".djvu" in filename_lower or ".djv" in filename_lower:
-        sys.stderr.write(f"Extracting content tokens from {os.path.basename(filepath)}...\n")
-        toc_tokens = extract_tokens_from_toc(filepath)
+        content = load_content(digest)
+        if content is not None:
+            add_count("content_cache_hits")
+            sys.stderr.write(f"Reusing cached content tokens for {os.path.basename(filepath)}\n")
+            toc_tokens = content["tokens"]
+        else:
+            sys.stderr.write(f"Extracting content tokens from {os.path.basename(filepath)}...\n")
+            full_text = extract_document_text(filepath, route)
+            toc_tokens = extract_tokens_from_text(full_text)
+            if full_text.strip():
+                save_content(digest, {"text": full_text, "tokens": toc_tokens})
         if toc_tokens:
             sys.stderr.write(f"  Found {len(toc_tokens)} tokens from content.\n")
             metadata["search_tokens"].extend(toc_tokens)
 
     # 4. Wikipedia Expansion
-    # To avoid excessive calls, limit to top 3 technical seeds
     if os.environ.get("SKIP_WIKI") == "1":
         sys.stderr.write("Skipping Wikipedia expansion (SKIP_WIKI=1)\n")
     else:
-        technical_seeds = [s for s in seeds if s in GLOSSARY_TERMS][:3]
-        if not technical_seeds and seeds:
-            # fallback to the longest word/phrase
-            technical_seeds = sorted(seeds, key=len, reverse=True)[:1]
+        technical_seeds = [s for s in seeds if s in GLOSSARY_TERMS]
 
+        # With the precomputed table every glossary seed is expanded locally; a term
+        # missing from it had no usable extract (or failed) when the table was built
         for seed in technical_seeds:
-            sys.stderr.write(f"Expanding token: {seed} via Wikipedia...\n")
-            wiki_text = fetch_wikipedia_content(seed)
-            if wiki_text:
-                wiki_tokens = get_tokens_from_text(wiki_text)
-                metadata["search_tokens"].extend(wiki_tokens)
+            if seed in EXPANSIONS:
+                add_count("expansion_hits")
+                metadata["search_tokens"].extend(EXPANSIONS[seed])
+
+        # Without the table, glossary seeds go to Wikipedia; to avoid excessive calls, limit to top 3
+        remote_seeds = [] if EXPANSIONS else technical_seeds[:3]
+        if not technical_seeds and seeds:
+            # fallback to the longest word/phrase; the table also holds those of the books it was built for
+            seed = fallback_seed(seeds)
+            if seed in EXPANSIONS:
+                add_count("expansion_hits")
+                metadata["search_tokens"].extend(EXPANSIONS[seed])
+            else:
+                remote_seeds = [seed]
+
+        if remote_seeds:
+            sys.stderr.write(f"Expanding tokens: {', '.join(remote_seeds)} via Wikipedia...\n")
+            with timed("wikipedia"):
+                wiki_texts = fetch_extracts(remote_seeds)
+            for seed in remote_seeds:
+                wiki_text = wiki_texts.get(seed)
+                if wiki_text:
+                    wiki_tokens = get_tokens_from_text(wiki_text)
+                    metadata["search_tokens"].extend(wiki_tokens)
 
     # Final cleanup
     metadata["search_tokens"] = sorted(list(set(metadata["search_tokens"])))
@@ -237,14 +174,20 @@ def extract_metadata(filepath):
     return metadata
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python3 library_indexer.py <file_path>")
+    # --metrics wraps the output as {"metadata": ..., "metrics": ...} (see indexing_metrics)
+    with_metrics = "--metrics" in sys.argv[1:]
+    args = [arg for arg in sys.argv[1:] if arg != "--metrics"]
+    if len(args) < 1:
+        print("Usage: python3 library_indexer.py [--metrics] <file_path>")
         sys.exit(1)
     
-    file_path = sys.argv[1]
+    file_path = args[0]
     if os.path.exists(file_path):
         meta = extract_metadata(file_path)
-        print(json.dumps(meta, indent=2))
+        if with_metrics:
+            print(json.dumps({"metadata": meta, "metrics": end_file()}))
+        else:
+            print(json.dumps(meta, indent=2))
     else:
         sys.stderr.write(f"File not found: {file_path}\n")
         sys.exit(1)
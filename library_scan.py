@@ -0,0 +1,155 @@
+import os
+import sqlite3
+import concurrent.futures
+from urllib.parse import quote
+
+from content_cache import stat_signature
+
+MANIFEST_FILE = os.path.join(".metadata_cache", "scan_manifest.sqlite")
+SCAN_WORKERS = 16  # stat() calls in flight; mostly waiting on the network for NAS-mounted libraries
+
+def is_library_file(name, exts):
+    """True if the file name contains one of the library extensions (also matches `.pdf.1`)."""
+    name_lower = name.lower()
+    return any(ext in name_lower for ext in exts)
+
+def _scan_dir(rel_dir, exts):
+    """Lists one directory: returns ([(path, stat signature or None)], [subdirectories])."""
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(rel_dir or ".") as it:
+            for entry in it:
+                path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if is_dir:
+                    # Hidden directories (including the metadata cache) are not part of the library
+                    if not entry.name.startswith("."):
+                        subdirs.append(path)
+                    continue
+                if entry.is_dir():
+                    continue  # symlink to a directory; not followed, like os.walk
+                if not is_library_file(entry.name, exts):
+                    continue
+                try:
+                    files.append((path, stat_signature(entry.stat())))
+                except OSError:
+                    files.append((path, None))
+    except OSError:
+        pass
+    return files, subdirs
+
+def is_hidden_path(path):
+    """True if any directory component of a relative path is hidden (e.g. the metadata cache)."""
+    return any(part.startswith(".") and part not in (".", "..") for part in os.path.dirname(path).split(os.sep))
+
+def scan_library(exts, workers=SCAN_WORKERS, top=""):
+    """Returns {relative path: [size, mtime_ns, inode] or None} for the library files under top (default ".").
+
+    Directories are listed and their files stat'ed on a thread pool, so the
+    round trips of a network filesystem overlap. File contents are never read.
+    """
+    found = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = {executor.submit(_scan_dir, top, exts)}
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                found.update(files)
+                for subdir in subdirs:
+                    pending.add(executor.submit(_scan_dir, subdir, exts))
+    return dict(sorted(found.items()))
+
+class ScanManifest:
+    """Persistent record of each library file as of its last indexing: path -> stat, cache key, status.
+
+    status is "indexed" or "failed". A file whose stat signature still matches an
+    "indexed" row is skipped without opening the file or its cache entry. route and
+    pages are the text-layer classification (see text_layer.py), reused while the
+    stat signature matches, and for any file with the same size and header hash
+    (the same content touched, moved or copied).
+
+    A read-only manifest (for --dry-run) never creates or migrates the file, nor
+    its -wal and -shm files; a missing file, or one with writes not yet checkpointed
+    into it, reads as empty.
+    """
+
+    def __init__(self, path=MANIFEST_FILE, readonly=False):
+        self.conn = None
+        self.columns = set()
+        if readonly:
+            # A -wal file holds commits of a running (or crashed) writer such as --watch,
+            # which an immutable connection would not see
+            if os.path.exists(path) and not os.path.exists(f"{path}-wal"):
+                self.conn = sqlite3.connect(f"file:{quote(path)}?mode=ro&immutable=1", uri=True)
+                self.columns = {row[1] for row in self.conn.execute("PRAGMA table_info(files)")}
+            return
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, "
+            "cache_key TEXT, status TEXT, route TEXT, pages INTEGER, header TEXT)"
+        )
+        # Manifests written before the classification columns existed
+        self.columns = {row[1] for row in self.conn.execute("PRAGMA table_info(files)")}
+        for column, column_type in (("route", "TEXT"), ("pages", "INTEGER"), ("header", "TEXT")):
+            if column not in self.columns:
+                self.conn.execute(f"ALTER TABLE files ADD COLUMN {column} {column_type}")
+                self.columns.add(column)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS files_content ON files (size, header)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.commit()
+            self.conn.close()
+
+    def load(self):
+        """Returns {path: (stat signature, cache key, status, route, pages)} for every recorded file."""
+        if not self.columns:
+            return {}
+        # A read-only manifest may predate the classification columns
+        optional = ", ".join(column if column in self.columns else "NULL" for column in ("route", "pages"))
+        rows = self.conn.execute(f"SELECT path, size, mtime_ns, inode, cache_key, status, {optional} FROM files")
+        return {path: ([size, mtime_ns, inode], cache_key, status, route, pages)
+                for path, size, mtime_ns, inode, cache_key, status, route, pages in rows}
+
+    def get(self, path):
+        """Returns (stat signature, cache key, status, route, pages) for one file, or None."""
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, inode, cache_key, status, route, pages FROM files WHERE path = ?", (path,)
+        ).fetchone()
+        if row is None:
+            return None
+        return [row[0], row[1], row[2]], row[3], row[4], row[5], row[6]
+
+    def route_for_content(self, size, header):
+        """Returns the (route, pages) recorded for a file with this size and header hash, or None."""
+        row = self.conn.execute(
+            "SELECT route, pages FROM files WHERE size = ? AND header = ? AND route IS NOT NULL "
+            "ORDER BY status = 'indexed' DESC LIMIT 1", (size, header)
+        ).fetchone()
+        return tuple(row) if row is not None else None
+
+    def record(self, path, file_stat, cache_key, status, route=None, pages=None, header=None):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, cache_key, status, route, pages, header) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, *file_stat, cache_key, status, route, pages, header)
+        )
+        self.conn.commit()
+
+    def remove(self, paths):
+        self.conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in paths])
+        self.conn.commit()
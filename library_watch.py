@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import threading
+
+from library_scan import SCAN_WORKERS, is_hidden_path, scan_library
+
+# Optional: inotify/FSEvents through watchdog; without it the library is polled
+try:
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+WATCH_DEBOUNCE = 2.0     # seconds without new events before a batch is handled
+WATCH_MAX_DELAY = 30.0   # upper bound on how long a continuous burst (e.g. a large copy-in) is held back
+POLL_INTERVAL = 10.0     # seconds between stat-only rescans when watchdog is not installed
+
+class ChangeCollector:
+    """Thread-safe set of changed paths (files or directories), handed out in debounced batches."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.paths = set()
+        self.first_change = None
+        self.last_change = None
+
+    def add(self, path):
+        path = os.path.relpath(path)
+        if path == "." or is_hidden_path(path) or os.path.basename(path).startswith("."):
+            return
+        with self.cond:
+            now = time.monotonic()
+            if not self.paths:
+                self.first_change = now
+            self.paths.add(path)
+            self.last_change = now
+            self.cond.notify()
+
+    def wait_batch(self, debounce=WATCH_DEBOUNCE, max_delay=WATCH_MAX_DELAY):
+        """Blocks until changes have been quiet for debounce seconds (or max_delay has passed), then returns them."""
+        with self.cond:
+            while True:
+                if self.paths:
+                    now = time.monotonic()
+                    due = min(self.last_change + debounce, self.first_change + max_delay)
+                    if now >= due:
+                        paths, self.paths = self.paths, set()
+                        return paths
+                    self.cond.wait(due - now)
+                else:
+                    self.cond.wait()
+
+class _EventHandler:
+    """watchdog handler: records both ends of moves, and every created, modified or deleted path."""
+
+    def __init__(self, collector):
+        self.collector = collector
+
+    def dispatch(self, event):
+        if event.event_type not in ("created", "modified", "deleted", "moved", "closed"):
+            return
+        if event.is_directory and event.event_type == "modified":
+            return  # a directory's mtime changes with every file added to it; the file events follow
+        self.collector.add(event.src_path)
+        dest_path = getattr(event, "dest_path", "")
+        if dest_path:
+            self.collector.add(dest_path)
+
+def _poll(collector, exts, interval, workers):
+    """Fallback watcher: diffs stat-only scans of the library."""
+    previous = scan_library(exts, workers=workers)
+    while True:
+        time.sleep(interval)
+        current = scan_library(exts, workers=workers)
+        for path in current.keys() | previous.keys():
+            if current.get(path) != previous.get(path):
+                collector.add(path)
+        previous = current
+
+def start_watching(collector, exts, poll_interval=POLL_INTERVAL, workers=SCAN_WORKERS):
+    """Starts feeding library changes under "." into collector; returns the name of the mechanism used."""
+    if Observer is not None:
+        observer = Observer()
+        observer.daemon = True
+        observer.schedule(_EventHandler(collector), ".", recursive=True)
+        observer.start()
+        return "watchdog"
+    sys.stderr.write("watchdog is not installed; polling the library for changes instead.\n")
+    thread = threading.Thread(target=_poll, args=(collector, exts, poll_interval, workers), daemon=True)
+    thread.start()
+    return "polling"
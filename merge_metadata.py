@@ -2,26 +2,174 @@ import os
 import json
 import sys
 
-def merge_json_files(directory, output_file):
-    all_metadata = []
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if file.endswith(".json"):
-                file_path = os.path.join(root, file)
-                try:
-                    with open(file_path, 'r') as f:
-                        data = json.load(f)
-                        all_metadata.append(data)
-                except Exception as e:
-                    print(f"Error reading {file_path}: {e}")
-
-    with open(output_file, 'w') as f:
-        json.dump(all_metadata, f, indent=2)
-    print(f"Merged {len(all_metadata)} items into {output_file}")
+MANIFEST_NAME = ".merge_manifest"  # Kept in the cache directory, next to the entries it describes
+
+def scan_cache_entries(directory):
+    """Returns {cache file name: (mtime_ns, size)} for the cache entries in directory."""
+    entries = {}
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.endswith(".json") and entry.is_file():
+                st = entry.stat()
+                entries[entry.name] = (st.st_mtime_ns, st.st_size)
+    return entries
+
+def record_path(record):
+    return record.get("_path") if isinstance(record, dict) else None
+
+def file_version(path):
+    """Returns [mtime_ns, size] of path, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+def load_manifest(directory, output_file):
+    """Returns the manifest of the previous merge into output_file, or None if unusable."""
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get("output") != os.path.abspath(output_file):
+        return None
+    return manifest
+
+def load_records(output_file, entries):
+    """Returns the records of output_file if they still line up with the manifest entries, else None."""
+    try:
+        with open(output_file, 'r') as f:
+            records = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # One record per entry, same order
+    if not isinstance(records, list) or len(records) != len(entries):
+        return None
+    return records
+
+def is_up_to_date(manifest, current, output_file, existing_paths):
+    """True if nothing was added, changed or removed since the merge the manifest describes.
+
+    Decided from the manifest alone: output_file must be the version that merge
+    wrote, every cache entry must have the recorded version and, when
+    existing_paths is given, every recorded "_path" must still be in it.
+    """
+    entries = manifest.get("entries", [])
+    if manifest.get("output_version") is None or manifest["output_version"] != file_version(output_file):
+        return False
+    if len(entries) != len(current):
+        return False
+    for entry in entries:
+        if current.get(entry[0]) != tuple(entry[1:3]):
+            return False
+        if existing_paths is not None:
+            # Manifests written before paths were recorded cannot answer this
+            if len(entry) < 4 or (entry[3] is not None and entry[3] not in existing_paths):
+                return False
+    return True
+
+def save_manifest(directory, output_file, entries):
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({"output": os.path.abspath(output_file), "output_version": file_version(output_file),
+                   "entries": entries}, f)
+    os.replace(tmp_path, manifest_path)
+
+def merge_json_files(directory, output_file, existing_paths=None):
+    """Merges the cache entries in directory into output_file, touching only what changed.
+
+    A manifest records the (mtime, size) version of every cache entry merged into
+    output_file, the "_path" of its record, and the version of output_file itself.
+    When none of them changed, output_file is not even read. Otherwise only added
+    and changed entries are read, deleted entries are dropped, and output_file is
+    rewritten only if something changed. If existing_paths is given, records whose
+    "_path" is not in it are pruned along with their cache entries. Returns True
+    if output_file was written.
+    """
+    current = scan_cache_entries(directory)
+    manifest = load_manifest(directory, output_file)
+    if manifest is not None and is_up_to_date(manifest, current, output_file, existing_paths):
+        print(f"No cache changes; {output_file} is up to date ({len(current)} items).")
+        return False
+
+    old_entries = manifest.get("entries", []) if manifest is not None else []
+    old_records = load_records(output_file, old_entries) if manifest is not None else None
+    if old_records is None:
+        old_records, old_entries = [], []
+
+    def read_entry(name):
+        try:
+            with open(os.path.join(directory, name), 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error reading {os.path.join(directory, name)}: {e}")
+            return None
+
+    records = []
+    entries = []
+    seen = set()
+    added = changed = removed = 0
+
+    # 1. Entries from the previous merge: keep, re-read, or drop
+    for record, entry in zip(old_records, old_entries):
+        name = entry[0]
+        seen.add(name)
+        version = current.get(name)
+        if version is None:
+            removed += 1
+            continue
+        if version != tuple(entry[1:3]):
+            record = read_entry(name)
+            changed += 1
+            if record is None:
+                continue
+        records.append(record)
+        entries.append([name, *version, record_path(record)])
+
+    # 2. New entries, in a stable order
+    for name in sorted(set(current) - seen):
+        record = read_entry(name)
+        added += 1
+        if record is None:
+            continue
+        records.append(record)
+        entries.append([name, *current[name], record_path(record)])
+
+    # 3. Prune records of files that are no longer in the library
+    if existing_paths is not None:
+        kept_records, kept_entries = [], []
+        for record, entry in zip(records, entries):
+            path = entry[3]
+            if path is not None and path not in existing_paths:
+                print(f"Pruning {path} (file no longer exists)")
+                os.remove(os.path.join(directory, entry[0]))
+                removed += 1
+                continue
+            kept_records.append(record)
+            kept_entries.append(entry)
+        records, entries = kept_records, kept_entries
+
+    if not (added or changed or removed) and os.path.exists(output_file):
+        # Nothing to write, but bring the manifest up to date so the next merge can skip reading output_file
+        save_manifest(directory, output_file, entries)
+        print(f"No cache changes; {output_file} is up to date ({len(records)} items).")
+        return False
+
+    # Write to a temporary file and rename it, so a running server never reads a partial database
+    tmp_file = f"{output_file}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(records, f, separators=(',', ':'))
+    os.replace(tmp_file, output_file)
+
+    save_manifest(directory, output_file, entries)
+    print(f"Merged {len(records)} items into {output_file} ({added} added, {changed} changed, {removed} removed)")
+    return True
 
 if __name__ == "__main__":
     if len(sys.argv) < 3:
         print("Usage: python3 merge_metadata.py <cache_directory> <output_file>")
         sys.exit(1)
-    
+
     merge_json_files(sys.argv[1], sys.argv[2])
@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+
+QUERY_CACHE_ENTRIES = 256      # Queries kept
+QUERY_CACHE_BYTES = 32 << 20   # Memory of all cached results: 4 bytes per id, 8 per id and term, 4 per ranked id
+QUERY_CACHE_TTL = 300          # Seconds a query stays cached after it was last used
+
+class QueryCache:
+    """LRU/TTL cache of query -> QueryResult for one SearchIndex at a time.
+
+    Entries are keyed on the index version, so a reloaded index never sees the
+    previous one's results. A query that is not cached is evaluated from the
+    smallest cached result that covers it (typically the same query typed a few
+    keystrokes earlier) rather than from the whole index.
+    """
+
+    def __init__(self, max_entries=QUERY_CACHE_ENTRIES, max_bytes=QUERY_CACHE_BYTES, ttl=QUERY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.version = None
+        self.entries = OrderedDict()  # (terms, filters) -> (last used, QueryResult, bytes accounted)
+        self.nbytes = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(terms, filters):
+        return tuple(sorted(set(terms))), tuple(sorted(filters.items()))
+
+    def _drop(self, key):
+        _, _, nbytes = self.entries.pop(key)
+        self.nbytes -= nbytes
+
+    def _evict(self):
+        while len(self.entries) > self.max_entries or self.nbytes > self.max_bytes:
+            self._drop(next(iter(self.entries)))
+
+    def _expire(self, now):
+        while self.entries:
+            key, (last_used, _, _) = next(iter(self.entries.items()))
+            if now - last_used <= self.ttl:
+                break
+            self._drop(key)
+
+    def _sync(self, version):
+        # A different index: everything cached belongs to the old one
+        if version != self.version:
+            self.entries.clear()
+            self.nbytes = 0
+            self.version = version
+
+    def get(self, version, terms, filters):
+        key = self.key(terms, filters)
+        now = time.monotonic()
+        with self.lock:
+            self._sync(version)
+            self._expire(now)
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries[key] = (now, *entry[1:])
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def find_base(self, version, terms, filters):
+        """Returns the smallest cached result covering the query, or None."""
+        terms = tuple(sorted(set(terms)))
+        with self.lock:
+            self._sync(version)
+            results = [result for _, result, _ in self.entries.values()]
+        # A result without terms or filters is the whole index: nothing to gain from it
+        covering = [r for r in results if (r.terms or r.filters) and r.covers(terms, filters)]
+        return min(covering, key=len, default=None)
+
+    def put(self, version, result):
+        nbytes = result.nbytes()
+        if nbytes > self.max_bytes:
+            return
+        key = self.key(result.terms, result.filters)
+        with self.lock:
+            self._sync(version)
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (time.monotonic(), result, nbytes)
+            self.nbytes += nbytes
+            self._evict()
+
+    def page(self, result, offset=0, limit=None):
+        """Returns result.page(offset, limit), accounting the ranked prefix it keeps if result is cached."""
+        doc_ids = result.page(offset, limit)
+        key = self.key(result.terms, result.filters)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] is result:
+                nbytes = result.nbytes()
+                self.entries[key] = (entry[0], result, nbytes)
+                self.nbytes += nbytes - entry[2]
+                self._evict()
+        return doc_ids
+
+    def search(self, index, terms, filters):
+        """Returns the QueryResult of a query on index, from the cache when possible."""
+        result = self.get(index.version, terms, filters)
+        if result is None:
+            base = self.find_base(index.version, terms, filters)
+            result = index.evaluate(terms, filters, base=base)
+            self.put(index.version, result)
+        return result
@@ -0,0 +1,576 @@
+import array
+import bisect
+import heapq
+import math
+import re
+
+from index_format import (StringTable, DocumentStore, pack_strings, pack_summaries, pack_documents,
+                          write_sections, open_sections)
+from suggest_index import SuggestIndex
+
+# Fields that make up the searchable text of a library item
+SCALAR_FIELDS = ["title", "author", "publisher", "year_edition"]
+LIST_FIELDS = ["keywords", "search_tokens"]
+
+# BM25F field boosts: title > author > keywords > search_tokens
+FIELD_BOOSTS = {
+    "title": 3.0,
+    "author": 2.0,
+    "keywords": 1.5,
+    "search_tokens": 1.0,
+    "publisher": 0.5,
+    "year_edition": 0.5,
+}
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Postings scored per query term; beyond this, matching words only count for membership
+MAX_SCORED_POSTINGS = 100000
+# Terms whose matching words hold more postings than this per document (e.g. "e" or "ion")
+# have their matches merged at build time instead of per query
+DENSE_POSTINGS_PER_DOC = 2
+
+# Four-digit years as recognized by library_indexer's filename parsing
+YEAR_PATTERN = re.compile(r'\b((?:17|18|19|20)\d{2})\b')
+
+# Words longer than this only get suffixes for their first MAX_SUFFIX_OFFSET characters
+MAX_SUFFIX_OFFSET = 0xFFFF
+
+def field_words(item, field):
+    """Returns the lowercase words of one searchable field of an item."""
+    if field in LIST_FIELDS:
+        return " ".join(item.get(field, [])).lower().split()
+    return f"{item.get(field, '')}".lower().split()
+
+class Facet:
+    """Sorted facet values, each with a sorted posting list of document ids."""
+
+    def __init__(self, values, offsets, docs):
+        self.values = values
+        self.offsets = offsets
+        self.docs = docs
+
+    @classmethod
+    def from_postings(cls, value_docs):
+        values = sorted(value_docs)
+        offsets = array.array('I', [0])
+        docs = array.array('I')
+        for value in values:
+            docs.extend(value_docs[value])
+            offsets.append(len(docs))
+        return cls(values, offsets, docs)
+
+    def sections(self, prefix):
+        """Returns the facet as index file sections named with prefix."""
+        if self.values and isinstance(self.values[0], int):
+            values = {f"{prefix}.values": array.array('H', self.values)}
+        else:
+            data, offsets = pack_strings(self.values)
+            values = {f"{prefix}.values.data": data, f"{prefix}.values.offsets": offsets}
+        return {**values, f"{prefix}.offsets": self.offsets, f"{prefix}.docs": self.docs}
+
+    @classmethod
+    def from_sections(cls, sections, prefix):
+        if f"{prefix}.values" in sections:
+            values = sections[f"{prefix}.values"]
+        else:
+            values = StringTable(sections[f"{prefix}.values.data"], sections[f"{prefix}.values.offsets"])
+        return cls(values, sections[f"{prefix}.offsets"], sections[f"{prefix}.docs"])
+
+    def count(self, i):
+        return self.offsets[i + 1] - self.offsets[i]
+
+    def postings(self, i):
+        return self.docs[self.offsets[i]:self.offsets[i + 1]]
+
+    def counts(self):
+        """Returns a mapping of facet value to number of documents."""
+        return {value: self.count(i) for i, value in enumerate(self.values)}
+
+    def exact(self, value):
+        """Returns the set of document ids whose facet value equals value."""
+        i = bisect.bisect_left(self.values, value)
+        if i < len(self.values) and self.values[i] == value:
+            return set(self.postings(i))
+        return set()
+
+    def containing(self, text):
+        """Returns the set of document ids whose facet value contains text."""
+        docs = set()
+        for i, value in enumerate(self.values):
+            if text in value:
+                docs.update(self.postings(i))
+        return docs
+
+    def between(self, low, high):
+        """Returns the set of document ids whose facet value lies in [low, high]."""
+        lo = bisect.bisect_left(self.values, low)
+        hi = bisect.bisect_right(self.values, high)
+        return set(self.docs[self.offsets[lo]:self.offsets[hi]])
+
+def parse_year_range(val):
+    """Parses 'a..b', 'a..' or '..b' into (low, high); returns None otherwise."""
+    low, sep, high = val.partition('..')
+    if not sep or not (low or high):
+        return None
+    if (low and not low.isdigit()) or (high and not high.isdigit()):
+        return None
+    return (int(low) if low else 0, int(high) if high else 9999)
+
+class DenseTerms:
+    """Precomputed matches of the terms whose matching words hold the most postings.
+
+    Such terms are short substrings found in most documents, whose matches would
+    otherwise be the union of hundreds of posting lists. Each is stored as the
+    sorted ids of the documents it does not match when that list is shorter,
+    otherwise of the documents it matches.
+    """
+
+    def __init__(self, terms, complements, offsets, docs, doc_count):
+        self.terms = terms
+        self.complements = complements
+        self.offsets = offsets
+        self.docs = docs
+        self.doc_count = doc_count
+
+    @classmethod
+    def build(cls, vocab, post_offsets, post_docs, suffix_words, suffix_offsets, doc_count):
+        def suffix_prefix(i, length):
+            return vocab[suffix_words[i]][suffix_offsets[i]:suffix_offsets[i] + length]
+
+        # Level by level: a longer term matches a subset of the words of its prefix
+        limit = DENSE_POSTINGS_PER_DOC * doc_count
+        merged = {}
+        ranges = [(0, len(suffix_words))]
+        length = 0
+        while ranges:
+            length += 1
+            next_ranges = []
+            for lo, hi in ranges:
+                i = lo
+                while i < hi:
+                    prefix = suffix_prefix(i, length)
+                    # End of the suffixes starting with prefix (or equal to it, when shorter than length)
+                    j, end = i + 1, hi
+                    while j < end:
+                        mid = (j + end) // 2
+                        if suffix_prefix(mid, length) <= prefix:
+                            j = mid + 1
+                        else:
+                            end = mid
+                    if len(prefix) == length:
+                        words = set(suffix_words[i:j])
+                        if sum(post_offsets[w + 1] - post_offsets[w] for w in words) > limit:
+                            docs = set()
+                            for w in words:
+                                docs.update(post_docs[post_offsets[w]:post_offsets[w + 1]])
+                            merged[prefix] = docs
+                            next_ranges.append((i, j))
+                    i = j
+            ranges = next_ranges
+
+        terms = sorted(merged)
+        complements = bytearray()
+        offsets = array.array('I', [0])
+        docs = array.array('I')
+        for term in terms:
+            ids = merged[term]
+            complement = 2 * len(ids) > doc_count
+            if complement:
+                ids = set(range(doc_count)) - ids
+            complements.append(complement)
+            docs.extend(sorted(ids))
+            offsets.append(len(docs))
+        return cls(StringTable(*pack_strings(terms)), bytes(complements), offsets, docs, doc_count)
+
+    def sections(self, prefix):
+        """Returns the dense terms as index file sections named with prefix."""
+        return {
+            f"{prefix}.terms.data": self.terms.data, f"{prefix}.terms.offsets": self.terms.offsets,
+            f"{prefix}.complements": self.complements, f"{prefix}.offsets": self.offsets, f"{prefix}.docs": self.docs,
+        }
+
+    @classmethod
+    def from_sections(cls, sections, prefix, doc_count):
+        return cls(
+            StringTable(sections[f"{prefix}.terms.data"], sections[f"{prefix}.terms.offsets"]),
+            sections[f"{prefix}.complements"], sections[f"{prefix}.offsets"], sections[f"{prefix}.docs"], doc_count,
+        )
+
+    def get(self, term):
+        """Returns the set of document ids matching term, or None if term is not dense."""
+        i = bisect.bisect_left(self.terms, term)
+        if i == len(self.terms) or self.terms[i] != term:
+            return None
+        ids = self.docs[self.offsets[i]:self.offsets[i + 1]]
+        if self.complements[i]:
+            return set(range(self.doc_count)).difference(ids)
+        return set(ids)
+
+FACET_NAMES = ["type", "publisher", "edition", "year"]
+FILTER_KEYS = ["type", "publisher", "year"]  # key:value query words handled by filter_docs()
+
+class QueryResult:
+    """The documents matching a query, with each term's BM25F score contribution.
+
+    ids are the matching document ids in ascending order; contributions maps each
+    query term to an array of its score contribution per document, aligned with
+    ids. A document's score is the sum of the contributions in term order, so a
+    result derived from another with evaluate(..., base=...) ranks exactly like a fresh one.
+    """
+
+    def __init__(self, terms, filters, ids, contributions):
+        self.terms = terms
+        self.filters = filters
+        self.ids = ids
+        self.contributions = contributions
+        self.ranked = None  # Best-ranked prefix of ids, extended as deeper pages are requested
+
+    def __len__(self):
+        return len(self.ids)
+
+    def nbytes(self):
+        """Memory held by the ids, the contribution arrays and the ranked prefix (shared arrays count per result)."""
+        size = self.ids.itemsize * len(self.ids)
+        size += sum(contribution.itemsize * len(contribution) for contribution in self.contributions.values())
+        if self.ranked is not None and self.ranked is not self.ids:
+            size += self.ranked.itemsize * len(self.ranked)
+        return size
+
+    def covers(self, terms, filters):
+        """True if every match of (terms, filters) is also a match of this result.
+
+        That holds when the query keeps this result's filters and each of this
+        result's terms is part of one of its terms: a query term matches the words
+        containing it, so a longer term matches a subset of the same documents.
+        """
+        if any(filters.get(key) != val for key, val in self.filters.items()):
+            return False
+        return all(any(term in other for other in terms) for term in self.terms)
+
+    def page(self, offset=0, limit=None):
+        """Returns the doc ids ranked offset to offset + limit: best score first, then library order."""
+        wanted = len(self.ids) if limit is None else min(offset + limit, len(self.ids))
+        if self.ranked is None or len(self.ranked) < wanted:
+            if not self.terms:
+                self.ranked = self.ids  # no scores: library order
+            else:
+                scores = [0.0] * len(self.ids)
+                for term in self.terms:
+                    scores = [score + contribution for score, contribution in zip(scores, self.contributions[term])]
+                ids = self.ids
+                order = heapq.nlargest(wanted, range(len(ids)), key=lambda i: (scores[i], -ids[i]))
+                self.ranked = array.array('I', [ids[i] for i in order])
+        return self.ranked[offset:wanted].tolist()
+
+class SearchIndex:
+    """Inverted index over the words of every library item.
+
+    A query term matches an item when it is a substring of the item's text blob.
+    Query terms never contain whitespace, so that is the same as being a substring
+    of one of the blob's words. Words are kept in a sorted vocabulary with a posting
+    list of document ids each, and a suffix array over the vocabulary finds every
+    word containing a term with two binary searches. The matches of the few terms
+    whose words hold most postings, such as "e", are precomputed (DenseTerms).
+
+    All tables are flat arrays, so an index built in memory with build() and one
+    mapped from disk with load() are queried by the same code.
+    """
+
+    def __init__(self, documents, summaries, vocab, post_offsets, post_docs, post_weights,
+                 suffix_words, suffix_offsets, dense, facets, suggestions):
+        self.documents = documents
+        self.summaries = summaries
+        self.version = None  # Set by whoever loads the index (e.g. its file signature); keys query caches
+        self.vocab = vocab
+        self.post_offsets = post_offsets
+        self.post_docs = post_docs
+        self.post_weights = post_weights
+        self.suffix_words = suffix_words
+        self.suffix_offsets = suffix_offsets
+        self.dense = dense
+        self.type_facet = facets["type"]
+        self.publisher_facet = facets["publisher"]
+        self.edition_facet = facets["edition"]
+        self.year_facet = facets["year"]
+        self.suggestions = suggestions
+
+    @classmethod
+    def build(cls, documents):
+        """Builds an index in memory from a list of library items."""
+        # 1. Vocabulary and posting lists, weighted by BM25F pseudo term frequency
+        fields = SCALAR_FIELDS + LIST_FIELDS
+        doc_fields = []
+        total_lengths = dict.fromkeys(fields, 0)
+        for item in documents:
+            words_by_field = {field: field_words(item, field) for field in fields}
+            for field, words in words_by_field.items():
+                total_lengths[field] += len(words)
+            doc_fields.append(words_by_field)
+        avg_lengths = {f: (total_lengths[f] / len(documents) if documents else 0) or 1 for f in fields}
+
+        word_docs = {}
+        for doc_id, words_by_field in enumerate(doc_fields):
+            weights = {}
+            for field, words in words_by_field.items():
+                norm = 1 - BM25_B + BM25_B * len(words) / avg_lengths[field]
+                boost = FIELD_BOOSTS[field] / norm
+                for word in words:
+                    weights[word] = weights.get(word, 0.0) + boost
+            for word, weight in weights.items():
+                word_docs.setdefault(word, []).append((doc_id, weight))
+        del doc_fields
+
+        vocab = sorted(word_docs)
+        post_offsets = array.array('I', [0])
+        post_docs = array.array('I')
+        post_weights = array.array('f')
+        for word in vocab:
+            for doc_id, weight in word_docs[word]:
+                post_docs.append(doc_id)
+                post_weights.append(weight)
+            post_offsets.append(len(post_docs))
+        del word_docs
+
+        # 2. Suffix array over the vocabulary (word id, character offset)
+        suffixes = []
+        for word_id, word in enumerate(vocab):
+            for offset in range(min(len(word), MAX_SUFFIX_OFFSET)):
+                suffixes.append((word[offset:], word_id, offset))
+        suffixes.sort()
+        suffix_words = array.array('I', (s[1] for s in suffixes))
+        suffix_offsets = array.array('H', (s[2] for s in suffixes))
+        del suffixes
+
+        # 3. Matches of the terms that would merge most of the posting lists
+        dense = DenseTerms.build(vocab, post_offsets, post_docs, suffix_words, suffix_offsets, len(documents))
+
+        # 4. Facets for the type:, publisher: and year: filters
+        types, publishers, editions, years = {}, {}, {}, {}
+        for doc_id, item in enumerate(documents):
+            types.setdefault((item.get('type') or '').lower(), []).append(doc_id)
+            publishers.setdefault((item.get('publisher') or '').lower(), []).append(doc_id)
+            edition = (item.get('year_edition') or '').lower()
+            editions.setdefault(edition, []).append(doc_id)
+            year_match = YEAR_PATTERN.search(edition)
+            if year_match:
+                years.setdefault(int(year_match.group(1)), []).append(doc_id)
+        facets = {
+            "type": Facet.from_postings(types),
+            "publisher": Facet.from_postings(publishers),
+            "edition": Facet.from_postings(editions),
+            "year": Facet.from_postings(years),
+        }
+
+        # 5. Serialized summary of each item, so responses are assembled without re-encoding
+        summaries = StringTable(*pack_summaries(documents))
+
+        # 6. Completions for /api/suggest
+        suggestions = SuggestIndex.build(documents)
+
+        return cls(documents, summaries, vocab, post_offsets, post_docs, post_weights,
+                   suffix_words, suffix_offsets, dense, facets, suggestions)
+
+    def save(self, path):
+        """Writes the index, including the library items, to a binary index file."""
+        sections = pack_documents(self.documents)
+        sections["vocab.data"], sections["vocab.offsets"] = pack_strings(self.vocab)
+        sections["postings.offsets"] = array.array('I', self.post_offsets)
+        sections["postings.docs"] = array.array('I', self.post_docs)
+        sections["postings.weights"] = array.array('f', self.post_weights)
+        sections["suffix.words"] = array.array('I', self.suffix_words)
+        sections["suffix.offsets"] = array.array('H', self.suffix_offsets)
+        sections.update(self.dense.sections("dense"))
+        for name in FACET_NAMES:
+            sections.update(getattr(self, f"{name}_facet").sections(f"facet.{name}"))
+        sections.update(self.suggestions.sections("suggest"))
+        write_sections(path, sections, meta={"items": len(self.documents)})
+
+    @classmethod
+    def load(cls, path):
+        """Maps a binary index file; tables are read in place, nothing is parsed per item."""
+        _, sections = open_sections(path)
+        facets = {name: Facet.from_sections(sections, f"facet.{name}") for name in FACET_NAMES}
+        documents = DocumentStore(sections)
+        return cls(
+            documents, documents.summaries,
+            StringTable(sections["vocab.data"], sections["vocab.offsets"]),
+            sections["postings.offsets"], sections["postings.docs"], sections["postings.weights"],
+            sections["suffix.words"], sections["suffix.offsets"],
+            DenseTerms.from_sections(sections, "dense", len(documents)), facets,
+            SuggestIndex.from_sections(sections, "suggest"),
+        )
+
+    def __len__(self):
+        return len(self.documents)
+
+    def summary(self, doc_id):
+        """Returns the compact JSON of an item (its SUMMARY_FIELDS) as UTF-8 bytes."""
+        return self.summaries.raw(doc_id)
+
+    def project(self, doc_id, fields):
+        """Returns an item with only the given fields."""
+        if isinstance(self.documents, DocumentStore):
+            return self.documents.project(doc_id, fields)
+        item = self.documents[doc_id]
+        return {field: item[field] for field in fields if field in item}
+
+    def _suffix_prefix(self, i, length):
+        return self.vocab[self.suffix_words[i]][self.suffix_offsets[i]:self.suffix_offsets[i] + length]
+
+    def matching_words(self, term):
+        """Returns the ids of all vocabulary words that contain term."""
+        n = len(term)
+        # Lower bound: first suffix whose prefix is >= term
+        lo, hi = 0, len(self.suffix_words)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._suffix_prefix(mid, n) < term:
+                lo = mid + 1
+            else:
+                hi = mid
+        start = lo
+        # Upper bound: first suffix whose prefix is > term
+        hi = len(self.suffix_words)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._suffix_prefix(mid, n) <= term:
+                lo = mid + 1
+            else:
+                hi = mid
+        return set(self.suffix_words[start:lo])
+
+    def postings(self, word_id):
+        return self.post_docs[self.post_offsets[word_id]:self.post_offsets[word_id + 1]]
+
+    def term_weights(self, term):
+        """Returns (docs, weights) for term.
+
+        docs is the set of documents containing term. weights maps document id to
+        pseudo term frequency, summed over the matching words closest to term
+        (exact word, then prefixes, then shortest words) until MAX_SCORED_POSTINGS
+        postings have been read. Documents only reached past that budget are absent
+        from weights and score zero for this term. For dense terms, docs is the
+        precomputed set and the remaining words are not read.
+        """
+        def closeness(word_id):
+            word = self.vocab[word_id]
+            return (word != term, not word.startswith(term), len(word))
+
+        dense_docs = self.dense.get(term)
+        docs = set()
+        weights = {}
+        budget = MAX_SCORED_POSTINGS
+        for word_id in sorted(self.matching_words(term), key=closeness):
+            start, end = self.post_offsets[word_id], self.post_offsets[word_id + 1]
+            if budget <= 0:
+                if dense_docs is not None:
+                    break
+                if not docs:
+                    docs.update(weights)
+                if len(docs) == len(self.documents):
+                    break
+                docs.update(self.post_docs[start:end])
+                continue
+            budget -= end - start
+            if not weights:
+                weights = dict(zip(self.post_docs[start:end], self.post_weights[start:end]))
+            else:
+                for doc_id, weight in zip(self.post_docs[start:end], self.post_weights[start:end]):
+                    weights[doc_id] = weights.get(doc_id, 0.0) + weight
+        if dense_docs is not None:
+            return dense_docs, weights
+        docs.update(weights)
+        return docs, weights
+
+    def filter_docs(self, key, val):
+        """Returns the set of document ids passing a key:val filter, or None for unknown keys."""
+        if key == 'type':
+            return self.type_facet.exact(val)
+        elif key == 'publisher':
+            return self.publisher_facet.containing(val)
+        elif key == 'year':
+            year_range = parse_year_range(val)
+            if year_range:
+                return self.year_facet.between(*year_range)
+            return self.edition_facet.containing(val)
+        return None
+
+    def facet_counts(self):
+        """Returns document counts per value of every filterable facet."""
+        return {
+            "type": self.type_facet.counts(),
+            "publisher": self.publisher_facet.counts(),
+            "year": {str(year): count for year, count in self.year_facet.counts().items()},
+        }
+
+    def filter_set(self, filters):
+        """Returns the set of document ids passing all filters, or None when nothing is filtered."""
+        result = None
+        for key, val in (filters or {}).items():
+            docs = self.filter_docs(key, val)
+            if docs is None:
+                continue
+            result = docs if result is None else result & docs
+        return result
+
+    def term_contributions(self, term, ids, term_result=None):
+        """Returns term's BM25F score contribution for each of ids, as an array of doubles."""
+        docs, weights = term_result or self.term_weights(term)
+        idf = math.log(1 + (len(self.documents) - len(docs) + 0.5) / (len(docs) + 0.5))
+        scale = idf * (BM25_K1 + 1)
+        return array.array('d', [scale * tf / (tf + BM25_K1) for tf in [weights.get(doc_id, 0.0) for doc_id in ids]])
+
+    def evaluate(self, terms, filters=None, base=None):
+        """Returns the QueryResult of terms and filters.
+
+        base is an earlier QueryResult that covers() this query (e.g. the query
+        before a term was added or extended); its matches are filtered instead of
+        the whole index, and the contributions of terms it shares are reused.
+        """
+        terms = tuple(sorted(set(terms)))
+        filters = dict(filters or {})
+        new_terms = [t for t in terms if base is None or t not in base.contributions]
+        term_results = {t: self.term_weights(t) for t in new_terms}
+
+        # 1. Matches: the smallest set first, intersected with the others
+        doc_sets = sorted((docs for docs, _ in term_results.values()), key=len)
+        if base is not None:
+            doc_sets.insert(0, set(base.ids))
+            filters_docs = self.filter_set({k: v for k, v in filters.items() if base.filters.get(k) != v})
+        else:
+            filters_docs = self.filter_set(filters)
+        if filters_docs is not None:
+            doc_sets.append(filters_docs)
+        if not doc_sets:
+            candidates = range(len(self.documents))
+        else:
+            candidates = doc_sets[0]
+            for docs in doc_sets[1:]:
+                if not candidates:
+                    break
+                candidates = candidates & docs
+        ids = array.array('I', sorted(candidates))
+
+        # 2. Score contributions, copied from base for the terms it already scored
+        contributions = {}
+        base_positions = None
+        if base is not None and len(ids) < len(base.ids):
+            base_positions = dict(zip(base.ids, range(len(base.ids))))
+        for term in terms:
+            if term in term_results:
+                contributions[term] = self.term_contributions(term, ids, term_results[term])
+            elif base_positions is None:
+                contributions[term] = base.contributions[term]  # same matches as base
+            else:
+                previous = base.contributions[term]
+                contributions[term] = array.array('d', [previous[base_positions[doc_id]] for doc_id in ids])
+        return QueryResult(terms, filters, ids, contributions)
+
+    def search(self, terms, filters=None, limit=None, offset=0):
+        """Ranks the documents matching terms and filters by BM25F.
+
+        Returns (total, doc_ids) where doc_ids is the requested page of the
+        ranking. Ties, and filter-only queries, keep library order.
+        """
+        result = self.evaluate(terms, filters)
+        return len(result), result.page(offset, limit)
@@ -5,7 +5,12 @@ if [ ! -f "library.json" ]; then
     python3 incremental_indexer.py
 fi
 
-pkill -f "python3 app.py" || true
+# A running server reloads library.json on its own after re-indexing
+if pgrep -f "python3 app.py" > /dev/null; then
+    echo "Library Search Server is already running; it picks up index changes automatically."
+    exit 0
+fi
+
 echo "Starting Library Search Server..."
 echo "Access it at http://localhost:5000"
 python3 app.py
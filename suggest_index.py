@@ -0,0 +1,145 @@
+import array
+import bisect
+import heapq
+from collections import Counter
+
+from index_format import StringTable, pack_strings
+
+# Sources of completions, in the order their ids are stored
+KINDS = ["term", "title", "author", "publisher"]
+PLACEHOLDER_VALUES = {"", "unknown"}  # Defaults written by library_indexer for missing metadata
+MAX_SUGGESTIONS = 20  # Largest limit served; also the length of the precomputed lists
+SCAN_LIMIT = 512      # Prefixes matching more entries than this use a precomputed list
+
+class SuggestIndex:
+    """Frequency-weighted completions: distinct titles, authors, publishers and search_tokens terms.
+
+    Entries are sorted by their lowercase text, so the entries starting with a
+    prefix form one range found by binary search, and the best of a small range
+    are picked by scanning it. For the prefixes of large ranges (short ones such
+    as "q" or "the"), the best MAX_SUGGESTIONS entries are precomputed.
+    """
+
+    def __init__(self, texts, weights, kinds, top_prefixes, top_offsets, top_ids):
+        self.texts = texts
+        self.weights = weights
+        self.kinds = kinds
+        self.top_prefixes = top_prefixes
+        self.top_offsets = top_offsets
+        self.top_ids = top_ids
+
+    @classmethod
+    def build(cls, documents):
+        """Counts the documents of each completion; the same text from several fields is one entry."""
+        counts = {kind: Counter() for kind in KINDS}
+        for item in documents:
+            for kind in ("title", "author", "publisher"):
+                value = item.get(kind)
+                if isinstance(value, str) and value.strip().lower() not in PLACEHOLDER_VALUES:
+                    counts[kind][value.strip()] += 1
+            tokens = item.get("search_tokens")
+            if isinstance(tokens, list):
+                counts["term"].update({token for token in tokens if isinstance(token, str) and token.strip()})
+
+        # Merge by lowercase text: total weight, shown as the text of the field it is most frequent in
+        entries = {}
+        for kind_id, kind in enumerate(KINDS):
+            for text, count in counts[kind].items():
+                key = text.lower()
+                entry = entries.get(key)
+                if entry is None:
+                    entries[key] = [count, count, text, kind_id]
+                else:
+                    entry[0] += count
+                    if count > entry[1]:
+                        entry[1:] = [count, text, kind_id]
+        keys = sorted(entries)
+        weights = array.array('I', (entries[key][0] for key in keys))
+        kinds = bytes(entries[key][3] for key in keys)
+        texts = StringTable(*pack_strings(entries[key][2] for key in keys))
+
+        # Best entries of every prefix whose range is too large to scan, level by level
+        tops = {}
+        ranges = [(0, len(keys))]
+        length = 0
+        while ranges:
+            length += 1
+            next_ranges = []
+            for lo, hi in ranges:
+                i = lo
+                while i < hi:
+                    prefix = keys[i][:length]
+                    j = i + 1
+                    while j < hi and keys[j][:length] == prefix:
+                        j += 1
+                    if j - i > SCAN_LIMIT and len(prefix) == length:
+                        tops[prefix] = heapq.nlargest(MAX_SUGGESTIONS, range(i, j), key=lambda k: (weights[k], -k))
+                        next_ranges.append((i, j))
+                    i = j
+            ranges = next_ranges
+        top_prefixes = sorted(tops)
+        top_offsets = array.array('I', [0])
+        top_ids = array.array('I')
+        for prefix in top_prefixes:
+            top_ids.extend(tops[prefix])
+            top_offsets.append(len(top_ids))
+        return cls(texts, weights, kinds, StringTable(*pack_strings(top_prefixes)), top_offsets, top_ids)
+
+    def sections(self, prefix):
+        """Returns the completions as index file sections named with prefix."""
+        return {
+            f"{prefix}.texts.data": self.texts.data, f"{prefix}.texts.offsets": self.texts.offsets,
+            f"{prefix}.weights": self.weights, f"{prefix}.kinds": self.kinds,
+            f"{prefix}.top.prefixes.data": self.top_prefixes.data,
+            f"{prefix}.top.prefixes.offsets": self.top_prefixes.offsets,
+            f"{prefix}.top.offsets": self.top_offsets, f"{prefix}.top.ids": self.top_ids,
+        }
+
+    @classmethod
+    def from_sections(cls, sections, prefix):
+        return cls(
+            StringTable(sections[f"{prefix}.texts.data"], sections[f"{prefix}.texts.offsets"]),
+            sections[f"{prefix}.weights"], sections[f"{prefix}.kinds"],
+            StringTable(sections[f"{prefix}.top.prefixes.data"], sections[f"{prefix}.top.prefixes.offsets"]),
+            sections[f"{prefix}.top.offsets"], sections[f"{prefix}.top.ids"],
+        )
+
+    def _key_prefix(self, i, length):
+        return self.texts[i].lower()[:length]
+
+    def prefix_range(self, prefix):
+        """Returns (lo, hi): the entries whose lowercase text starts with prefix."""
+        n = len(prefix)
+        lo, hi = 0, len(self.texts)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_prefix(mid, n) < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        start = lo
+        hi = len(self.texts)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_prefix(mid, n) <= prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        return start, lo
+
+    def suggest(self, prefix, limit=10):
+        """Returns up to limit (text, kind, document count) completions of prefix, most frequent first."""
+        prefix = prefix.lstrip().lower()
+        limit = min(limit, MAX_SUGGESTIONS)
+        if not prefix or limit <= 0:
+            return []
+        lo, hi = self.prefix_range(prefix)
+        ids = None
+        if hi - lo > SCAN_LIMIT:
+            i = bisect.bisect_left(self.top_prefixes, prefix)
+            if i < len(self.top_prefixes) and self.top_prefixes[i] == prefix:
+                ids = self.top_ids[self.top_offsets[i]:self.top_offsets[i + 1]][:limit]
+        if ids is None:
+            weights = self.weights
+            ids = heapq.nlargest(limit, range(lo, hi), key=lambda k: (weights[k], -k))
+        return [(self.texts[i], KINDS[self.kinds[i]], self.weights[i]) for i in ids]
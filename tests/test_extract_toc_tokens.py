@@ -0,0 +1,182 @@
+import os
+import sys
+import time
+import importlib
+import subprocess
+
+import pytest
+
+# Streamed page selection against the whole-document extraction it replaced: same pages, same stopping point
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "benchmarks"))
+
+import pdfplumber
+from fixture_documents import KIND_TEXT, write_document
+from indexing_metrics import begin_file, end_file
+
+FAKE_DJVUTXT = r'''#!/usr/bin/env python3
+"""djvutxt for tests: the "djvu" file holds pages separated by lines of ===; each is written with a form feed."""
+import os, sys, time
+spec, path = sys.argv[1].split("=", 1)[1], sys.argv[2]
+first, _, last = spec.partition("-")
+pages = open(path).read().split("\n===\n")
+first, last = int(first), int(last or first)
+if first > len(pages):
+    sys.exit(1)
+with open(path + ".calls", "a") as log:
+    log.write(f"{spec}\n")
+for page in pages[first - 1:last]:
+    sys.stdout.write(page + "\f")
+    sys.stdout.flush()
+    time.sleep(0.01)
+if os.environ.get("DJVUTXT_HANG"):
+    time.sleep(60)
+'''
+
+@pytest.fixture(scope="module")
+def extract_toc_tokens(tmp_path_factory):
+    # Imported away from the repository root, so the glossary import does not write an automaton cache there
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("import"))
+    try:
+        return importlib.import_module("extract_toc_tokens")
+    finally:
+        os.chdir(cwd)
+
+def whole_document_selection(page_texts, limit=50):
+    """The selection before streaming: scan for the first TOC/abstract page, then read it and
+    the four after it again; without one, read the first five pages. Returns (text, pages touched)."""
+    touched = set()
+    pages_to_extract = []
+    for i in range(min(len(page_texts), limit)):
+        touched.add(i)
+        text = page_texts[i]
+        if not text:
+            continue
+        lower_text = text.lower()
+        if "contents" in lower_text or "abstract" in lower_text or "introduction" in lower_text:
+            pages_to_extract = list(range(i, min(i + 5, min(len(page_texts), limit))))
+            break
+    else:
+        pages_to_extract = list(range(min(5, len(page_texts))))
+    full_text = ""
+    for i in pages_to_extract:
+        touched.add(i)
+        if page_texts[i]:
+            full_text += page_texts[i] + "\n"
+    return full_text, max(touched) + 1 if touched else 0
+
+def body(i):
+    return f"Page {i}: the field equations of a rotating frame."
+
+def layout(count, relevant=(), empty=()):
+    pages = []
+    for i in range(count):
+        if i in empty:
+            pages.append("" if i % 2 else None)
+        elif i in relevant:
+            pages.append(f"{relevant[i]}\n1. Foundations .... 3")
+        else:
+            pages.append(body(i))
+    return pages
+
+LAYOUTS = {
+    "contents first": layout(60, {0: "Contents"}),
+    "contents after front matter": layout(60, {7: "Table of Contents", 20: "Introduction"}),
+    "abstract of a paper": layout(8, {1: "ABSTRACT"}),
+    "introduction near the limit": layout(60, {47: "Introduction"}),
+    "relevant page past the limit": layout(60, {55: "Contents"}),
+    "no relevant page": layout(60),
+    "short document": layout(3),
+    "empty pages before and inside the selection": layout(30, {4: "Contents"}, empty={0, 1, 5, 7}),
+    "relevant page without text": layout(12, {2: "Abstract"}, empty={1, 2, 3}),
+}
+
+class CountingPages:
+    def __init__(self, pages):
+        self.pages = pages
+        self.consumed = 0
+
+    def __iter__(self):
+        for text in self.pages:
+            self.consumed += 1
+            yield text
+
+@pytest.mark.parametrize("name", sorted(LAYOUTS))
+def test_streamed_selection_matches_whole_document(extract_toc_tokens, name):
+    pages = LAYOUTS[name]
+    expected_text, expected_pages = whole_document_selection(pages)
+    counting = CountingPages(pages)
+    assert extract_toc_tokens.select_relevant_pages(counting) == expected_text
+    # Reading stops at the last page the old extraction touched (the page past the limit is not parsed)
+    assert min(counting.consumed, extract_toc_tokens.MAX_PAGES_TEXT) == expected_pages
+
+@pytest.fixture
+def djvutxt(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    tool = bin_dir / "djvutxt"
+    tool.write_text(FAKE_DJVUTXT)
+    tool.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return tmp_path
+
+def write_djvu(directory, pages):
+    path = directory / "book.djvu"
+    path.write_text("\n===\n".join(text or "" for text in pages))
+    return str(path)
+
+def per_page_texts(path, count=50):
+    """Page texts as the old extraction read them, one djvutxt call per page."""
+    texts = []
+    for p in range(1, count + 1):
+        result = subprocess.run(["djvutxt", f"--page={p}", path], capture_output=True, text=True)
+        if result.returncode != 0:
+            break
+        texts.append(result.stdout.rstrip("\f"))
+    return texts
+
+@pytest.mark.parametrize("name", ["contents after front matter", "no relevant page", "short document",
+                                  "empty pages before and inside the selection"])
+def test_djvu_pages_from_one_call_match_per_page_calls(extract_toc_tokens, djvutxt, name):
+    path = write_djvu(djvutxt, LAYOUTS[name])
+    old_pages = per_page_texts(path)
+    os.remove(f"{path}.calls")
+
+    assert list(extract_toc_tokens.iter_djvu_pages(path)) == old_pages
+    assert extract_toc_tokens.extract_tokens_from_djvu(path) == whole_document_selection(old_pages)[0]
+    with open(f"{path}.calls") as f:
+        assert f.read().split() == ["1-50", "1-50"]
+
+def test_djvutxt_is_stopped_once_the_selection_is_complete(extract_toc_tokens, djvutxt, monkeypatch):
+    # djvutxt would keep running after its pages; the selection does not wait for it
+    monkeypatch.setenv("DJVUTXT_HANG", "1")
+    path = write_djvu(djvutxt, LAYOUTS["contents after front matter"])
+    start = time.monotonic()
+    assert extract_toc_tokens.extract_tokens_from_djvu(path).startswith("Table of Contents")
+    assert time.monotonic() - start < 10
+
+def write_pdf(directory, pages):
+    path = str(directory / "book.pdf")
+    write_document(path, KIND_TEXT, [(text or "").split("\n") if text else [] for text in pages], [])
+    return path
+
+def whole_pdf_text(path):
+    """The page texts of a PDF, each extracted as the old path did."""
+    with pdfplumber.open(path) as pdf:
+        return [page.extract_text(x_tolerance=1) for page in pdf.pages]
+
+@pytest.mark.parametrize("name", ["contents first", "contents after front matter", "introduction near the limit",
+                                  "relevant page past the limit", "no relevant page", "short document",
+                                  "empty pages before and inside the selection"])
+def test_pdf_text_layer_is_read_once_up_to_the_old_stopping_point(extract_toc_tokens, tmp_path, name):
+    path = write_pdf(tmp_path, LAYOUTS[name])
+    old_text, old_pages = whole_document_selection(whole_pdf_text(path))
+    assert old_text.strip()
+
+    begin_file()
+    assert extract_toc_tokens.read_text_layer(path) == old_text
+    # Every page up to the old stopping point is parsed once (the old path parsed the selected ones twice)
+    assert end_file()["counts"]["pages_text"] == old_pages
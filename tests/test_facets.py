@@ -0,0 +1,73 @@
+import os
+import re
+import sys
+
+import pytest
+
+# Facet filters and counts against a scan over the items, as /api/search filtered before the index
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "benchmarks"))
+
+from library_generator import generate_library
+from search_index import SearchIndex
+
+LIBRARY_SIZE = 2000
+
+FILTERS = [
+    ("type", "book"), ("type", "paper"), ("type", "boo"),
+    ("publisher", "springer"), ("publisher", "press"), ("publisher", "unknown"), ("publisher", "zzz"),
+    ("year", "3rd"), ("year", "19"), ("year", "1975"),
+    ("year", "1950..1970"), ("year", "2000.."), ("year", "..1800"), ("year", "..x"),
+]
+
+@pytest.fixture(scope="module")
+def documents():
+    return generate_library(LIBRARY_SIZE, seed=0)
+
+@pytest.fixture(scope="module")
+def built(documents):
+    return SearchIndex.build(documents)
+
+def scan(documents, key, val):
+    """Ids of the items passing one filter, checked item by item."""
+    ids = set()
+    for doc_id, item in enumerate(documents):
+        if key == 'type':
+            passed = (item.get('type') or '').lower() == val
+        elif key == 'publisher':
+            passed = val in (item.get('publisher') or '').lower()
+        else:
+            edition = (item.get('year_edition') or '').lower()
+            low, sep, high = val.partition('..')
+            if sep and (low or high) and (low + high).isdigit():
+                year = re.search(r'\b((?:17|18|19|20)\d{2})\b', edition)
+                passed = bool(year) and int(low or 0) <= int(year.group(1)) <= int(high or 9999)
+            else:
+                passed = val in edition
+        if passed:
+            ids.add(doc_id)
+    return ids
+
+@pytest.mark.parametrize("key, val", FILTERS)
+def test_filter_matches_scan(documents, built, key, val):
+    assert built.filter_docs(key, val) == scan(documents, key, val)
+
+def test_filters_combine_by_intersection(documents, built):
+    filters = {"type": "book", "publisher": "press", "year": "1950..1999"}
+    expected = set.intersection(*(scan(documents, k, v) for k, v in filters.items()))
+    assert expected
+    assert built.filter_set(filters) == expected
+    # Unknown keys are not filters
+    assert built.filter_set({"colour": "red"}) is None
+    assert built.filter_set({"colour": "red", **filters}) == expected
+
+def test_facet_counts(documents, built):
+    counts = built.facet_counts()
+    for key in ("type", "publisher"):
+        values = [(item.get(key) or '').lower() for item in documents]
+        assert counts[key] == {value: values.count(value) for value in set(values)}
+    years = [re.search(r'\b((?:17|18|19|20)\d{2})\b', item.get('year_edition') or '') for item in documents]
+    years = [m.group(1) for m in years if m]
+    assert counts["year"] == {year: years.count(year) for year in set(years)}
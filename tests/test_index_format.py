@@ -0,0 +1,105 @@
+import os
+import sys
+import json
+
+import pytest
+
+# library.idx round trip: an index mapped from disk answers, summarizes and projects like the one built in memory
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "benchmarks"))
+
+import index_format
+import incremental_indexer
+from index_format import SUMMARY_FIELDS
+from library_generator import generate_library
+from search_index import SearchIndex
+
+LIBRARY_SIZE = 2000
+
+QUERIES = [
+    ([], {"type": "book"}),
+    (["energy"], {}),
+    (["quantum", "field"], {}),
+    (["ion"], {"publisher": "springer", "year": "1960..1990"}),
+    (["landau"], {"year": "3rd"}),
+    (["xyzzy"], {}),
+]
+
+@pytest.fixture(scope="module")
+def documents():
+    documents = generate_library(LIBRARY_SIZE, seed=0)
+    # Fields outside the columns, and items missing columns, as older library.json files have
+    documents[1] = {**documents[1], "notes": "signed copy", "pages": 412}
+    documents[2] = {k: v for k, v in documents[2].items() if k not in ("publisher", "search_tokens")}
+    return documents
+
+@pytest.fixture(scope="module")
+def built(documents):
+    return SearchIndex.build(documents)
+
+@pytest.fixture(scope="module")
+def index_path(built, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("index") / "library.idx")
+    built.save(path)
+    return path
+
+@pytest.fixture(scope="module")
+def loaded(index_path):
+    return SearchIndex.load(index_path)
+
+def test_loaded_index_holds_the_items(documents, loaded):
+    assert len(loaded) == len(documents)
+    assert list(loaded.documents) == documents
+    assert loaded.documents[-1] == documents[-1]
+    with pytest.raises(IndexError):
+        loaded.documents[len(documents)]
+
+@pytest.mark.parametrize("terms, filters", QUERIES)
+def test_loaded_index_searches_like_built(built, loaded, terms, filters):
+    assert loaded.search(terms, filters) == built.search(terms, filters)
+    assert loaded.search(terms, filters, limit=7, offset=3) == built.search(terms, filters, limit=7, offset=3)
+
+def test_loaded_index_facet_counts_like_built(built, loaded):
+    assert loaded.facet_counts() == built.facet_counts()
+
+@pytest.mark.parametrize("fields", [["title"], ["author", "year_edition"], ["search_tokens", "path"], ["notes"], ["missing"]])
+def test_loaded_index_projects_like_built(documents, built, loaded, fields):
+    for doc_id in range(0, len(documents), 97):
+        expected = {f: documents[doc_id][f] for f in fields if f in documents[doc_id]}
+        assert built.project(doc_id, fields) == expected
+        assert loaded.project(doc_id, fields) == expected
+    assert loaded.project(1, ["notes", "pages", "title"]) == {k: documents[1][k] for k in ("notes", "pages", "title")}
+    assert "search_tokens" not in loaded.project(2, ["search_tokens"])
+
+def test_loaded_index_summaries_like_built(documents, built, loaded):
+    for doc_id in list(range(0, len(documents), 97)) + [1, 2]:
+        summary = json.loads(loaded.summary(doc_id))
+        assert summary == json.loads(built.summary(doc_id))
+        assert summary == {f: documents[doc_id][f] for f in SUMMARY_FIELDS if f in documents[doc_id]}
+
+def test_stale_index_is_detected(documents, tmp_path, monkeypatch):
+    # publish_index() rebuilds library.idx when it is missing, older than library.json or in another format
+    monkeypatch.chdir(tmp_path)
+    assert incremental_indexer.index_is_stale()
+    with open(incremental_indexer.DB_FILE, 'w') as f:
+        json.dump(documents[:50], f)
+    SearchIndex.build(documents[:50]).save(incremental_indexer.INDEX_FILE)
+    os.utime(incremental_indexer.DB_FILE, ns=(1_000_000_000, 1_000_000_000))
+    assert not incremental_indexer.index_is_stale()
+
+    # library.json edited afterwards (e.g. by an auxiliary/ script)
+    os.utime(incremental_indexer.DB_FILE)
+    assert incremental_indexer.index_is_stale()
+    os.utime(incremental_indexer.DB_FILE, ns=(1_000_000_000, 1_000_000_000))
+
+    # Written by another version of the format, or not an index at all
+    version = index_format.FORMAT_VERSION
+    monkeypatch.setattr(index_format, "FORMAT_VERSION", version + 1)
+    assert incremental_indexer.index_is_stale()
+    monkeypatch.setattr(index_format, "FORMAT_VERSION", version)
+    assert not incremental_indexer.index_is_stale()
+    with open(incremental_indexer.INDEX_FILE, 'r+b') as f:
+        f.write(b"[")
+    assert incremental_indexer.index_is_stale()
@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+import types
+import multiprocessing
+
+import pytest
+
+# IndexingPool with a fake extractor: results, errors, timeouts, crashed workers and the OCR limit
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from indexing_pool import IndexingPool
+
+def fake_extract_metadata(filepath, route):
+    """Stands in for library_indexer.extract_metadata; the file name says what to do."""
+    start = time.monotonic()
+    name, _, arg = filepath.partition(":")
+    if name == "sleep":
+        time.sleep(float(arg.split(":")[0]))
+    elif name == "raise":
+        raise ValueError(arg)
+    elif name == "crash":
+        os._exit(3)
+    return {"path": filepath, "route": route, "pid": os.getpid(), "start": start, "end": time.monotonic()}
+
+pytestmark = pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                                reason="workers see the fake extractor only when forked")
+
+@pytest.fixture(autouse=True)
+def fake_indexer(tmp_path, monkeypatch):
+    # Workers are forked, so they import this module instead of the extraction stack
+    monkeypatch.chdir(tmp_path)
+    module = types.ModuleType("library_indexer")
+    module.extract_metadata = fake_extract_metadata
+    monkeypatch.setitem(sys.modules, "library_indexer", module)
+
+def run(pool, tasks, **kwargs):
+    return {task[0]: (status, value) for task, status, value, _metrics in pool.imap_unordered(tasks, **kwargs)}
+
+def test_results_and_errors():
+    with IndexingPool(2) as pool:
+        results = run(pool, [("a.pdf", "text"), ("raise:bad outline", "outline"), ("b.djvu", "ocr")])
+    assert results["a.pdf"][0] == "ok" and results["a.pdf"][1]["route"] == "text"
+    assert results["raise:bad outline"] == ("error", "ValueError: bad outline")
+    assert results["b.djvu"][0] == "ok"
+    assert os.listdir(os.path.join(".metadata_cache", "worker_logs")) != []
+
+def test_worker_past_the_timeout_is_replaced():
+    with IndexingPool(1, timeout=0.5) as pool:
+        start = time.monotonic()
+        results = run(pool, [("sleep:30", "ocr"), ("a.pdf", "text")])
+        assert time.monotonic() - start < 10
+        assert len(pool.workers) == 1
+    assert results["sleep:30"] == ("timeout", None)
+    assert results["a.pdf"][0] == "ok"
+
+def test_crashed_worker_is_restarted():
+    with IndexingPool(1) as pool:
+        first = pool.workers[0].process.pid
+        results = run(pool, [("crash", "text"), ("a.pdf", "text")])
+        assert len(pool.workers) == 1
+    status, message = results["crash"]
+    assert status == "error" and "exited unexpectedly" in message
+    assert results["a.pdf"][0] == "ok" and results["a.pdf"][1]["pid"] != first
+
+def test_ocr_jobs_are_limited_while_text_jobs_fill_the_pool():
+    tasks = [(f"sleep:0.3:ocr{i}", "ocr") for i in range(4)] + [(f"sleep:0.1:text{i}", "text") for i in range(6)]
+    with IndexingPool(3) as pool:
+        results = run(pool, tasks, kind=lambda task: task[1], limits={"ocr": 1})
+    assert all(status == "ok" for status, _ in results.values())
+    ocr = sorted((value["start"], value["end"]) for status, value in results.values() if value["route"] == "ocr")
+    # One OCR job at a time
+    assert all(end <= next_start for (_, end), (next_start, _) in zip(ocr, ocr[1:]))
+    # Text jobs did not wait for the OCR queue
+    text_ends = [value["end"] for _, value in results.values() if value["route"] == "text"]
+    assert max(text_ends) < ocr[-1][0]
@@ -0,0 +1,69 @@
+import os
+import sys
+import json
+import importlib
+
+import pytest
+
+# Wikipedia expansion in --full mode: precomputed table first, Wikipedia only for seeds missing from it
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+@pytest.fixture(scope="module")
+def modules(tmp_path_factory):
+    # Imported away from the repository root, so the glossary import does not write an automaton cache there
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("import"))
+    try:
+        return importlib.import_module("library_indexer"), importlib.import_module("build_expansions")
+    finally:
+        os.chdir(cwd)
+
+@pytest.fixture
+def library_indexer(modules, tmp_path, monkeypatch):
+    library_indexer = modules[0]
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("SKIP_WIKI", raising=False)
+    monkeypatch.setattr(library_indexer, "GLOSSARY_TERMS", {"quantum mechanics", "quantum", "entropy"})
+    fetched = []
+    def fetch_extracts(seeds):
+        fetched.append(list(seeds))
+        return {seed: "About entropy." for seed in seeds}
+    monkeypatch.setattr(library_indexer, "fetch_extracts", fetch_extracts)
+    library_indexer.fetched = fetched
+    return library_indexer
+
+def index(library_indexer, tmp_path, filename):
+    path = tmp_path / filename
+    path.write_bytes(b"epub")
+    return library_indexer.extract_metadata(str(path))
+
+def test_fallback_seed_is_looked_up_in_the_table_first(library_indexer, tmp_path, monkeypatch):
+    monkeypatch.setattr(library_indexer, "EXPANSIONS", {"quantum": ["planck constant"], "hydrodynamics": ["viscosity"]})
+    metadata = index(library_indexer, tmp_path, "Lectures on Hydrodynamics - Lamb (1932).epub")
+    assert "viscosity" in metadata["search_tokens"]
+    assert library_indexer.fetched == []
+
+    # A title the table was not built for still goes to Wikipedia
+    index(library_indexer, tmp_path, "Notes on Thermodynamics - Fermi (1936).epub")
+    assert library_indexer.fetched == [["thermodynamics"]]
+
+def test_glossary_seeds_are_not_fetched_with_a_table(library_indexer, tmp_path, monkeypatch):
+    monkeypatch.setattr(library_indexer, "EXPANSIONS", {"quantum": ["planck constant"]})
+    metadata = index(library_indexer, tmp_path, "Quantum Theory - Bohm (1951).epub")
+    assert "planck constant" in metadata["search_tokens"]
+    assert library_indexer.fetched == []
+
+def test_expansions_include_fallback_seeds_of_the_library(modules, tmp_path, monkeypatch):
+    build_expansions = modules[1]
+    monkeypatch.setattr(build_expansions, "GLOSSARY_TERMS", {"quantum", "entropy"})
+    db_file = tmp_path / "library.json"
+    db_file.write_text(json.dumps([
+        {"title": "Lectures on Hydrodynamics"},  # no glossary term: its longest word
+        {"title": "Quantum Theory"},             # has a glossary term: none
+        {"title": "Tao"},                        # no seed at all
+        {"author": "Unknown"},
+    ]))
+    assert build_expansions.library_fallback_seeds(str(db_file)) == {"hydrodynamics"}
+    assert build_expansions.library_fallback_seeds(str(tmp_path / "missing.json")) == set()
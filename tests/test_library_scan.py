@@ -0,0 +1,103 @@
+import os
+import re
+import sys
+import json
+import time
+import types
+import multiprocessing
+
+import pytest
+
+# Scan manifest: unchanged files are skipped from their row alone, and a read-only manifest (--dry-run)
+# leaves the library root untouched
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import incremental_indexer
+from library_scan import MANIFEST_FILE, ScanManifest
+
+def listing(root):
+    return sorted(os.path.relpath(os.path.join(d, f), root) for d, _, files in os.walk(root) for f in files)
+
+def test_readonly_manifest_creates_no_files(tmp_path):
+    path = str(tmp_path / "scan_manifest.sqlite")
+    assert ScanManifest(path, readonly=True).load() == {}
+    assert listing(tmp_path) == []
+
+    with ScanManifest(path) as manifest:
+        manifest.record("a.pdf", [10, 20, 30], "key-a", "indexed")
+    # The last connection checkpoints the WAL into the database and removes it
+    assert listing(tmp_path) == ["scan_manifest.sqlite"]
+
+    manifest = ScanManifest(path, readonly=True)
+    assert manifest.load() == {"a.pdf": ([10, 20, 30], "key-a", "indexed", None, None)}
+    manifest.close()
+    assert listing(tmp_path) == ["scan_manifest.sqlite"]
+
+def test_readonly_manifest_ignores_a_running_writer(tmp_path):
+    path = str(tmp_path / "scan_manifest.sqlite")
+    with ScanManifest(path) as writer:
+        writer.record("a.pdf", [10, 20, 30], "key-a", "indexed")
+        # Commits in the -wal file are not visible to an immutable reader: read nothing rather than a stale state
+        assert os.path.exists(f"{path}-wal")
+        manifest = ScanManifest(path, readonly=True)
+        assert manifest.load() == {}
+        manifest.close()
+
+def test_dry_run_writes_nothing(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("books")
+    (tmp_path / "books" / "a.epub").write_bytes(b"epub")
+    os.makedirs(os.path.dirname(MANIFEST_FILE))
+    with ScanManifest() as manifest:
+        manifest.record(os.path.join("books", "a.epub"), [1, 2, 3], "key-a", "indexed")
+    before = listing(tmp_path)
+
+    incremental_indexer.run_indexer(dry_run=True)
+    assert os.path.join("books", "a.epub") in capsys.readouterr().out
+    assert listing(tmp_path) == before
+
+def fake_extract_metadata(filepath, route):
+    """Stands in for library_indexer.extract_metadata in the forked pool workers."""
+    return {"title": os.path.basename(filepath), "author": "", "type": "Book"}
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    module = types.ModuleType("library_indexer")
+    module.extract_metadata = fake_extract_metadata
+    monkeypatch.setitem(sys.modules, "library_indexer", module)
+    os.makedirs("books")
+    for name in ("a", "b", "c"):
+        (tmp_path / "books" / f"{name}.epub").write_bytes(name.encode())
+    return tmp_path
+
+def run(capsys):
+    """Runs the indexer; returns the files it indexed and the number it skipped."""
+    incremental_indexer.run_indexer(cores=1)
+    out = capsys.readouterr().out
+    skipped = int(re.search(r"(\d+) skipped", out).group(1))
+    return sorted(re.findall(r"^Indexed (\S+)$", out, re.M)), skipped
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                    reason="workers see the fake extractor only when forked")
+def test_unchanged_files_are_skipped_until_their_cache_entry_is_gone(library, capsys, monkeypatch):
+    a, b, c = (os.path.join("books", f"{name}.epub") for name in ("a", "b", "c"))
+    assert run(capsys) == ([a, b, c], 0)
+
+    # Second run: every file is skipped from its manifest row, without reading its cache entry
+    cache_entry_is_current = incremental_indexer.cache_entry_is_current
+    def no_cache_reads(*args):
+        raise AssertionError("cache entry read for a file with a manifest row")
+    monkeypatch.setattr(incremental_indexer, "cache_entry_is_current", no_cache_reads)
+    assert run(capsys) == ([], 3)
+    monkeypatch.setattr(incremental_indexer, "cache_entry_is_current", cache_entry_is_current)
+
+    # A row is only trusted while its cache entry exists; a changed stat signature re-indexes too
+    os.remove(incremental_indexer.get_cache_path(b))
+    later = time.time_ns() + 10_000_000_000
+    os.utime(c, ns=(later, later))
+    assert run(capsys) == ([b, c], 1)
+    with open(incremental_indexer.DB_FILE, 'r') as f:
+        assert sorted(item["_path"] for item in json.load(f)) == [a, b, c]
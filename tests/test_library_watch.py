@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import threading
+from types import SimpleNamespace
+
+# Watch daemon: bursts of file events become debounced batches
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from library_watch import ChangeCollector, _EventHandler
+
+def add_over_time(collector, paths, interval):
+    def feed():
+        for path in paths:
+            collector.add(path)
+            time.sleep(interval)
+    thread = threading.Thread(target=feed, daemon=True)
+    thread.start()
+    return thread
+
+def test_burst_is_one_batch_after_it_goes_quiet():
+    collector = ChangeCollector()
+    paths = [f"books/{i}.pdf" for i in range(10)] + ["books/0.pdf"]
+    start = time.monotonic()
+    thread = add_over_time(collector, paths, 0.03)
+    batch = collector.wait_batch(debounce=0.2, max_delay=10)
+    elapsed = time.monotonic() - start
+    thread.join()
+    assert batch == set(paths)
+    # Only handed out once the events have been quiet for the debounce time
+    assert elapsed >= 10 * 0.03 + 0.2
+
+def test_continuous_burst_is_held_back_at_most_max_delay():
+    collector = ChangeCollector()
+    paths = [f"books/{i}.pdf" for i in range(40)]
+    start = time.monotonic()
+    thread = add_over_time(collector, paths, 0.05)
+    first = collector.wait_batch(debounce=0.2, max_delay=0.5)
+    assert 0.5 <= time.monotonic() - start < 1.5
+    second = collector.wait_batch(debounce=0.2, max_delay=10)
+    thread.join()
+    assert first and second and not first & second
+    assert first | second == set(paths)
+
+def test_hidden_paths_are_ignored():
+    collector = ChangeCollector()
+    for path in (".", ".metadata_cache/abc.json", "books/.part-a.pdf", "library.json.tmp", "./books/a.pdf"):
+        collector.add(path)
+    assert collector.wait_batch(debounce=0) == {"library.json.tmp", os.path.join("books", "a.pdf")}
+
+def test_event_handler_records_both_ends_of_moves():
+    collector = ChangeCollector()
+    handler = _EventHandler(collector)
+    events = [
+        SimpleNamespace(event_type="moved", is_directory=False, src_path="in/a.pdf", dest_path="books/a.pdf"),
+        SimpleNamespace(event_type="modified", is_directory=True, src_path="books"),
+        SimpleNamespace(event_type="opened", is_directory=False, src_path="books/b.pdf"),
+        SimpleNamespace(event_type="closed", is_directory=False, src_path="books/c.pdf"),
+        SimpleNamespace(event_type="deleted", is_directory=True, src_path="old"),
+    ]
+    for event in events:
+        handler.dispatch(event)
+    assert collector.wait_batch(debounce=0) == {
+        os.path.join("in", "a.pdf"), os.path.join("books", "a.pdf"), os.path.join("books", "c.pdf"), "old"
+    }
@@ -0,0 +1,77 @@
+import os
+import sys
+import json
+
+import pytest
+
+# Incremental merge of the cache into library.json: unchanged runs, changed and deleted entries, pruning
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from merge_metadata import merge_json_files
+
+@pytest.fixture
+def cache(tmp_path):
+    directory = tmp_path / "cache"
+    directory.mkdir()
+    return directory
+
+def write_entry(cache, name, path, title, mtime_ns=None):
+    entry = cache / f"{name}.json"
+    entry.write_text(json.dumps({"_path": path, "title": title}))
+    if mtime_ns is not None:
+        os.utime(entry, ns=(mtime_ns, mtime_ns))
+
+def merged(output):
+    with open(output, 'r') as f:
+        return {record["_path"]: record["title"] for record in json.load(f)}
+
+def test_unchanged_cache_is_not_merged_again(cache, tmp_path):
+    output = str(tmp_path / "library.json")
+    write_entry(cache, "a", "books/a.pdf", "A")
+    write_entry(cache, "b", "books/b.pdf", "B")
+    assert merge_json_files(str(cache), output)
+    assert merged(output) == {"books/a.pdf": "A", "books/b.pdf": "B"}
+    version = os.stat(output).st_mtime_ns
+
+    assert not merge_json_files(str(cache), output, existing_paths={"books/a.pdf", "books/b.pdf"})
+    assert os.stat(output).st_mtime_ns == version
+
+def test_changed_added_and_deleted_entries(cache, tmp_path):
+    output = str(tmp_path / "library.json")
+    write_entry(cache, "a", "books/a.pdf", "A", mtime_ns=1_000_000_000)
+    write_entry(cache, "b", "books/b.pdf", "B")
+    merge_json_files(str(cache), output)
+
+    write_entry(cache, "a", "books/a.pdf", "A, 2nd edition", mtime_ns=2_000_000_000)
+    write_entry(cache, "c", "books/c.pdf", "C")
+    os.remove(cache / "b.json")
+    assert merge_json_files(str(cache), output)
+    assert merged(output) == {"books/a.pdf": "A, 2nd edition", "books/c.pdf": "C"}
+
+def test_deleted_files_are_pruned_with_their_cache_entries(cache, tmp_path):
+    output = str(tmp_path / "library.json")
+    write_entry(cache, "a", "books/a.pdf", "A")
+    write_entry(cache, "b", "books/b.pdf", "B")
+    (cache / "legacy.json").write_text(json.dumps({"title": "No path recorded"}))
+    merge_json_files(str(cache), output, existing_paths={"books/a.pdf", "books/b.pdf"})
+
+    # Only the library changed: the manifest alone shows that books/b.pdf is gone
+    assert merge_json_files(str(cache), output, existing_paths={"books/a.pdf"})
+    with open(output, 'r') as f:
+        titles = sorted(record["title"] for record in json.load(f))
+    assert titles == ["A", "No path recorded"]
+    assert sorted(os.listdir(cache)) == [".merge_manifest", "a.json", "legacy.json"]
+    assert not merge_json_files(str(cache), output, existing_paths={"books/a.pdf"})
+
+def test_output_edited_elsewhere_is_merged_again(cache, tmp_path):
+    output = str(tmp_path / "library.json")
+    write_entry(cache, "a", "books/a.pdf", "A")
+    merge_json_files(str(cache), output)
+
+    # e.g. rewritten by an auxiliary/ script: the manifest no longer describes it
+    with open(output, 'w') as f:
+        json.dump([], f)
+    assert merge_json_files(str(cache), output)
+    assert merged(output) == {"books/a.pdf": "A"}
@@ -0,0 +1,86 @@
+import os
+import sys
+
+import pytest
+
+# Query cache: refined queries (evaluate(..., base=...)) against fresh ones, and the cache's memory bound
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "benchmarks"))
+
+from library_generator import generate_library
+from query_cache import QueryCache
+from search_index import SearchIndex
+
+LIBRARY_SIZE = 2000
+
+# (earlier query, refined query) pairs, each as (terms, filters); the earlier one covers the refined one
+REFINEMENTS = [
+    ((["ene"], {}), (["ener"], {})),                                       # term extended
+    ((["energy"], {}), (["energy", "field"], {})),                         # term added
+    ((["energy"], {}), (["energy"], {"type": "book"})),                    # filter added
+    ((["field"], {"publisher": "press"}), (["field", "ion"], {"publisher": "press"})),  # filter kept
+    (([], {"year": "1950..1999"}), (["energy"], {"year": "1950..1999"})),  # terms added to a filter-only query
+    ((["ion"], {"type": "book"}), (["ion", "quan"], {"type": "book", "year": "2nd"})),
+]
+
+@pytest.fixture(scope="module")
+def documents():
+    return generate_library(LIBRARY_SIZE, seed=0)
+
+@pytest.fixture(scope="module")
+def built(documents):
+    return SearchIndex.build(documents)
+
+@pytest.mark.parametrize("earlier, refined", REFINEMENTS)
+def test_refined_evaluate_matches_fresh(built, earlier, refined):
+    terms, filters = refined
+    base = built.evaluate(*earlier)
+    assert base.covers(tuple(sorted(terms)), filters)
+
+    fresh = built.evaluate(terms, filters)
+    derived = built.evaluate(terms, filters, base=base)
+    assert len(fresh) > 0
+    assert list(derived.ids) == list(fresh.ids)
+    assert {t: list(c) for t, c in derived.contributions.items()} == {t: list(c) for t, c in fresh.contributions.items()}
+    # Same ranking, for a first page, a deeper one and the whole result
+    assert derived.page(0, 10) == fresh.page(0, 10)
+    assert derived.page(10, 25) == fresh.page(10, 25)
+    assert derived.page() == fresh.page()
+
+def test_cache_serves_repeats_and_refines_from_the_covering_result(built):
+    cache = QueryCache()
+    first = cache.search(built, ["ener"], {})
+    assert cache.search(built, ["ener"], {}) is first
+    assert cache.find_base(built.version, ("energy",), {"type": "book"}) is first
+    refined = cache.search(built, ["energy"], {"type": "book"})
+    assert list(refined.ids) == list(built.evaluate(["energy"], {"type": "book"}).ids)
+
+    # A reloaded index (another version) never sees the previous results
+    assert cache.get("another version", ["ener"], {}) is None
+    assert not cache.entries
+
+def test_cache_bounded_by_the_bytes_results_hold(built):
+    whole = built.evaluate([], {"type": "book"})
+    scored = built.evaluate(["ion", "energy"], {})
+    # Filter-only results rank as their ids; scored ones hold 4 + 8 bytes per id and term
+    whole.page(0, 10)
+    assert whole.nbytes() == 4 * len(whole)
+    assert scored.nbytes() == (4 + 8 * 2) * len(scored)
+
+    cache = QueryCache(max_bytes=whole.nbytes() + scored.nbytes())
+    cache.put(built.version, whole)
+    cache.put(built.version, scored)
+    assert cache.nbytes == whole.nbytes() + scored.nbytes() and len(cache.entries) == 2
+
+    # Ranking deeper pages grows the result; the least recently used entry makes room
+    cache.page(scored, 0, len(scored))
+    assert scored.nbytes() == (4 + 8 * 2 + 4) * len(scored)
+    assert list(cache.entries) == [cache.key(scored.terms, scored.filters)]
+    assert cache.nbytes == scored.nbytes()
+
+    # A result larger than the whole budget is not kept
+    cache = QueryCache(max_bytes=scored.nbytes() - 1)
+    cache.put(built.version, scored)
+    assert not cache.entries and cache.nbytes == 0
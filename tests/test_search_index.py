@@ -0,0 +1,84 @@
+import os
+import sys
+
+import pytest
+
+# Inverted index matches against the linear scan it replaced, with and without precomputed dense terms
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "benchmarks"))
+
+import search_index
+from library_generator import generate_library
+from search_index import SearchIndex
+
+LIBRARY_SIZE = 2000
+
+TERMS = ["e", "a", "th", "ion", "qu", "energy", "field", "landau", "-", "xyzzy", "quantum field"]
+
+@pytest.fixture(scope="module")
+def documents():
+    return generate_library(LIBRARY_SIZE, seed=0)
+
+@pytest.fixture(scope="module")
+def built(documents):
+    return SearchIndex.build(documents)
+
+@pytest.fixture(scope="module")
+def sparse(documents):
+    # The same index with no dense terms: every term is a union of its words' postings
+    original = search_index.DENSE_POSTINGS_PER_DOC
+    search_index.DENSE_POSTINGS_PER_DOC = len(documents) * 1000
+    try:
+        return SearchIndex.build(documents)
+    finally:
+        search_index.DENSE_POSTINGS_PER_DOC = original
+
+def scan(documents, terms):
+    """Ids of the items whose text contains every term, as /api/search matched before the index."""
+    ids = []
+    for doc_id, item in enumerate(documents):
+        text = (
+            f"{item['title']} {item['author']} {item.get('publisher', '')} {item.get('year_edition', '')} "
+            f"{' '.join(item.get('keywords', []))} {' '.join(item.get('search_tokens', []))}"
+        ).lower()
+        if all(term in text for term in terms):
+            ids.append(doc_id)
+    return ids
+
+@pytest.mark.parametrize("term", TERMS)
+def test_matches_scan(documents, built, term):
+    terms = term.split()
+    assert list(built.evaluate(terms).ids) == scan(documents, terms)
+
+def test_short_terms_are_dense(built, sparse):
+    dense = list(built.dense.terms)
+    assert "e" in dense and "a" in dense
+    assert "landau" not in dense and built.dense.get("landau") is None
+    assert len(sparse.dense.terms) == 0
+
+def test_dense_terms_stored_as_the_shorter_list():
+    # "z" is in many words of one document: dense, and stored as its matches, not the others
+    index = SearchIndex.build([{"title": " ".join(f"z{c}" for c in "abcdefghij")}, {"title": "x"}, {"title": "y"}])
+    assert list(index.dense.terms) == ["z"] and list(index.dense.complements) == [0]
+    assert index.dense.get("z") == {0}
+    index = SearchIndex.build([{"title": "ea eb ec eg"}, {"title": "ed ee ef eh"}, {"title": "x"}])
+    assert list(index.dense.terms) == ["e"] and list(index.dense.complements) == [1]
+    assert index.dense.get("e") == {0, 1}
+
+@pytest.mark.parametrize("budget", [search_index.MAX_SCORED_POSTINGS, 500])
+@pytest.mark.parametrize("term", TERMS)
+def test_dense_terms_match_and_score_like_merged_postings(built, sparse, term, budget, monkeypatch):
+    # A small budget stops scoring after the closest words, where dense terms stop reading postings
+    monkeypatch.setattr(search_index, "MAX_SCORED_POSTINGS", budget)
+    assert built.term_weights(term) == sparse.term_weights(term)
+    assert built.search(term.split(), limit=20) == sparse.search(term.split(), limit=20)
+
+def test_dense_terms_round_trip(built, tmp_path):
+    path = str(tmp_path / "library.idx")
+    built.save(path)
+    loaded = SearchIndex.load(path)
+    assert list(loaded.dense.terms) == list(built.dense.terms)
+    for term in built.dense.terms:
+        assert loaded.dense.get(term) == built.dense.get(term)
@@ -0,0 +1,85 @@
+import os
+import sys
+
+import pytest
+
+# Prefix completions against a sort of every matching entry, scanned and precomputed, built and loaded
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "benchmarks"))
+
+import suggest_index
+from library_generator import generate_library
+from search_index import SearchIndex
+from suggest_index import SuggestIndex
+
+LIBRARY_SIZE = 2000
+
+PREFIXES = ["e", "en", "energy", "introduction to", "la", "mit", "spr", "  Spr", "zzz", ""]
+
+@pytest.fixture(scope="module")
+def documents():
+    documents = generate_library(LIBRARY_SIZE, seed=0)
+    # The same text as a title and a term is one entry; placeholders are no entry
+    documents[0] = {**documents[0], "title": "Energy", "publisher": "Unknown"}
+    return documents
+
+@pytest.fixture(scope="module")
+def suggestions(documents):
+    return SuggestIndex.build(documents)
+
+def expected_suggestions(documents, prefix, limit):
+    """Every entry counted from the items, filtered by prefix and sorted: heaviest first, then by text."""
+    entries = {}
+    for item in documents:
+        values = [(kind, item.get(kind)) for kind in ("title", "author", "publisher")]
+        values += [("term", token) for token in set(item.get("search_tokens", []))]
+        for kind, value in values:
+            if value and value.strip().lower() not in ("", "unknown"):
+                entries.setdefault(value.strip().lower(), []).append((kind, value.strip()))
+    ranked = []
+    for key, sources in entries.items():
+        if not key.startswith(prefix.lstrip().lower()):
+            continue
+        counts = {}
+        for source in sources:
+            counts[source] = counts.get(source, 0) + 1
+        # Shown as the most frequent source; ties go to the earlier kind
+        order = suggest_index.KINDS
+        kind, text = max(counts, key=lambda s: (counts[s], -order.index(s[0])))
+        ranked.append((-len(sources), key, (text, kind, len(sources))))
+    return [suggestion for _, _, suggestion in sorted(ranked)][:limit] if prefix.strip() else []
+
+@pytest.mark.parametrize("limit", [1, 8, 20])
+@pytest.mark.parametrize("prefix", PREFIXES)
+def test_suggests_the_most_frequent_entries(documents, suggestions, prefix, limit):
+    assert suggestions.suggest(prefix, limit) == expected_suggestions(documents, prefix, limit)
+
+def test_limit_is_capped(documents, suggestions):
+    assert suggestions.suggest("e", 100) == expected_suggestions(documents, "e", suggest_index.MAX_SUGGESTIONS)
+    assert suggestions.suggest("e", 0) == []
+
+def test_loaded_index_suggests_like_built(documents, tmp_path):
+    built = SearchIndex.build(documents)
+    path = str(tmp_path / "library.idx")
+    built.save(path)
+    loaded = SearchIndex.load(path)
+    for prefix in PREFIXES:
+        for limit in (1, 8, 20):
+            assert loaded.suggestions.suggest(prefix, limit) == built.suggestions.suggest(prefix, limit)
+
+def test_precomputed_suggestions_round_trip(documents, tmp_path, monkeypatch):
+    # A small scan limit, so the short prefixes of this library are served from precomputed lists
+    monkeypatch.setattr(suggest_index, "SCAN_LIMIT", 16)
+    built = SearchIndex.build(documents)
+    assert "e" in list(built.suggestions.top_prefixes)
+    path = str(tmp_path / "library.idx")
+    built.save(path)
+    loaded = SearchIndex.load(path)
+    assert list(loaded.suggestions.top_prefixes) == list(built.suggestions.top_prefixes)
+    for prefix in PREFIXES:
+        for limit in (1, 8, 20):
+            expected = expected_suggestions(documents, prefix, limit)
+            assert built.suggestions.suggest(prefix, limit) == expected
+            assert loaded.suggestions.suggest(prefix, limit) == expected
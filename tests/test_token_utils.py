@@ -0,0 +1,104 @@
+import os
+import re
+import sys
+import json
+import random
+import importlib
+
+import pytest
+
+# GlossaryMatcher against the n-gram matcher it replaced, and its JSON disk cache
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+NOISE_WORDS = ["the", "of", "and", "a", "in", "chapter", "1", "2-3", "x", "on", "to"]
+
+@pytest.fixture(scope="module")
+def token_utils(tmp_path_factory):
+    # Imported away from the repository root, so the import does not write an automaton cache there
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("import"))
+    try:
+        return importlib.import_module("token_utils")
+    finally:
+        os.chdir(cwd)
+
+@pytest.fixture(scope="module")
+def glossary():
+    with open(os.path.join(REPO_DIR, "glossary.json"), 'r') as f:
+        return set(json.load(f))
+
+def ngram_tokens(text, terms):
+    """The matcher before the automaton: monograms longer than two characters, bigrams and trigrams."""
+    tokens = set()
+    words = re.sub(r'[^a-z0-9\s\-]', ' ', text.lower()).split()
+    for i in range(len(words)):
+        if len(words[i]) > 2 and words[i] in terms:
+            tokens.add(words[i])
+        if i < len(words) - 1 and f"{words[i]} {words[i+1]}" in terms:
+            tokens.add(f"{words[i]} {words[i+1]}")
+        if i < len(words) - 2 and f"{words[i]} {words[i+1]} {words[i+2]}" in terms:
+            tokens.add(f"{words[i]} {words[i+1]} {words[i+2]}")
+    return tokens
+
+def automaton_tokens(matcher, text):
+    return matcher.find(re.sub(r'[^a-z0-9\s\-]', ' ', text.lower()).split())
+
+def random_text(rng, terms):
+    parts = []
+    for _ in range(200):
+        parts.append(rng.choice(terms) if rng.random() < 0.3 else rng.choice(NOISE_WORDS))
+    text = " ".join(parts)
+    # Punctuation and case, as found in extracted text
+    return "".join(c.upper() if rng.random() < 0.05 else c for c in text).replace(" the ", ", The ")
+
+def test_matches_ngram_matcher_on_short_terms(token_utils, glossary):
+    matcher = token_utils.GlossaryMatcher(sorted(glossary))
+    terms = sorted(glossary)
+    rng = random.Random(0)
+    for _ in range(200):
+        text = random_text(rng, terms)
+        found = automaton_tokens(matcher, text)
+        expected = ngram_tokens(text, glossary)
+        assert {t for t in found if len(t.split()) <= 3} == expected
+        # Whatever the n-gram matcher could not see is a longer glossary term occurring in the text
+        assert all(len(t.split()) > 3 and t in glossary for t in found - expected)
+
+def test_finds_terms_longer_than_three_words(token_utils):
+    terms = ["accelerating expansion of the universe", "expansion", "universe", "of the", "on"]
+    matcher = token_utils.GlossaryMatcher(terms)
+    text = "Evidence for the accelerating expansion of the universe from supernovae"
+    assert automaton_tokens(matcher, text) == {
+        "accelerating expansion of the universe", "expansion", "universe", "of the"
+    }
+    # Overlapping terms and a failed partial match restarting inside itself
+    matcher = token_utils.GlossaryMatcher(["a b c d", "b c", "c d e f", "b c d e"])
+    assert matcher.find("a b c d e f".split()) == {"a b c d", "b c", "c d e f", "b c d e"}
+    assert matcher.find("a b c x c d e f".split()) == {"b c", "c d e f"}
+
+def test_disk_cache_is_json_and_rebuilt_when_glossary_changes(token_utils, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    terms = ["quantum field theory", "field theory", "quantum"]
+    (tmp_path / "glossary.json").write_text(json.dumps(terms))
+    monkeypatch.setattr(token_utils, "GLOSSARY_TERMS", set(terms))
+
+    built = token_utils.load_glossary_matcher()
+    with open(token_utils.GLOSSARY_AUTOMATON_FILE, 'r') as f:
+        cached = json.load(f)
+    loaded = token_utils.load_glossary_matcher()
+    assert loaded.tables() == built.tables()
+    assert loaded.find("a quantum field theory text".split()) == set(terms)
+
+    # A changed glossary invalidates the cache
+    terms.append("gauge theory")
+    (tmp_path / "glossary.json").write_text(json.dumps(terms))
+    monkeypatch.setattr(token_utils, "GLOSSARY_TERMS", set(terms))
+    assert "gauge theory" in token_utils.load_glossary_matcher().find("gauge theory".split())
+    with open(token_utils.GLOSSARY_AUTOMATON_FILE, 'r') as f:
+        assert json.load(f)["digest"] != cached["digest"]
+
+    # A corrupt cache is rebuilt, not trusted
+    with open(token_utils.GLOSSARY_AUTOMATON_FILE, 'w') as f:
+        f.write('{"digest": 1')
+    assert token_utils.load_glossary_matcher().find("gauge theory".split()) == {"gauge theory"}
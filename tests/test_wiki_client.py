@@ -0,0 +1,142 @@
+import os
+import sys
+import json
+import time
+import threading
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+# WikiClient against a local stub of the MediaWiki API: cache, TTL, return contract, rate limit, backoff
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import wiki_client
+from wiki_client import RateLimiter, WikiClient
+
+class StubWikipedia(BaseHTTPRequestHandler):
+    """Answers generator=search queries by seed: "missing" has no page, "broken" fails,
+    "throttled" is refused with 429 for the first throttle_count requests; anything else
+    has one page whose extract names the seed."""
+
+    def do_GET(self):
+        seed = parse_qs(urlparse(self.path).query)["gsrsearch"][0]
+        server = self.server
+        with server.lock:
+            server.requests.append((seed, time.monotonic()))
+            throttled = seed == "throttled" and sum(1 for s, _ in server.requests if s == seed) <= server.throttle_count
+        if seed == "broken":
+            self.reply(500, {})
+        elif throttled:
+            self.reply(429, {}, headers=server.throttle_headers)
+        elif seed == "missing":
+            self.reply(200, {"batchcomplete": ""})
+        else:
+            self.reply(200, {"query": {"pages": {
+                "2": {"index": 2, "title": "Other", "extract": "not the top hit"},
+                "1": {"index": 1, "title": seed, "extract": f"About {seed}."},
+            }}})
+
+    def reply(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubWikipedia)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.throttle_count = 0
+    server.throttle_headers = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def client(stub_server, tmp_path, monkeypatch):
+    # Cache and rate-limit files are relative to the library root
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(wiki_client, "WIKI_MIN_INTERVAL", 0.0)
+    return WikiClient(api_url=f"http://127.0.0.1:{stub_server.server_address[1]}/w/api.php")
+
+def seeds_requested(server):
+    return [seed for seed, _ in server.requests]
+
+def test_return_contract(client, stub_server):
+    assert client.fetch_extracts(["quantum", "missing", "broken"]) == {
+        "quantum": "About quantum.",  # the top search hit, not the first page in the response
+        "missing": "",                # no page: a result, cached like any other
+        "broken": None,               # failed: not cached
+    }
+    assert client.fetch_extracts(["quantum", "missing", "broken"])["broken"] is None
+    assert sorted(seeds_requested(stub_server)) == ["broken", "broken", "missing", "quantum"]
+
+def test_cache_hit_and_ttl_expiry(client, stub_server):
+    assert client.fetch_extracts(["energy"]) == {"energy": "About energy."}
+    assert client.fetch_extracts(["energy"]) == {"energy": "About energy."}
+    assert seeds_requested(stub_server) == ["energy"]
+
+    # Another client in the same library root shares the on-disk cache
+    other = WikiClient(api_url=client.api_url)
+    assert other.fetch_extracts(["energy"]) == {"energy": "About energy."}
+    assert seeds_requested(stub_server) == ["energy"]
+
+    other.cache.ttl = 0.2
+    time.sleep(0.3)
+    assert other.fetch_extracts(["energy"]) == {"energy": "About energy."}
+    assert seeds_requested(stub_server) == ["energy", "energy"]
+
+def test_throttled_request_is_retried_after_backoff(client, stub_server, monkeypatch):
+    monkeypatch.setattr(wiki_client, "WIKI_BACKOFF", 0.1)
+    stub_server.throttle_count = 2
+    assert client.fetch_extracts(["throttled"]) == {"throttled": "About throttled."}
+    times = [t for _, t in stub_server.requests]
+    assert len(times) == 3
+    assert times[1] - times[0] >= 0.1 and times[2] - times[1] >= 0.2  # doubled
+
+def test_retry_after_is_honoured_and_attempts_are_bounded(client, stub_server, monkeypatch):
+    monkeypatch.setattr(wiki_client, "WIKI_BACKOFF", 5.0)
+    stub_server.throttle_headers = {"Retry-After": "0.2"}
+    stub_server.throttle_count = wiki_client.WIKI_ATTEMPTS
+    start = time.monotonic()
+    assert client.fetch_extracts(["throttled"]) == {"throttled": None}
+    assert len(stub_server.requests) == wiki_client.WIKI_ATTEMPTS
+    assert 0.2 * (wiki_client.WIKI_ATTEMPTS - 1) <= time.monotonic() - start < 5.0
+
+def _limited_calls(lock_path, min_interval, count, times):
+    limiter = RateLimiter(lock_path, min_interval)
+    for _ in range(count):
+        limiter.wait()
+        times.append(time.time())
+
+@pytest.mark.skipif(wiki_client.fcntl is None, reason="the cross-process limiter needs fcntl.flock")
+def test_rate_limiter_spaces_calls_across_processes(tmp_path):
+    lock_path = str(tmp_path / "wiki_rate.lock")
+    interval = 0.05
+    ctx = multiprocessing.get_context("fork")
+    with ctx.Manager() as manager:
+        times = manager.list()
+        processes = [ctx.Process(target=_limited_calls, args=(lock_path, interval, 5, times)) for _ in range(2)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(30)
+            assert process.exitcode == 0
+        times = sorted(times)
+    assert len(times) == 10
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    assert min(gaps) >= interval * 0.8  # stamped just after the lock is released
@@ -0,0 +1,74 @@
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdfdocument import PDFDocument, PDFNoOutlines
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdftypes import resolve1
+from pdfminer.psparser import LIT
+
+PROBE_PAGES = 8           # Pages sampled for a text layer
+OUTLINE_MIN_CHARS = 100   # Outline titles needed to index a PDF from its outline alone
+LITERAL_IMAGE = LIT("Image")
+
+# How a document's TOC/abstract text is obtained
+ROUTE_OUTLINE = "outline"  # the titles of the PDF's digital outline
+ROUTE_TEXT = "text"        # the text layer of the first pages (pdfplumber, djvutxt)
+ROUTE_OCR = "ocr"          # tesseract on the rasterized first pages
+
+def page_has_text_layer(page):
+    """Cheap probe of a pdfminer page's resources, without layout analysis.
+
+    A page without fonts cannot show text unless it draws a form XObject (which
+    has resources of its own), so image-only scanned pages have no text layer.
+    Any doubt counts as text.
+    """
+    try:
+        resources = resolve1(page.resources) or {}
+        if resolve1(resources.get("Font")):
+            return True
+        xobjects = resolve1(resources.get("XObject")) or {}
+        for xobject in xobjects.values():
+            xobject = resolve1(xobject)
+            if getattr(xobject, "attrs", {}).get("Subtype") != LITERAL_IMAGE:
+                return True
+        return False
+    except Exception:
+        return True
+
+def outline_text(doc):
+    """Returns the titles of a pdfminer document's outline, one per line ("" if it has none)."""
+    titles = []
+    try:
+        for _level, title, *_rest in doc.get_outlines():
+            if isinstance(title, bytes):
+                title = title.decode('utf-8', errors='replace')
+            if title:
+                titles.append(str(title))
+    except PDFNoOutlines:
+        pass
+    return "\n".join(titles)
+
+def classify_pdf(filepath, sample_pages=PROBE_PAGES):
+    """Returns (route, page count) for a PDF from its outline and the resources of its first pages."""
+    with open(filepath, 'rb') as f:
+        doc = PDFDocument(PDFParser(f))
+        try:
+            page_count = int(resolve1(resolve1(doc.catalog["Pages"])["Count"]))
+        except Exception:
+            page_count = 0
+        if len(outline_text(doc)) >= OUTLINE_MIN_CHARS:
+            return ROUTE_OUTLINE, page_count
+        for i, page in enumerate(PDFPage.create_pages(doc)):
+            if i >= sample_pages:
+                break
+            if page_has_text_layer(page):
+                return ROUTE_TEXT, page_count
+        return ROUTE_OCR, page_count
+
+def classify_document(filepath):
+    """Returns (route, page count) for a library file; page count is 0 when unknown."""
+    if ".pdf" not in filepath.lower():
+        return ROUTE_TEXT, 0
+    try:
+        return classify_pdf(filepath)
+    except Exception:
+        # Unreadable here; extraction decides (and reports) on its own
+        return ROUTE_TEXT, 0
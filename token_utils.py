@@ -1,9 +1,12 @@
 import os
 import re
 import json
+import hashlib
 import nltk
 from nltk.corpus import stopwords
 
+from indexing_metrics import timed
+
 # Ensure nltk resources are available (quietly)
 try:
     nltk.data.find('corpora/stopwords')
@@ -12,6 +15,8 @@ except LookupError:
 
 # Configuration
 GLOSSARY_FILE = "glossary.json"
+GLOSSARY_AUTOMATON_FILE = os.path.join(".metadata_cache", "glossary_automaton.json")
+EXPANSIONS_FILE = "expansions.json"  # built offline by build_expansions.py
 STOPWORDS = set(stopwords.words('english'))
 # Add custom project-specific stopwords
 STOPWORDS.update({"vol", "volume", "edition", "ed", "theory", "applications", "methods", "unknown", "bookfi", "org"})
@@ -25,30 +30,137 @@ def load_glossary():
 
 GLOSSARY_TERMS = load_glossary()
 
+class GlossaryMatcher:
+    """Word-level Aho-Corasick automaton over the glossary terms.
+
+    Every state is a sequence of words; goto[state] maps the next word to a
+    state, fail[state] is the state for the longest proper suffix that is also
+    a prefix of some term, and output[state] lists the terms ending there.
+    Matching is one pass over the words of a text, whatever the term lengths.
+    """
+
+    def __init__(self, terms):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        for term in terms:
+            words = term.split()
+            # Text is matched word by word, so only single-spaced terms can occur in it;
+            # single words must be longer than two characters, as before
+            if not words or " ".join(words) != term or (len(words) == 1 and len(term) <= 2):
+                continue
+            state = 0
+            for word in words:
+                next_state = self.goto[state].get(word)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][word] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                state = next_state
+            self.output[state] += (term,)
+
+        # Breadth-first pass for failure links, inheriting the outputs of the failure state
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for word, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and word not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(word, 0)
+                self.output[next_state] += self.output[self.fail[next_state]]
+
+    def tables(self):
+        """Returns the automaton as plain lists and dicts, for the JSON disk cache."""
+        return {"goto": self.goto, "fail": self.fail, "output": self.output}
+
+    @classmethod
+    def from_tables(cls, tables):
+        matcher = cls(())
+        matcher.goto = [dict(state) for state in tables["goto"]]
+        matcher.fail = list(tables["fail"])
+        matcher.output = [tuple(terms) for terms in tables["output"]]
+        if not (len(matcher.goto) == len(matcher.fail) == len(matcher.output)):
+            raise ValueError("inconsistent automaton tables")
+        return matcher
+
+    def find(self, words):
+        """Returns the set of glossary terms occurring in a sequence of words."""
+        found = set()
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for word in words:
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+def load_glossary_matcher():
+    """Loads the glossary automaton from its disk cache, rebuilding it when glossary.json changed.
+
+    The cache is JSON, kept in .metadata_cache, so loading it never runs code.
+    """
+    if not os.path.exists(GLOSSARY_FILE):
+        return GlossaryMatcher(())
+    with open(GLOSSARY_FILE, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    try:
+        with open(GLOSSARY_AUTOMATON_FILE, 'r') as f:
+            cached = json.load(f)
+        if cached["digest"] == digest:
+            return GlossaryMatcher.from_tables(cached)
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        pass
+
+    matcher = GlossaryMatcher(sorted(GLOSSARY_TERMS))
+    try:
+        os.makedirs(os.path.dirname(GLOSSARY_AUTOMATON_FILE), exist_ok=True)
+        tmp_file = f"{GLOSSARY_AUTOMATON_FILE}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump({"digest": digest, **matcher.tables()}, f, separators=(',', ':'))
+        os.replace(tmp_file, GLOSSARY_AUTOMATON_FILE)
+    except OSError:
+        pass
+    return matcher
+
+GLOSSARY_MATCHER = load_glossary_matcher()
+
 def get_tokens_from_text(text):
     """Extracts technical terms from text using the glossary."""
     if not text: return []
-    tokens = set()
     # Normalize text
-    clean_text = re.sub(r'[^a-z0-9\s\-]', ' ', text.lower())
-    words = clean_text.split()
-    
-    for i in range(len(words)):
-        # Monograms
-        w = words[i].strip()
-        if len(w) > 2 and w in GLOSSARY_TERMS:
-            tokens.add(w)
-        
-        # Bigrams
-        if i < len(words) - 1:
-            bigram = f"{words[i]} {words[i+1]}"
-            if bigram in GLOSSARY_TERMS:
-                tokens.add(bigram)
-        
-        # Polygrams (Trigrams)
-        if i < len(words) - 2:
-            trigram = f"{words[i]} {words[i+1]} {words[i+2]}"
-            if trigram in GLOSSARY_TERMS:
-                tokens.add(trigram)
-                
-    return list(tokens)
+    with timed("glossary"):
+        clean_text = re.sub(r'[^a-z0-9\s\-]', ' ', text.lower())
+        return list(GLOSSARY_MATCHER.find(clean_text.split()))
+
+def title_seeds(title):
+    """Returns the expansion seeds of a title: its glossary terms and its words longer than three letters."""
+    title_text = title.lower()
+    seeds = get_tokens_from_text(title_text)
+    for word in re.sub(r'[^a-z0-9\s]', ' ', title_text).split():
+        if len(word) > 3 and word not in STOPWORDS:
+            seeds.append(word)
+    return sorted(set(seeds))
+
+def fallback_seed(seeds):
+    """Returns the seed expanded for a title without glossary seeds: the longest one (None if there are none)."""
+    return max(seeds, key=len) if seeds else None
+
+def load_expansions():
+    """Loads the seed -> expansion tokens table built by build_expansions.py ({} if absent)."""
+    if not os.path.exists(EXPANSIONS_FILE):
+        return {}
+    try:
+        with open(EXPANSIONS_FILE, 'r') as f:
+            table = json.load(f)
+        # Stored as a shared token list plus token ids per term; resolved once per process
+        tokens = table["tokens"]
+        return {term: [tokens[i] for i in ids] for term, ids in table["terms"].items()}
+    except (OSError, ValueError, KeyError, IndexError):
+        return {}
+
+EXPANSIONS = load_expansions()
@@ -0,0 +1,177 @@
+import os
+import sys
+import time
+import sqlite3
+import threading
+import concurrent.futures
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Cross-process locking for the rate limiter (POSIX); without it the limit is per process
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Point at a local stub server to test expansion offline
+WIKI_API_URL = os.environ.get("WIKI_API_URL", "https://en.wikipedia.org/w/api.php")
+WIKI_USER_AGENT = "ScientificLibraryIndexer/1.0 (contact: admin@example.com)"
+WIKI_TIMEOUT = 10
+WIKI_CACHE_FILE = os.path.join(".metadata_cache", "wiki_cache.sqlite")
+WIKI_CACHE_TTL = 30 * 24 * 3600  # seconds; intro extracts change rarely
+WIKI_RATE_LOCK = os.path.join(".metadata_cache", "wiki_rate.lock")
+WIKI_MIN_INTERVAL = 0.2  # seconds between requests, across all indexing workers
+WIKI_CONCURRENCY = 4
+WIKI_ATTEMPTS = 3        # tries of a throttled (429/503) request
+WIKI_BACKOFF = 1.0       # seconds before the first retry, doubled for each further one
+WIKI_MAX_BACKOFF = 30.0  # cap on a server's Retry-After
+
+class RateLimiter:
+    """Spaces requests at least min_interval apart across every process sharing lock_path.
+
+    The time of the last request is kept in the lock file itself, and the file is
+    held under an exclusive flock while a caller waits for its slot.
+    """
+
+    def __init__(self, lock_path, min_interval):
+        self.lock_path = lock_path
+        self.min_interval = min_interval
+        self.local_lock = threading.Lock()
+        self.last = 0.0
+
+    def wait(self):
+        with self.local_lock:
+            if fcntl is None:
+                delay = self.last + self.min_interval - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                self.last = time.time()
+                return
+            os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+            with open(self.lock_path, 'a+b') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                f.seek(0)
+                try:
+                    last = float(f.read() or 0)
+                except ValueError:
+                    last = 0.0
+                delay = last + self.min_interval - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                f.seek(0)
+                f.truncate()
+                f.write(repr(time.time()).encode())
+                f.flush()
+
+class ExtractCache:
+    """Persistent seed -> intro extract cache (SQLite), shared by every process; entries expire after ttl."""
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self.local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS extracts (seed TEXT PRIMARY KEY, extract TEXT, fetched REAL)")
+            self.local.conn = conn
+        return conn
+
+    def get(self, seed):
+        row = self._conn().execute("SELECT extract, fetched FROM extracts WHERE seed = ?", (seed,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return row[0]
+
+    def put(self, seed, extract):
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO extracts (seed, extract, fetched) VALUES (?, ?, ?)",
+                     (seed, extract, time.time()))
+        conn.commit()
+
+class WikiClient:
+    """Wikipedia intro extracts over one keep-alive session, cached on disk and rate limited globally."""
+
+    def __init__(self, api_url=WIKI_API_URL, concurrency=WIKI_CONCURRENCY):
+        self.api_url = api_url
+        self.concurrency = concurrency
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = WIKI_USER_AGENT
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.cache = ExtractCache(WIKI_CACHE_FILE, WIKI_CACHE_TTL)
+        self.limiter = RateLimiter(WIKI_RATE_LOCK, WIKI_MIN_INTERVAL)
+
+    def _fetch(self, seed):
+        """Returns the intro of the top search hit for seed ("" if none), or None on error."""
+        # Search and extract in one request: the search result feeds prop=extracts as a generator
+        params = {
+            "action": "query",
+            "generator": "search",
+            "gsrsearch": seed,
+            "gsrlimit": 1,
+            "prop": "extracts",
+            "exintro": 1,
+            "explaintext": 1,
+            "format": "json",
+        }
+        try:
+            for attempt in range(WIKI_ATTEMPTS):
+                self.limiter.wait()
+                response = self.session.get(self.api_url, params=params, timeout=WIKI_TIMEOUT)
+                if response.status_code not in (429, 503) or attempt == WIKI_ATTEMPTS - 1:
+                    break
+                # Throttled: wait as asked (Retry-After in seconds), or back off exponentially
+                try:
+                    delay = min(float(response.headers["Retry-After"]), WIKI_MAX_BACKOFF)
+                except (KeyError, ValueError):
+                    delay = WIKI_BACKOFF * 2 ** attempt
+                sys.stderr.write(f"Wikipedia throttled '{seed}' ({response.status_code}), retrying in {delay:.1f} s\n")
+                time.sleep(delay)
+            response.raise_for_status()
+            pages = response.json().get("query", {}).get("pages", {})
+        except Exception as e:
+            sys.stderr.write(f"Wikipedia fetch error for '{seed}': {e}\n")
+            return None
+        if not pages:
+            return ""
+        top = min(pages.values(), key=lambda page: page.get("index", 0))
+        return top.get("extract", "")
+
+    def _cached_fetch(self, seed):
+        extract = self.cache.get(seed)
+        if extract is None:
+            extract = self._fetch(seed)
+            if extract is None:
+                return None  # not cached, so the next call retries
+            self.cache.put(seed, extract)
+        return extract
+
+    def fetch_extracts(self, seeds):
+        """Returns {seed: extract text} for seeds, fetching uncached ones concurrently.
+
+        The extract is "" when Wikipedia has no match, and None when the fetch failed.
+        """
+        seeds = list(dict.fromkeys(seeds))
+        if len(seeds) <= 1:
+            return {seed: self._cached_fetch(seed) for seed in seeds}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.concurrency, len(seeds))) as executor:
+            return dict(zip(seeds, executor.map(self._cached_fetch, seeds)))
+
+_client = None
+
+def get_client():
+    """Returns this process's shared WikiClient (created on first use)."""
+    global _client
+    if _client is None:
+        _client = WikiClient()
+    return _client
+
+def fetch_extracts(seeds):
+    return get_client().fetch_extracts(seeds)